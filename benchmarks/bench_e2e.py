@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""Measure how long a track change takes to reach each sink, end to end.
+
+A real Gelo is started with HttpPoller watching a stand-in Icecast server,
+and HttpPusher, IRC, and NowPlayingFile sending to stand-ins of their own,
+all on this machine. The stand-in Icecast serves ``testdata/status-json.xsl``
+with the track changed to each of a series of scripted tracks in turn, and
+the time from each change to its arrival at each sink is recorded.
+
+Run from the repository root with ``python benchmarks/bench_e2e.py``. Add
+``-o results.json`` to keep the results, and ``-c results.json`` on a later
+run to compare against them.
+"""
+
+import os
+import re
+import sys
+import json
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import socketserver
+from time import perf_counter, sleep, time
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gelo import conf
+from gelo.main import Gelo
+from gelo.metrics import LatencyHistogram
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "testdata", "status-json.xsl")
+SHOW = "bench-1"
+SINKS = ["HttpPusher", "IRC", "NowPlayingFile"]
+# Every scripted track has a title like this, so it can be picked out of
+# whatever a sink makes of it.
+TITLE = re.compile(r"bench-\d{5}")
+
+
+class Arrivals(object):
+    """When each sink got each track."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = {sink: {} for sink in SINKS}
+
+    def record(self, sink: str, text: str):
+        """Note that a sink got a track, now.
+
+        :param sink: The sink.
+        :param text: What the sink got, with the track's title somewhere in it.
+        """
+        now = perf_counter()
+        g = TITLE.search(text)
+        if g is None:
+            return
+        with self.lock:
+            self.times[sink].setdefault(g.group(0), now)
+
+    def count(self, title: str) -> int:
+        """Get the number of sinks that have got a track."""
+        with self.lock:
+            return sum(title in times for times in self.times.values())
+
+
+class StandInIcecast(BaseHTTPRequestHandler):
+    """Serve the server's ``status``, whatever it is at the moment."""
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/status-json.xsl":
+            self.send_error(404)
+            return
+        body = self.server.status
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInWebhook(BaseHTTPRequestHandler):
+    """Take HttpPusher's requests, and note what arrived when."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.server.arrivals.record("HttpPusher", form.get("title", [""])[0])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInIrc(socketserver.StreamRequestHandler):
+    """Speak just enough IRC to welcome a client, and note its messages."""
+
+    def handle(self):
+        for line in self.rfile:
+            command, _, rest = (
+                line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            )
+            command = command.upper()
+            if command == "CAP":
+                self.send(":bench CAP * LS :")
+            elif command == "USER":
+                self.send(":bench 001 gelo :Welcome to the benchmark")
+            elif command == "PING":
+                self.send(":bench PONG bench %s" % rest)
+            elif command == "PRIVMSG":
+                self.server.arrivals.record("IRC", rest)
+            elif command == "QUIT":
+                return
+
+    def send(self, line: str):
+        self.wfile.write(line.encode("utf-8") + b"\r\n")
+
+
+class IrcServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def watch_file(path: str, arrivals: Arrivals, stopped: threading.Event):
+    """Note what's written to NowPlayingFile's file, checking every
+    millisecond, which is as precise as its latencies can be."""
+    signature = None
+    while not stopped.wait(0.001):
+        try:
+            st = os.stat(path)
+            if (st.st_mtime_ns, st.st_size) == signature:
+                continue
+            signature = (st.st_mtime_ns, st.st_size)
+            with open(path, "rb") as f:
+                arrivals.record("NowPlayingFile", f.read().decode("latin-1"))
+        except OSError:
+            continue
+
+
+def serve(server):
+    """Run a stand-in server on a thread of its own."""
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_config(args, workdir: str, ports: dict) -> conf.Configuration:
+    """Configure Gelo to use the stand-ins."""
+    prefix_file = os.path.join(workdir, "prefix.txt")
+    open(prefix_file, "w").close()
+    config_file = {
+        "core": {
+            "log_file": os.path.join(workdir, "gelo.log"),
+            "macro_file": os.path.join(workdir, "macros.ini"),
+            "broadcast_delay": 0.0,
+            "engine": args.engine,
+        },
+        "plugin:HttpPoller": {
+            "poll_url": "http://127.0.0.1:%d/status-json.xsl" % ports["icecast"],
+            "prefix_file": prefix_file,
+            "min_interval": args.poll_interval,
+            "max_interval": max(args.poll_interval, 5.0),
+        },
+        "plugin:HttpPusher": {
+            "delayed": False,
+            "webhooks": {
+                "bench": {
+                    "url": "http://127.0.0.1:%d/track" % ports["webhook"],
+                    "method": "POST",
+                    "artist_param": "artist",
+                    "title_param": "title",
+                }
+            },
+        },
+        "plugin:IRC": {
+            "nick": "gelo",
+            "server": "127.0.0.1",
+            "port": ports["irc"],
+            "tls": False,
+            "ipv6": False,
+            # A nick, rather than a channel, so there's nothing to join.
+            "send_to": "listener",
+            "message": "{marker}{special}",
+            "delayed": False,
+        },
+        "plugin:NowPlayingFile": {
+            "path": os.path.join(workdir, "nowplaying.txt"),
+            "delayed": False,
+        },
+    }
+    return conf.Configuration(
+        config_file, argparse.Namespace(show=SHOW, user_plugin_dir="", verbose=0)
+    )
+
+
+def status_with(fixture: dict, title: str) -> bytes:
+    """Make an Icecast status with a different track playing."""
+    fixture["icestats"]["source"]["title"] = title
+    return json.dumps(fixture).encode("utf-8")
+
+
+def wait_for(condition, timeout: float) -> bool:
+    """Wait until ``condition()`` is true, or the timeout is up."""
+    deadline = perf_counter() + timeout
+    while not condition():
+        if perf_counter() >= deadline:
+            return False
+        sleep(0.005)
+    return True
+
+
+def summarize(changed: dict, times: dict) -> dict:
+    """Work out the latencies and throughput for one sink.
+
+    :param changed: When each track went out, by title.
+    :param times: When the sink got each track, by title.
+    """
+    histogram = LatencyHistogram()
+    for title, arrived in times.items():
+        histogram.record((arrived - changed[title]) * 1e9)
+    summary = {"delivered": histogram.count, "lost": len(changed) - histogram.count}
+    for name, p in [("p50_ms", 50), ("p99_ms", 99), ("max_ms", 100)]:
+        value = histogram.percentile(p)
+        summary[name] = round(value / 1e6, 3) if value is not None else None
+    if times:
+        span = max(times.values()) - min(changed.values())
+        summary["tracks_per_sec"] = round(histogram.count / span, 2)
+    else:
+        summary["tracks_per_sec"] = 0.0
+    return summary
+
+
+def run(args) -> dict:
+    """Start everything, play the scripted tracks, and stop everything."""
+    with open(FIXTURE) as f:
+        fixture = json.load(f)
+    arrivals = Arrivals()
+    icecast = ThreadingHTTPServer(("127.0.0.1", 0), StandInIcecast)
+    icecast.status = status_with(fixture, "bench-00000")
+    webhook = ThreadingHTTPServer(("127.0.0.1", 0), StandInWebhook)
+    webhook.arrivals = arrivals
+    irc = IrcServer(("127.0.0.1", 0), StandInIrc)
+    irc.arrivals = arrivals
+    servers = [serve(icecast), serve(webhook), serve(irc)]
+    ports = {
+        "icecast": icecast.server_address[1],
+        "webhook": webhook.server_address[1],
+        "irc": irc.server_address[1],
+    }
+    stopped = threading.Event()
+    changed = {}
+    with tempfile.TemporaryDirectory(prefix="gelo-bench-") as workdir:
+        configuration = make_config(args, workdir, ports)
+        watcher = threading.Thread(
+            target=watch_file,
+            args=(
+                configuration.plugin_config("NowPlayingFile", SHOW)["path"],
+                arrivals,
+                stopped,
+            ),
+            daemon=True,
+        )
+        watcher.start()
+        gelo = Gelo()
+        gelo.start(configuration)
+        try:
+            # The first track shows up once everything is connected.
+            if not wait_for(lambda: arrivals.count("bench-00000") == len(SINKS), 10):
+                sys.exit("The sinks didn't all get the first track; see gelo.log")
+            for i in range(1, args.tracks + 1):
+                title = "bench-%05d" % i
+                status = status_with(fixture, title)
+                changed[title] = perf_counter()
+                icecast.status = status
+                if args.gap > 0:
+                    sleep(max(0.0, changed[title] + args.gap - perf_counter()))
+                else:
+                    wait_for(lambda: arrivals.count(title) == len(SINKS), 5)
+            wait_for(lambda: arrivals.count(title) == len(SINKS), 5)
+        finally:
+            gelo.shutdown()
+            gelo.finish()
+            stopped.set()
+            watcher.join()
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+    with arrivals.lock:
+        sinks = {
+            sink: summarize(changed, {t: a for t, a in times.items() if t in changed})
+            for sink, times in arrivals.times.items()
+        }
+    return {
+        "timestamp": time(),
+        "python": platform.python_version(),
+        "host": socket.gethostname(),
+        "settings": {
+            "engine": args.engine,
+            "tracks": args.tracks,
+            "gap": args.gap,
+            "poll_interval": args.poll_interval,
+        },
+        "sinks": sinks,
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """Print how the latencies changed since the baseline run."""
+    print("\nCompared to %s:" % baseline.get("settings"))
+    print("%16s %14s %14s" % ("sink", "p50 change", "p99 change"))
+    for sink, summary in results["sinks"].items():
+        before = baseline["sinks"].get(sink)
+        if before is None:
+            continue
+        changes = []
+        for key in ["p50_ms", "p99_ms"]:
+            if summary[key] is None or not before.get(key):
+                changes.append("n/a")
+            else:
+                changes.append("%+.1f%%" % ((summary[key] / before[key] - 1) * 100))
+        print("%16s %14s %14s" % (sink, *changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--tracks", type=int, default=50)
+    parser.add_argument(
+        "-g",
+        "--gap",
+        type=float,
+        default=0.5,
+        help="seconds between track changes, or 0 to change the track as soon "
+        "as every sink has the last one",
+    )
+    parser.add_argument("-p", "--poll-interval", type=float, default=0.1)
+    parser.add_argument(
+        "-e", "--engine", choices=["threads", "asyncio"], default="threads"
+    )
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="compare with this earlier JSON file")
+    args = parser.parse_args()
+    results = run(args)
+    print(
+        "%16s %10s %6s %10s %10s %10s %12s"
+        % ("sink", "delivered", "lost", "p50 ms", "p99 ms", "max ms", "tracks/s")
+    )
+    for sink, s in results["sinks"].items():
+        print(
+            "%16s %10d %6d %10s %10s %10s %12.2f"
+            % (
+                sink,
+                s["delivered"],
+                s["lost"],
+                s["p50_ms"],
+                s["p99_ms"],
+                s["max_ms"],
+                s["tracks_per_sec"],
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Measure how much Mediator fan-out costs per marker as subscribers grow.
+
+Run from the repository root with ``python benchmarks/bench_fanout.py``. Add
+``--many`` to publish each batch with one ``publish_many``, rather than one
+``publish`` per marker.
+"""
+
+import argparse
+from time import perf_counter
+from gelo import arch, mediator
+
+
+def drain(queues):
+    """Empty every channel, so nothing is dropped during a run."""
+    for q in queues:
+        for _ in q.listen_batch(block=False):
+            pass
+
+
+def bench(subscribers: int, markers: int, batch: int, many: bool = False) -> float:
+    """Time publishing ``markers`` markers to ``subscribers`` instant cursors.
+
+    :param many: Whether to publish each batch with publish_many.
+
+    :return: The mean cost of one publish, in microseconds.
+    """
+    # A long broadcast delay keeps the delayed path out of the measurement.
+    m = mediator.Mediator(3600.0)
+    queues = [
+        m.subscribe([arch.MarkerType.TRACK], "sub%d" % i) for i in range(subscribers)
+    ]
+    run = [(arch.MarkerType.TRACK, arch.Marker("Artist — Title"))] * batch
+    elapsed = 0.0
+    sent = 0
+    while sent < markers:
+        start = perf_counter()
+        if many:
+            m.publish_many(run)
+        else:
+            for marker_type, marker in run:
+                m.publish(marker_type, marker)
+        elapsed += perf_counter() - start
+        sent += batch
+        drain(queues)
+    m.terminate()
+    return elapsed / sent * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--markers", type=int, default=5000)
+    parser.add_argument("-b", "--batch", type=int, default=50)
+    parser.add_argument(
+        "-m", "--many", action="store_true", help="publish each batch at once"
+    )
+    parser.add_argument(
+        "-s", "--subscribers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64]
+    )
+    args = parser.parse_args()
+    print("%12s %14s %16s" % ("subscribers", "us/marker", "us/subscriber"))
+    for n in args.subscribers:
+        per_marker = bench(n, args.markers, args.batch, args.many)
+        print("%12d %14.2f %16.3f" % (n, per_marker, per_marker / n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""An optional asyncio runtime for Gelo.
+
+With ``engine = "asyncio"`` in the ``[core]`` section of the configuration,
+Gelo runs one event loop in a background thread, and the mediator and every
+plugin run on it as tasks instead of as threads of their own. The control
+shell still runs on the main thread, and its commands are handed to the loop.
+"""
+
+import queue
+import asyncio
+import logging
+import itertools
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Event, Lock, Thread, get_ident
+from time import monotonic, perf_counter_ns
+from typing import Callable
+from gelo import arch, mediator, shared
+from gelo.arch import BackpressurePolicy
+from gelo.journal import Journal
+from gelo.metrics import ChannelStats
+from gelo.scheduler import ScheduledTask
+
+
+class AsyncListenableQueue(object):
+    """A bounded asyncio.Queue of markers that can be listened to.
+
+    The methods the Mediator uses to deliver markers behave like those of
+    ListenableQueue, so Subscription can apply backpressure policies to it.
+    They must only be called from the event loop. Because blocking the event
+    loop is never acceptable, ``put`` never waits for room, and the BLOCK
+    policy behaves like DROP_NEWEST.
+    """
+
+    def __init__(self, maxsize: int = 0, stats: ChannelStats | None = None):
+        """Create a new AsyncListenableQueue.
+
+        :param maxsize: The most markers the queue holds, or 0 for no limit.
+        :param stats: Where to record dequeue timings, if anywhere.
+        """
+        self._q = asyncio.Queue(maxsize)
+        self.stats = stats
+
+    def put(self, item, block=True, timeout=None) -> None:
+        """Add an item to the queue without waiting.
+
+        :raises queue.Full: If the queue has no room.
+        """
+        try:
+            self._q.put_nowait((perf_counter_ns(), item))
+        except asyncio.QueueFull:
+            raise queue.Full()
+
+    def discard(self, limit: int) -> int:
+        """Throw away the oldest markers without recording them as dequeued.
+
+        :param limit: The most markers to throw away.
+        :return: How many were thrown away.
+        """
+        discarded = 0
+        while discarded < limit:
+            try:
+                self._q.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            discarded += 1
+        return discarded
+
+    def qsize(self) -> int:
+        return self._q.qsize()
+
+    def empty(self) -> bool:
+        return self._q.empty()
+
+    async def listen(self):
+        """Retrieve markers from the queue as they arrive."""
+        while True:
+            enqueued_ns, data = await self._q.get()
+            if data is None:
+                raise mediator.UnsubscribeException()
+            if self.stats is not None:
+                self.stats.record_dequeue(perf_counter_ns(), enqueued_ns, data)
+            yield data
+
+
+class AsyncLatestValueChannel(mediator.LatestValueChannel):
+    """A LatestValueChannel for the event loop.
+
+    Like AsyncListenableQueue, its methods must only be called from the event
+    loop.
+    """
+
+    def __init__(self, stats: ChannelStats | None = None):
+        """Create a new, empty AsyncLatestValueChannel.
+
+        :param stats: Where to record dequeue timings, if anywhere.
+        """
+        super().__init__(stats)
+        self._ready = asyncio.Event()
+
+    def put(self, marker: arch.Marker) -> bool:
+        """Replace the value in the mailbox.
+
+        :param marker: The new value.
+        :return: True if an unread value was overwritten.
+        """
+        overwritten = self._value is not None
+        self._value = marker
+        self._enqueued_ns = perf_counter_ns()
+        self._ready.set()
+        return overwritten
+
+    def close(self) -> None:
+        """Tell listeners to unsubscribe, once they've read the last value."""
+        self._closed = True
+        self._ready.set()
+
+    async def listen(self):
+        """Retrieve the newest value from the mailbox whenever it changes."""
+        while True:
+            if self._value is None:
+                if self._closed:
+                    raise mediator.UnsubscribeException()
+                await self._ready.wait()
+                self._ready.clear()
+                continue
+            data = self._value
+            self._value = None
+            if self.stats is not None:
+                self.stats.record_dequeue(perf_counter_ns(), self._enqueued_ns, data)
+            yield data
+
+
+class LoopScheduler(object):
+    """A Scheduler that runs work on an event loop instead of its own thread.
+
+    It has the same interface (and statistics) as gelo.scheduler.Scheduler,
+    and can be called from any thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """Create a new LoopScheduler.
+
+        :param loop: The event loop to run work on.
+        """
+        self.loop = loop
+        self.log = logging.getLogger("gelo.scheduler")
+        self._counter = itertools.count()
+        # Tasks are added from any thread, and run on the loop, so the set is
+        # only touched with this held.
+        self._lock = Lock()
+        self._tasks = set()
+        self._stopped = False
+        # Once flushed, tasks run as soon as they're scheduled.
+        self._hurry = False
+        self.run_count = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.loop_thread_id = None
+        loop.call_soon_threadsafe(self._record_loop_thread)
+
+    def _record_loop_thread(self):
+        self.loop_thread_id = get_ident()
+
+    def schedule(self, delay: float, fn: Callable, *args, **kwargs) -> ScheduledTask:
+        """Run ``fn(*args, **kwargs)`` on the loop after ``delay`` seconds.
+
+        :param delay: The number of seconds to wait before running ``fn``.
+        :param fn: The callable to run.
+        :return: A handle that can be passed to ``cancel``.
+        """
+        if delay < 0:
+            raise ValueError("delay must not be negative")
+        task = ScheduledTask(monotonic() + delay, next(self._counter), fn, args, kwargs)
+        if self._stopped:
+            task.cancelled = True
+            return task
+        with self._lock:
+            self._tasks.add(task)
+        if self._hurry:
+            delay = 0
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, self._run, task)
+        return task
+
+    def cancel(self, task: ScheduledTask) -> bool:
+        """Cancel a task that has not run yet.
+
+        :param task: The handle returned by ``schedule``.
+        :return: True if the task was cancelled, False if it already ran or
+        was already cancelled.
+        """
+        if task.cancelled or task.lateness is not None:
+            return False
+        task.cancelled = True
+        with self._lock:
+            self._tasks.discard(task)
+        return True
+
+    def pending(self) -> int:
+        """Get the number of tasks that have not run or been cancelled."""
+        with self._lock:
+            return len(self._tasks)
+
+    def flush(self, timeout: float | None = None) -> int:
+        """Run every pending task now, in the order they were due, and wait
+        for them to finish.
+
+        From then on, tasks run as soon as they're scheduled, since this is
+        meant for shutting down.
+
+        :param timeout: The most time to wait, in seconds, or None to wait
+        until every task has run.
+        :return: The number of tasks that still hadn't run by the timeout.
+        """
+        self._hurry = True
+        done = Event()
+
+        def run_all():
+            with self._lock:
+                tasks = sorted(self._tasks)
+            for task in tasks:
+                self._run(task)
+            done.set()
+
+        self.loop.call_soon_threadsafe(run_all)
+        # The loop can't run them while it's waiting here for them to run.
+        if get_ident() != self.loop_thread_id:
+            done.wait(timeout)
+        return self.pending()
+
+    @property
+    def flushed(self) -> bool:
+        """Whether ``flush`` was called, so tasks now run as soon as they're
+        scheduled."""
+        return self._hurry
+
+    def stop(self):
+        """Discard any tasks that have not run."""
+        self._stopped = True
+        with self._lock:
+            tasks = list(self._tasks)
+        for task in tasks:
+            self.cancel(task)
+
+    def _run(self, task: ScheduledTask):
+        """Run a task that has come due."""
+        if task.cancelled or task.lateness is not None:
+            return
+        with self._lock:
+            self._tasks.discard(task)
+        task.lateness = monotonic() - task.when
+        self.run_count += 1
+        self.total_lateness += task.lateness
+        self.max_lateness = max(self.max_lateness, task.lateness)
+        try:
+            task.fn(*task.args, **task.kwargs)
+        except Exception:
+            self.log.exception("Scheduled task %s raised an exception" % task)
+
+
+class AsyncMediator(mediator.Mediator):
+    """A Mediator whose subscribers are coroutines on an event loop.
+
+    Markers may be published from any thread; delivery always happens on the
+    event loop, into asyncio-based channels. Delayed delivery uses the loop's
+    own timers rather than a scheduler thread.
+    """
+
+    # RingCursors block while waiting for markers, which would stall the loop.
+    RING_CURSORS = False
+
+    def __init__(
+        self,
+        broadcast_delay: float,
+        loop: asyncio.AbstractEventLoop,
+        journal: Journal | None = None,
+    ):
+        """Create a new AsyncMediator.
+
+        :param broadcast_delay: How long to wait before sending markers to
+        delayed subscribers.
+        :param loop: The event loop that subscribers run on.
+        :param journal: The Journal to record published markers in, if any.
+        """
+        super().__init__(broadcast_delay, LoopScheduler(loop), journal=journal)
+        self.owns_scheduler = True
+        self.loop = loop
+        self.loop_thread_id = None
+        loop.call_soon_threadsafe(self._record_loop_thread)
+
+    def _record_loop_thread(self):
+        self.loop_thread_id = get_ident()
+
+    def _make_channel(
+        self, policy: BackpressurePolicy, stats: ChannelStats
+    ) -> AsyncListenableQueue | AsyncLatestValueChannel:
+        """Create an asyncio-based channel for a new subscriber.
+
+        :param policy: The subscriber's backpressure policy.
+        :param stats: The subscriber's ChannelStats.
+        """
+        if policy is BackpressurePolicy.COALESCE:
+            return AsyncLatestValueChannel(stats)
+        return AsyncListenableQueue(self.QUEUE_MAX, stats)
+
+    def _on_loop(self, fn: Callable, *args) -> None:
+        """Call ``fn`` on the event loop, right away if this is the loop."""
+        if get_ident() == self.loop_thread_id:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _fan_out(
+        self, table, marker_type: arch.MarkerType, marker: arch.Marker, seq=None
+    ):
+        self._on_loop(super()._fan_out, table, marker_type, marker, seq)
+
+    def _fan_out_many(self, table, markers, first_seq=None):
+        self._on_loop(super()._fan_out_many, table, markers, first_seq)
+
+    def unsubscribe(self, subscriber: str) -> None:
+        self._on_loop(super().unsubscribe, subscriber)
+
+    def terminate(self):
+        self._on_loop(super().terminate)
+
+    def close_subscriber(self, subscriber: str):
+        self._on_loop(super().close_subscriber, subscriber)
+
+
+class EventLoopThread(object):
+    """Run an asyncio event loop in a background thread."""
+
+    def __init__(self):
+        """Create a new event loop, without starting it."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._run, name="gelo-aio", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        """Start running the event loop."""
+        self.thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Close the HTTP session the plugins shared, then stop the event
+        loop and wait for its thread to exit.
+
+        :param timeout: The most time to wait for the thread, in seconds.
+        """
+        if self.thread.is_alive():
+            closing = asyncio.run_coroutine_threadsafe(
+                shared.close_aio_http_session(), self.loop
+            )
+            try:
+                closing.result(timeout)
+            except FutureTimeoutError:
+                pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
@@ -5,8 +5,15 @@ This module includes the interfaces, enums, and value objects that are used
 throughout the application.
 """
 
+import re
+import sys
+import struct
+import asyncio
+import logging
+import gelo.conf
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from enum import Enum
-from threading import Thread
+from threading import Lock, Thread
 
 
 class MarkerType(Enum):
@@ -47,19 +54,243 @@ class MarkerType(Enum):
 MarkerTypeList = list[MarkerType]
 
 
+class BackpressurePolicy(Enum):
+    """What the mediator does when a subscriber's queue is full.
+
+    Enum values:
+    :DROP_OLDEST: discard the oldest queued marker to make room for the new one.
+    :DROP_NEWEST: discard the new marker, keeping what's already queued.
+    :COALESCE: discard everything queued, keeping only the new marker.
+    :BLOCK: wait (up to a timeout) for room, then discard the new marker.
+        Delayed markers are delivered on the shared scheduler thread, which
+        must never wait, so for delayed subscribers this is DROP_NEWEST.
+    """
+
+    DROP_OLDEST = 1
+    DROP_NEWEST = 2
+    COALESCE = 3
+    BLOCK = 4
+
+
+class MarkerFilter(object):
+    """Conditions a marker must meet for a subscriber to be sent it.
+
+    The mediator checks them once per marker, before putting it in the
+    subscriber's channel, so a sink is never woken for markers it would only
+    throw away. A MarkerFilter keeps track of when it last let a marker
+    through, so each subscription needs its own. Markers can be published
+    from several threads at once, so that is only touched with a lock held.
+    """
+
+    def __init__(
+        self,
+        has_special: bool | None = None,
+        label_pattern: str | None = None,
+        require_artist: bool = False,
+        min_interval: float = 0.0,
+    ):
+        """Create a new MarkerFilter. With no arguments, it accepts everything.
+
+        :param has_special: If True, only accept markers with a special; if
+        False, only markers without one.
+        :param label_pattern: A regular expression the label must match.
+        :param require_artist: Only accept markers with an artist and title.
+        :param min_interval: The fewest seconds since the last accepted
+        marker, for a marker to be accepted.
+        """
+        self.has_special = has_special
+        self.label_pattern = label_pattern
+        self.label_regex = re.compile(label_pattern) if label_pattern else None
+        self.require_artist = require_artist
+        self.min_interval_ns = int(min_interval * 1e9)
+        self.last_accepted_ns = None
+        self.lock = Lock()
+
+    @staticmethod
+    def from_config(config) -> "MarkerFilter | None":
+        """Create a MarkerFilter from a plugin's ``filter`` table, if it has
+        one.
+
+        :param config: The plugin's configuration.
+        :return: The MarkerFilter, or None if there's no ``filter`` table.
+        :raises gelo.conf.InvalidConfigurationError: If the table is invalid.
+        """
+        if "filter" not in config.keys():
+            return None
+        table = config["filter"]
+        errors = []
+        for key in ["has_special", "require_artist"]:
+            if key in table and type(table[key]) is not bool:
+                errors.append('filter has a non-boolean value for the key "%s"' % key)
+        if "label_pattern" in table:
+            try:
+                re.compile(table["label_pattern"])
+            except (re.error, TypeError) as e:
+                errors.append('filter has an invalid "label_pattern": %s' % e)
+        if "min_interval" in table:
+            if type(table["min_interval"]) not in [int, float]:
+                errors.append('filter has a non-numeric value for "min_interval"')
+            elif table["min_interval"] < 0:
+                errors.append('filter has a negative value for "min_interval"')
+        for key in table.keys():
+            if key not in [
+                "has_special",
+                "label_pattern",
+                "require_artist",
+                "min_interval",
+            ]:
+                errors.append('filter has an unknown key "%s"' % key)
+        if len(errors) > 0:
+            raise gelo.conf.InvalidConfigurationError(errors)
+        return MarkerFilter(
+            has_special=table.get("has_special"),
+            label_pattern=table.get("label_pattern"),
+            require_artist=table.get("require_artist", False),
+            min_interval=table.get("min_interval", 0.0),
+        )
+
+    def accepts(self, marker: "Marker", now_ns: int) -> bool:
+        """Check a marker, and note it if it's accepted.
+
+        :param marker: The marker.
+        :param now_ns: The time.perf_counter_ns reading to space markers by.
+        """
+        if self.has_special is not None:
+            if (marker.special is not None) != self.has_special:
+                return False
+        if self.require_artist and not (marker.artist and marker.title):
+            return False
+        if self.label_regex is not None:
+            if marker.label is None or self.label_regex.search(marker.label) is None:
+                return False
+        if self.min_interval_ns > 0:
+            with self.lock:
+                if (
+                    self.last_accepted_ns is not None
+                    and now_ns - self.last_accepted_ns < self.min_interval_ns
+                ):
+                    return False
+                self.last_accepted_ns = now_ns
+        return True
+
+    def __repr__(self):
+        return (
+            "MarkerFilter(has_special=%s, label_pattern=%r, require_artist=%s, "
+            "min_interval=%s)"
+            % (
+                self.has_special,
+                self.label_pattern,
+                self.require_artist,
+                self.min_interval_ns / 1e9,
+            )
+        )
+
+
+def intern(s: str | None) -> str | None:
+    """Intern a string that many markers are likely to share.
+
+    Track names repeat a lot over a long show, and across the journals of a
+    season, so every marker with the same artist gets the same string object
+    instead of a copy of it.
+    """
+    return None if s is None else sys.intern(s)
+
+
 class Marker(object):
     """A marker, or a label at a time.
 
-    The time is a float number of seconds since the first marker."""
+    The time_ns is an integer number of nanoseconds since the first marker,
+    measured on the mediator's monotonic MarkerClock. The time is the same
+    thing as a float number of seconds, for sinks that need it. The
+    published_ns is the time.perf_counter_ns reading at which the mediator
+    received the marker, which is used to measure how long it takes to reach
+    sinks.
+
+    Markers are immutable, so one marker can be handed to every subscriber
+    and kept in journals and replays without copying. Use replace to get a
+    marker with some fields changed."""
+
+    __slots__ = (
+        "label",
+        "artist",
+        "title",
+        "time_ns",
+        "url",
+        "special",
+        "published_ns",
+    )
+
+    # time_ns, then the length of each string field.
+    HEADER = struct.Struct("<qHHHHH")
+    # The time_ns that stands for None.
+    NO_TIME = -(2**63)
+    # The length that stands for a None string field.
+    NO_STRING = 0xFFFF
+
+    def __init__(
+        self,
+        label: str | None = None,
+        artist: str | None = None,
+        title: str | None = None,
+        time_ns: int | None = None,
+        url: str | None = None,
+        special: str | None = None,
+        published_ns: int | None = None,
+    ):
+        """Create a new marker.
+
+        :param label: The text of the marker. If it's None, it's made from
+        the artist and title.
+        :param artist: The artist of the track, if it's a track.
+        :param title: The title of the track, if it's a track.
+        :param time_ns: Nanoseconds since the first marker, if it's known.
+        :param url: A URL to go with the marker.
+        :param special: A note to go with the marker, like the name of the
+        segment it's played in.
+        :param published_ns: When the mediator received it.
+        """
+        artist = intern(artist)
+        title = intern(title)
+        if label is None and artist is not None and title is not None:
+            label = "%s — %s" % (artist, title)
+        setter = object.__setattr__
+        setter(self, "label", label)
+        setter(self, "artist", artist)
+        setter(self, "title", title)
+        setter(self, "time_ns", time_ns)
+        setter(self, "url", url)
+        setter(self, "special", intern(special))
+        setter(self, "published_ns", published_ns)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Marker is immutable; use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError("Marker is immutable; use replace()")
+
+    def replace(self, **changes) -> "Marker":
+        """Get a copy of this marker with some fields changed.
+
+        :param changes: The fields to change, as keyword arguments.
+        """
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return Marker(**fields)
+
+    @property
+    def time(self) -> float | None:
+        """The number of seconds since the first marker, or None."""
+        return None if self.time_ns is None else self.time_ns / 1e9
+
+    def __eq__(self, other):
+        if not isinstance(other, Marker):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
 
-    def __init__(self, label: str, artist: str | None = None, title: str | None = None):
-        """Create a new marker."""
-        self.label = label
-        self.artist = artist
-        self.title = title
-        self.time = None
-        self.url = None
-        self.special = None
+    def __hash__(self):
+        return hash((self.label, self.artist, self.title, self.time_ns))
 
     def __repr__(self):
         return "Marker(%s, %s, %s,  %s, %s, %s)" % (
@@ -71,12 +302,59 @@ class Marker(object):
             self.url,
         )
 
+    def __reduce__(self):
+        return (Marker, tuple(getattr(self, name) for name in self.__slots__))
+
+    def pack(self) -> bytes:
+        """Encode the marker compactly, for journals and the marker bus.
+
+        The published_ns isn't included, because it's only meaningful in the
+        process that published the marker. Strings are cut to 65534 bytes.
+        """
+        encoded = [
+            None if s is None else s.encode("utf-8")[: self.NO_STRING - 1]
+            for s in (self.label, self.artist, self.title, self.url, self.special)
+        ]
+        lengths = [self.NO_STRING if b is None else len(b) for b in encoded]
+        time_ns = self.NO_TIME if self.time_ns is None else self.time_ns
+        return self.HEADER.pack(time_ns, *lengths) + b"".join(
+            b for b in encoded if b is not None
+        )
+
+    @classmethod
+    def unpack(cls, buf: bytes, offset: int = 0) -> tuple["Marker", int]:
+        """Decode a marker encoded by pack.
+
+        :param buf: The buffer holding the marker.
+        :param offset: Where the marker starts in ``buf``.
+        :return: The marker, and the offset just past it.
+        """
+        time_ns, *lengths = cls.HEADER.unpack_from(buf, offset)
+        offset += cls.HEADER.size
+        fields = []
+        for length in lengths:
+            if length == cls.NO_STRING:
+                fields.append(None)
+                continue
+            fields.append(
+                bytes(buf[offset : offset + length]).decode("utf-8", "replace")
+            )
+            offset += length
+        label, artist, title, url, special = fields
+        marker = cls(
+            label,
+            artist,
+            title,
+            time_ns=None if time_ns == cls.NO_TIME else time_ns,
+            url=url,
+            special=special,
+        )
+        return marker, offset
+
     @classmethod
     def withtime(cls, label: str, time: float, **kwargs):
         """Create a marker with a time."""
-        m = cls(label, **kwargs)
-        m.time = time
-        return m
+        return cls(label, time_ns=round(time * 1e9), **kwargs)
 
 
 # This class is defined here only so that the type hints work.
@@ -90,6 +368,9 @@ class IMediator(object):
     def __init__(self):
         """Create a new mediator."""
         super().__init__()
+        # The Scheduler that delays markers, which plugins can also delay
+        # their own work on. Implementations set this.
+        self.scheduler = None
 
     def publish(self, event_type: MarkerType, event: Marker) -> None:
         """Publish a new event to all applicable subscribers.
@@ -98,14 +379,51 @@ class IMediator(object):
         :event_label: The actual text of the event"""
         pass
 
-    def subscribe(self, event_types: MarkerTypeList, subscriber: str, delayed=False):
+    def publish_many(self, markers: list[tuple[MarkerType, Marker]]) -> None:
+        """Publish several events at once, in order.
+
+        :param markers: The MarkerType and Marker of each event."""
+        for event_type, event in markers:
+            self.publish(event_type, event)
+
+    def subscribe(
+        self,
+        event_types: MarkerTypeList,
+        subscriber: str,
+        delayed=False,
+        policy: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+        block_timeout: float = 1.0,
+        marker_filter: MarkerFilter | None = None,
+    ):
         """Subscribe to all of the listed event types.
         :param event_types: The types of events to subscribe to
         :param subscriber: The name of the plugin that's subscribing to
         messages.  This should be the class name of the plugin, unless you
+        like undefined behavior.
         :param delayed: Whether this subscriber should get markers as soon as
         they are published, or after the configured broadcast delay.
-        like undefined behavior.
+        :param policy: What to do with markers when the subscriber falls
+        behind.
+        :param block_timeout: How long the BLOCK policy waits for room before
+        dropping a marker.
+        :param marker_filter: Conditions markers must meet to be delivered.
+        """
+        pass
+
+    def marker_time(self) -> float | None:
+        """Get the time a marker published now would be given.
+
+        :return: Seconds since the first marker, or None if there hasn't been
+        one yet (nor a time base recovered from a journal).
+        """
+        return None
+
+    def register_metrics(self, name: str, stats) -> None:
+        """Include a plugin's own statistics in the mediator's metrics.
+
+        :param name: The name to report them under, usually the plugin's
+        PLUGIN_MODULE_NAME.
+        :param stats: An object with a ``summary()`` method returning a dict.
         """
         pass
 
@@ -117,7 +435,9 @@ class IMarkerSource(Thread):
 
     def __init__(self, config, mediator: IMediator, show: str):
         """Create a new marker source."""
-        super().__init__()
+        # A daemon, so a plugin stuck past the shutdown deadline can't keep
+        # the process alive.
+        super().__init__(daemon=True)
         self.config = config
         self.mediator = mediator
         self.should_terminate = False
@@ -179,7 +499,9 @@ class IMarkerSink(Thread):  # noqa: F811
         :config: The section of the configuration file for this plugin
         :mediator: The IMediator to get markers from
         :show: The short name of the show that the markers are for"""
-        super().__init__()
+        # A daemon, so a plugin stuck past the shutdown deadline can't keep
+        # the process alive.
+        super().__init__(daemon=True)
         self.config = config
         self.mediator = mediator
         self.show = show
@@ -231,3 +553,60 @@ class IMarkerSink(Thread):  # noqa: F811
         it cannot be reactivated again without restarting the application.
         """
         self.should_terminate = True
+
+
+class AsyncPlugin(object):
+    """Run a plugin as a task on the mediator's event loop, not as a thread.
+
+    This is mixed into IAsyncMarkerSource and IAsyncMarkerSink. Those still
+    inherit from the threaded interfaces, so that async plugins can share
+    their configuration and marker handling code with the threaded ones, but
+    the thread itself is never started. Instead, ``activate`` schedules
+    ``arun`` on the event loop of the AsyncMediator the plugin was given.
+    """
+
+    future = None
+
+    def activate(self):
+        """Activate the plugin by scheduling ``arun`` on the event loop.
+
+        Implementers *should not* override this method.
+        """
+        self.future = asyncio.run_coroutine_threadsafe(self.arun(), self.mediator.loop)
+
+    async def arun(self):
+        """The main coroutine of the plugin.
+
+        Implementers *should* override this method to implement the
+        functionality of their plugin. It must never block the event loop.
+        """
+        pass
+
+    def join(self, timeout: float | None = None):
+        """Wait for ``arun`` to finish, like Thread.join.
+
+        :param timeout: The most time to wait, in seconds, or None to wait
+        forever.
+        """
+        if self.future is None:
+            return
+        try:
+            self.future.result(timeout)
+        except FutureTimeoutError:
+            return
+        except BaseException:
+            logging.getLogger("gelo.arch").exception(
+                "Plugin %s exited with an exception" % self.PLUGIN_MODULE_NAME
+            )
+
+    def is_alive(self) -> bool:
+        """Check whether ``arun`` is still running, like Thread.is_alive."""
+        return self.future is not None and not self.future.done()
+
+
+class IAsyncMarkerSource(AsyncPlugin, IMarkerSource):
+    """An interface for marker sources that run on an asyncio event loop."""
+
+
+class IAsyncMarkerSink(AsyncPlugin, IMarkerSink):
+    """An interface for marker sinks that run on an asyncio event loop."""
@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+"""Carry markers between processes over a Unix domain socket.
+
+A BusServer exposes a show's Mediator on a socket. A RemoteMediator, in
+another process, connects to it and offers the same ``publish``,
+``subscribe``, and ``listen`` methods as a local Mediator, so any plugin can
+run in a child process (see RemotePlugin) or in a separate daemon, without
+competing with the rest of Gelo for the GIL.
+
+Every frame on the socket is laid out as::
+
+    u32 length | u8 kind | payload (length - 1 bytes)
+
+all little-endian. Subscriptions are described in JSON, since they're sent
+once per connection. Markers are sent packed, as in the journal.
+"""
+
+import os
+import json
+import socket
+import signal
+import struct
+import logging
+import multiprocessing
+from threading import Lock, Thread
+from time import perf_counter_ns, time_ns
+from gelo import arch, conf, mediator
+from gelo.arch import BackpressurePolicy
+from gelo.scheduler import Scheduler
+
+FRAME_HEADER = struct.Struct("<IB")
+# When the marker was published, in ns since the Unix epoch, followed by the
+# packed marker. Subscribers aren't told marker types, so neither is the client.
+MARKER_HEADER = struct.Struct("<q")
+PUBLISH_HEADER = struct.Struct("<B")
+
+# Client to server: subscribe this connection. The payload is JSON.
+KIND_SUBSCRIBE = 1
+# Server to client: a marker for the subscription.
+KIND_MARKER = 2
+# Client to server: publish a marker.
+KIND_PUBLISH = 3
+# Server to client: the subscription is closed.
+KIND_CLOSE = 4
+
+
+def encode_frame(kind: int, payload: bytes = b"") -> bytes:
+    """Build a frame."""
+    return FRAME_HEADER.pack(len(payload) + 1, kind) + payload
+
+
+def read_frame(f) -> tuple[int, bytes] | None:
+    """Read a frame from a file-like socket.
+
+    :return: The kind and payload, or None at the end of the stream.
+    """
+    header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    length, kind = FRAME_HEADER.unpack(header)
+    payload = f.read(length - 1)
+    if len(payload) < length - 1:
+        return None
+    return kind, payload
+
+
+def encode_marker_frame(marker: arch.Marker) -> bytes:
+    """Build a frame carrying a marker to a subscriber."""
+    published_wall_ns = 0
+    if marker.published_ns is not None:
+        published_wall_ns = time_ns() - (perf_counter_ns() - marker.published_ns)
+    header = MARKER_HEADER.pack(published_wall_ns)
+    return encode_frame(KIND_MARKER, header + marker.pack())
+
+
+def decode_marker_frame(payload: bytes) -> arch.Marker:
+    """Decode the payload of a marker frame."""
+    (published_wall_ns,) = MARKER_HEADER.unpack_from(payload)
+    marker, _ = arch.Marker.unpack(payload, MARKER_HEADER.size)
+    if published_wall_ns:
+        # Carry the publish time across on this process's performance
+        # counter, so delivery latency can still be measured.
+        marker = marker.replace(
+            published_ns=perf_counter_ns() - (time_ns() - published_wall_ns)
+        )
+    return marker
+
+
+def filter_to_config(marker_filter: arch.MarkerFilter | None) -> dict | None:
+    """Describe a MarkerFilter as the table MarkerFilter.from_config reads."""
+    if marker_filter is None:
+        return None
+    table = {
+        "require_artist": marker_filter.require_artist,
+        "min_interval": marker_filter.min_interval_ns / 1e9,
+    }
+    if marker_filter.has_special is not None:
+        table["has_special"] = marker_filter.has_special
+    if marker_filter.label_pattern is not None:
+        table["label_pattern"] = marker_filter.label_pattern
+    return table
+
+
+class BusServer(object):
+    """Serve a Mediator to other processes over a Unix domain socket."""
+
+    def __init__(self, m: mediator.Mediator, path: str):
+        """Create a new BusServer, without listening yet.
+
+        :param m: The Mediator to serve.
+        :param path: Where to create the socket. Anything already there is
+        replaced.
+        """
+        self.mediator = m
+        self.path = path
+        self.log = logging.getLogger("gelo.bus")
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        """Start accepting connections."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        # Anyone who can connect can publish and subscribe as the show, so
+        # only this user may. Nobody can connect before it's listening.
+        os.chmod(self.path, 0o600)
+        self.sock.listen()
+        self.thread = Thread(target=self.accept, name="gelo-bus", daemon=True)
+        self.thread.start()
+        self.log.info("Listening on %s" % self.path)
+
+    def stop(self):
+        """Stop accepting connections, and remove the socket."""
+        if self.sock is None:
+            return
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def accept(self):
+        """Accept connections. This is the server thread."""
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (OSError, AttributeError):
+                return
+            Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn: socket.socket):
+        """Handle frames from one client until it disconnects."""
+        f = conn.makefile("rb")
+        subscriber = None
+        try:
+            while True:
+                frame = read_frame(f)
+                if frame is None:
+                    break
+                kind, payload = frame
+                if kind == KIND_PUBLISH:
+                    (type_value,) = PUBLISH_HEADER.unpack_from(payload)
+                    marker, _ = arch.Marker.unpack(payload, PUBLISH_HEADER.size)
+                    self.mediator.publish(arch.MarkerType(type_value), marker)
+                elif kind == KIND_SUBSCRIBE and subscriber is None:
+                    subscriber = self.subscribe(conn, json.loads(payload))
+                else:
+                    self.log.warning("Ignoring unexpected frame of kind %d" % kind)
+        except (OSError, ValueError, KeyError, conf.InvalidConfigurationError) as e:
+            self.log.warning("Dropping bus connection: %s" % e)
+        finally:
+            f.close()
+            if subscriber is not None:
+                self.log.info("Remote subscriber %s disconnected" % subscriber)
+                self.mediator.unsubscribe(subscriber)
+            else:
+                conn.close()
+
+    def subscribe(self, conn: socket.socket, request: dict) -> str:
+        """Subscribe a client, and start forwarding markers to it.
+
+        :param conn: The client's socket.
+        :param request: The subscription, as sent by RemoteMediator.
+        :return: The subscriber name.
+        """
+        marker_filter = None
+        if request.get("filter") is not None:
+            marker_filter = arch.MarkerFilter.from_config({"filter": request["filter"]})
+        types = [arch.MarkerType(t) for t in request["types"]]
+        channel = self.mediator.subscribe(
+            types,
+            request["name"],
+            delayed=request["delayed"],
+            policy=BackpressurePolicy[request["policy"]],
+            block_timeout=request["block_timeout"],
+            marker_filter=marker_filter,
+            since=request.get("since"),
+        )
+        self.log.info("Remote subscriber %s connected" % request["name"])
+        Thread(
+            target=self.forward,
+            args=(conn, channel),
+            name="gelo-bus-%s" % request["name"],
+            daemon=True,
+        ).start()
+        return request["name"]
+
+    def forward(self, conn: socket.socket, channel):
+        """Send a subscriber's markers to it, a batch at a time."""
+        try:
+            for batch in channel.listen_batch():
+                conn.sendall(b"".join(encode_marker_frame(m) for m in batch))
+        except mediator.UnsubscribeException:
+            try:
+                conn.sendall(encode_frame(KIND_CLOSE))
+            except OSError:
+                pass
+        except OSError as e:
+            self.log.warning("Failed to forward markers: %s" % e)
+        finally:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+
+class RemoteMediator(arch.IMediator):
+    """A Mediator in another process, reached through its BusServer.
+
+    ``subscribe`` returns a local channel with the same interface as a local
+    Mediator's, fed by a thread that reads the subscription's socket. The
+    BusServer applies the backpressure policy and filter on its side.
+    """
+
+    def __init__(self, path: str):
+        """Create a new RemoteMediator. It connects when it's first used.
+
+        :param path: The BusServer's socket.
+        """
+        super().__init__()
+        self.path = path
+        self.log = logging.getLogger("gelo.bus")
+        # For plugins that delay some of their own work.
+        self.scheduler = Scheduler()
+        self.connections = {}
+        self.publisher = None
+        self.publisher_lock = Lock()
+
+    def connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def publish(self, event_type: arch.MarkerType, event: arch.Marker) -> None:
+        """Publish a marker through the remote Mediator."""
+        frame = encode_frame(
+            KIND_PUBLISH,
+            PUBLISH_HEADER.pack(event_type.value) + event.pack(),
+        )
+        with self.publisher_lock:
+            if self.publisher is None:
+                self.publisher = self.connect()
+            self.publisher.sendall(frame)
+
+    def subscribe(
+        self,
+        event_types: arch.MarkerTypeList,
+        subscriber: str,
+        delayed=False,
+        policy: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+        block_timeout: float = 1.0,
+        marker_filter: arch.MarkerFilter | None = None,
+        since: int | None = None,
+    ) -> mediator.ListenableQueue | mediator.LatestValueChannel:
+        """Subscribe to markers from the remote Mediator.
+
+        The arguments are the same as for Mediator.subscribe. A subscriber
+        that reconnects under the same name catches up on what it missed, as
+        long as it's still in the remote Mediator's ring.
+
+        :return: A local queue of markers, or a LatestValueChannel if
+        ``policy`` is COALESCE.
+        """
+        if not event_types or not subscriber:
+            raise ValueError()
+        sock = self.connect()
+        request = {
+            "name": subscriber,
+            "types": [t.value for t in event_types],
+            "delayed": delayed,
+            "policy": policy.name,
+            "block_timeout": block_timeout,
+            "filter": filter_to_config(marker_filter),
+            "since": since,
+        }
+        sock.sendall(encode_frame(KIND_SUBSCRIBE, json.dumps(request).encode()))
+        if policy is BackpressurePolicy.COALESCE:
+            channel = mediator.LatestValueChannel()
+        else:
+            channel = mediator.ListenableQueue(mediator.Mediator.QUEUE_MAX)
+        self.connections[subscriber] = sock
+        Thread(
+            target=self.receive,
+            args=(sock, channel),
+            name="gelo-bus-%s" % subscriber,
+            daemon=True,
+        ).start()
+        return channel
+
+    def receive(self, sock: socket.socket, channel):
+        """Feed a subscription's markers into its local channel."""
+        f = sock.makefile("rb")
+        try:
+            while True:
+                frame = read_frame(f)
+                if frame is None or frame[0] == KIND_CLOSE:
+                    break
+                if frame[0] == KIND_MARKER:
+                    marker = decode_marker_frame(frame[1])
+                    # Waiting for room here pushes back on the server, which
+                    # applies the subscriber's policy.
+                    channel.put(marker)
+        except OSError as e:
+            self.log.warning("Lost connection to the bus: %s" % e)
+        finally:
+            f.close()
+            if isinstance(channel, mediator.LatestValueChannel):
+                channel.close()
+            else:
+                channel.put(None)
+
+    def unsubscribe(self, subscriber: str) -> None:
+        """Stop receiving markers for a subscriber."""
+        sock = self.connections.pop(subscriber, None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def terminate(self):
+        """Close every connection to the remote Mediator."""
+        for subscriber in list(self.connections):
+            self.unsubscribe(subscriber)
+        with self.publisher_lock:
+            if self.publisher is not None:
+                self.publisher.close()
+                self.publisher = None
+        self.scheduler.stop()
+
+
+def run_plugin(
+    plugin_class, config, path: str, show: str, log_file, log_level, control
+):
+    """Run a plugin in this process, connected to a show over the bus.
+
+    This is the body of the child processes that RemotePlugin starts.
+
+    :param control: The child's end of a Pipe, over which the parent sends
+    the names of the plugin methods to call ("enable", "disable", and
+    "deactivate").
+    """
+    # Ctrl-C is for the parent, which shuts the children down in order.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        filename=log_file,
+        format="%(asctime)s %(levelname)-8s %(name)s:%(message)s",
+    )
+    logging.getLogger("gelo").setLevel(log_level)
+    m = RemoteMediator(path)
+    plugin = plugin_class(config, m, show)
+    plugin.activate()
+    while True:
+        try:
+            command = control.recv()
+        except EOFError:
+            command = "deactivate"
+        if command in ["enable", "disable", "deactivate"]:
+            getattr(plugin, command)()
+        if command == "deactivate":
+            break
+    plugin.join()
+    m.terminate()
+
+
+class RemotePlugin(object):
+    """Run a plugin in a child process, standing in for it in this one.
+
+    It has the methods the GeloPluginManager and the shell use, and passes
+    them on to the real plugin in the child.
+    """
+
+    def __init__(self, plugin_class, config, path: str, show: str, configuration):
+        """Create a RemotePlugin, without starting the child yet.
+
+        :param plugin_class: The plugin to run.
+        :param config: The plugin's configuration.
+        :param path: The show's BusServer socket.
+        :param show: The show the plugin is for.
+        :param configuration: The Gelo configuration.
+        """
+        self.plugin_class = plugin_class
+        self.PLUGIN_MODULE_NAME = plugin_class.PLUGIN_MODULE_NAME
+        self.name = "%s (process)" % plugin_class.PLUGIN_MODULE_NAME
+        self.is_enabled = True
+        self.log = logging.getLogger("gelo.bus")
+        # Spawn rather than fork, since this process has threads running.
+        context = multiprocessing.get_context("spawn")
+        self.control, child_control = context.Pipe()
+        self.process = context.Process(
+            target=run_plugin,
+            args=(
+                plugin_class,
+                config,
+                path,
+                show,
+                configuration.log_file,
+                configuration.log_level,
+                child_control,
+            ),
+            name=self.name,
+            daemon=True,
+        )
+
+    def send(self, command: str):
+        try:
+            self.control.send(command)
+        except (OSError, ValueError) as e:
+            self.log.warning("Can't reach %s: %s" % (self.name, e))
+
+    def activate(self):
+        self.process.start()
+        self.log.info("Started %s as pid %s" % (self.name, self.process.pid))
+
+    def enable(self):
+        self.is_enabled = True
+        self.send("enable")
+
+    def disable(self):
+        self.is_enabled = False
+        self.send("disable")
+
+    def deactivate(self):
+        self.send("deactivate")
+
+    def join(self, timeout=None):
+        self.process.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
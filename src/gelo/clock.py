@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""The time base that marker times are measured on."""
+
+from time import perf_counter_ns, time_ns
+
+
+class MarkerClock(object):
+    """A monotonic, nanosecond-resolution clock, anchored to the wall clock.
+
+    Marker times are differences between readings of a monotonic clock, so
+    NTP adjusting the system clock mid-show can't shift them. The wall clock
+    is read exactly once, when the MarkerClock is created, and is only used
+    to convert monotonic readings to and from real dates (for example, to
+    carry a time base across a restart).
+    """
+
+    def __init__(self):
+        """Create a new MarkerClock, anchored to the current time."""
+        self.mono_anchor_ns = perf_counter_ns()
+        self.wall_anchor_ns = time_ns()
+
+    def now_ns(self) -> int:
+        """Read the monotonic clock.
+
+        :return: The current monotonic time, in nanoseconds.
+        """
+        return perf_counter_ns()
+
+    def to_wall_ns(self, mono_ns: int) -> int:
+        """Convert a monotonic reading to nanoseconds since the Unix epoch."""
+        return self.wall_anchor_ns + (mono_ns - self.mono_anchor_ns)
+
+    def from_wall_ns(self, wall_ns: int) -> int:
+        """Convert nanoseconds since the Unix epoch to a monotonic reading."""
+        return self.mono_anchor_ns + (wall_ns - self.wall_anchor_ns)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
-from gelo import main, conf
+import sys
+from gelo import main, conf, replay
 import signal
 import argparse
 import toml
@@ -10,10 +11,15 @@ GELO = main.Gelo()
 
 def main():
     """Parse the command line arguments into a Gelo configuration."""
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        return replay_main(sys.argv[2:])
     # Construct the parser
     parser = argparse.ArgumentParser(prog="gelo")
     parser.add_argument(
-        "show", help="the slug and episode number of the show, like fnt-192"
+        "show",
+        nargs="+",
+        help="the slug and episode number of the show, like fnt-192. Give "
+        "several to host them all in one process.",
     )
     parser.add_argument(
         "-c",
@@ -38,6 +44,8 @@ def main():
     args = parser.parse_args()
     # Parse the configuration file
     config_file = toml.load(args.config)
+    if len(set(args.show)) != len(args.show):
+        parser.error("each show may only be given once")
     # Create the Gelo Configuration
     config = conf.Configuration(config_file, args)
     # Add the handler to shut down Gelo
@@ -46,9 +54,78 @@ def main():
     GELO.main(config)
 
 
+def replay_main(argv):
+    """Parse the arguments to `gelo replay` and run the replay."""
+    parser = argparse.ArgumentParser(
+        prog="gelo replay",
+        description="Replay a recorded show through the configured sinks.",
+    )
+    parser.add_argument(
+        "session", help="an Audacity label file or marker journal to replay"
+    )
+    parser.add_argument(
+        "-s",
+        "--speed",
+        default="1",
+        help='how many times faster than real time to go, or "max" to go as '
+        "fast as the sinks allow",
+    )
+    parser.add_argument(
+        "-n",
+        "--no-delay",
+        action="store_true",
+        help="don't apply the broadcast delay (it's scaled by the speed "
+        'otherwise, and always skipped at "max")',
+    )
+    parser.add_argument(
+        "--show",
+        default="replay",
+        help="the slug and episode number to give the sinks",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w"),
+        help="write a JSON summary of throughput and latency to this file",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=os.path.expandvars("$HOME/.config/gelo/gelo.toml"),
+        type=open,
+        help="path to configuration file",
+    )
+    parser.add_argument(
+        "-p",
+        "--user-plugin-dir",
+        default="",
+        help="path to user plugins directory, overrides config file",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="increase log level. One copy is INFO, two is DEBUG.",
+    )
+    args = parser.parse_args(argv)
+    speed = None
+    if args.speed != "max":
+        try:
+            speed = float(args.speed)
+        except ValueError:
+            parser.error('speed must be a number or "max"')
+        if speed <= 0:
+            parser.error("speed must be positive")
+    config = conf.Configuration(toml.load(args.config), args)
+    replay.main(config, args.session, speed, not args.no_delay, args.output)
+
+
 def exit_handler(sig, frame):
     """Shut down and clean up Gelo when killed with CTRL-C"""
     GELO.shutdown()
+    # Leave the shell, so Gelo.main can finish up within the deadline.
+    sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import argparse
+import copy
 import os
 
 
@@ -24,9 +25,49 @@ class Configuration(object):
         self.log_file = os.path.expandvars(config_file["core"]["log_file"])
         self.macro_file = os.path.expandvars(config_file["core"]["macro_file"])
         self.configparser = config_file
-        self.show = args.show
+        # One process can host several shows at once.
+        self.shows = args.show if isinstance(args.show, list) else [args.show]
+        self.show = self.shows[0]
         self.broadcast_delay = float(config_file["core"]["broadcast_delay"])
+        self.engine = config_file["core"].get("engine", "threads")
+        self.shutdown_timeout = float(config_file["core"].get("shutdown_timeout", 5.0))
+        self.bus_socket = ""
+        if "bus_socket" in config_file["core"]:
+            self.bus_socket = os.path.expandvars(config_file["core"]["bus_socket"])
+        # MarkerType names in priority order, highest first.
+        self.lanes = config_file["core"].get("lanes", [])
+        self.journal_file = ""
+        if "journal_file" in config_file["core"]:
+            self.journal_file = os.path.expandvars(config_file["core"]["journal_file"])
         self.log_level = self.get_log_level(args.verbose)
+        self.validate_shows()
+
+    def bus_path(self, show: str) -> str:
+        """Get the path of a show's bus socket, or "" if there's no bus."""
+        return self.bus_socket.replace("{show}", show)
+
+    def journal_path(self, show: str) -> str:
+        """Get the path of a show's journal, or "" if there's no journal."""
+        return self.journal_file.replace("{show}", show)
+
+    def plugin_config(self, plugin: str, show: str) -> dict:
+        """Get the configuration of a plugin, as a show should see it.
+
+        Settings in ``["show:<show>".<plugin>]`` (or, failing that,
+        ``["show:<slug>".<plugin>]``) override the ones in
+        ``["plugin:<plugin>"]``, so shows hosted by the same process can
+        poll different servers or post to different channels.
+
+        :param plugin: The plugin's PLUGIN_MODULE_NAME.
+        :param show: The show the plugin is for.
+        :return: A copy, which the plugin is free to modify.
+        """
+        config = copy.deepcopy(self.configparser["plugin:" + plugin])
+        for section in ["show:" + show, "show:" + show.split("-")[0]]:
+            if plugin in self.configparser.get(section, {}):
+                config.update(copy.deepcopy(self.configparser[section][plugin]))
+                break
+        return config
 
     @staticmethod
     def validate_config_file(config_file: dict):
@@ -51,9 +92,127 @@ class Configuration(object):
                 errors.append(
                     '[core] has a negative value for the key "broadcast_delay"'
                 )
+        if "engine" in config_file["core"].keys():
+            if config_file["core"]["engine"] not in ["threads", "asyncio"]:
+                errors.append(
+                    '[core] has an invalid value for the key "engine". '
+                    'Choose "threads" or "asyncio".'
+                )
+        if "shutdown_timeout" in config_file["core"].keys():
+            if type(config_file["core"]["shutdown_timeout"]) not in [int, float]:
+                errors.append(
+                    '[core] has a non-numeric value for the key "shutdown_timeout"'
+                )
+            elif config_file["core"]["shutdown_timeout"] < 0:
+                errors.append(
+                    '[core] has a negative value for the key "shutdown_timeout"'
+                )
+        if "lanes" in config_file["core"].keys():
+            # gelo.arch imports this module, so it can't be imported up top.
+            from gelo.arch import MarkerType
+
+            lanes = config_file["core"]["lanes"]
+            if type(lanes) is not list:
+                errors.append('[core] has a non-list value for the key "lanes"')
+            elif config_file["core"].get("engine") == "asyncio":
+                errors.append('[core] "lanes" requires engine = "threads"')
+            else:
+                for lane in lanes:
+                    if type(lane) is not str or MarkerType.from_string(lane) is None:
+                        errors.append(
+                            '[core] "lanes" has an unknown marker type "%s"' % lane
+                        )
+                if len(set(map(str, lanes))) != len(lanes):
+                    errors.append('[core] "lanes" lists a marker type twice')
+        if "journal_file" in config_file["core"].keys():
+            if type(config_file["core"]["journal_file"]) is not str:
+                errors.append(
+                    '[core] has a non-string value for the key "journal_file"'
+                )
+        if "bus_socket" in config_file["core"].keys():
+            if type(config_file["core"]["bus_socket"]) is not str:
+                errors.append('[core] has a non-string value for the key "bus_socket"')
+            elif config_file["core"].get("engine") == "asyncio":
+                errors.append('[core] "bus_socket" requires engine = "threads"')
+        for section in config_file.keys():
+            if not section.startswith("plugin:"):
+                continue
+            process = config_file[section].get("process", False)
+            if type(process) is not bool:
+                errors.append(
+                    '[%s] has a non-boolean value for the key "process"' % section
+                )
+            elif process and "bus_socket" not in config_file["core"].keys():
+                errors.append(
+                    '[%s] has process = true, which requires [core] "bus_socket"'
+                    % section
+                )
+        if len(errors) > 0:
+            raise InvalidConfigurationError(errors)
+
+    def validate_shows(self):
+        """Check that shows hosted together don't mark each other's tracks.
+
+        Every mount HttpPoller marks goes to the show it's polling for, so
+        when shows poll the same server, each show's ``mounts`` map the
+        server's mounts to it, and no two shows may have the same mount (or
+        every mount, by leaving ``mounts`` out). The asyncio engine's IRC
+        plugins don't share their connections the way the threads engine's
+        do, so with it, no two shows may use the same server and nick."""
+        if len(self.shows) < 2:
+            return
+        errors = self.validate_polled_mounts() + self.validate_irc_identities()
         if len(errors) > 0:
             raise InvalidConfigurationError(errors)
 
+    def validate_polled_mounts(self) -> list:
+        """Find shows that would mark each other's HttpPoller mounts."""
+        if "plugin:HttpPoller" not in self.configparser:
+            return []
+        errors = []
+        polled = {}
+        for show in self.shows:
+            config = self.plugin_config("HttpPoller", show)
+            urls = config.get("poll_url", [])
+            urls = [urls] if type(urls) is str else urls
+            for url in urls:
+                for mount in config.get("mounts") or [None]:
+                    for other, other_mount in polled.get(url, []):
+                        if None in [mount, other_mount] or mount == other_mount:
+                            errors.append(
+                                "[show:%s] and [show:%s] both mark %s on %s; give "
+                                'each show its own HttpPoller "mounts"'
+                                % (
+                                    other,
+                                    show,
+                                    mount or other_mount or "every mount",
+                                    url,
+                                )
+                            )
+                    polled.setdefault(url, []).append((show, mount))
+        return errors
+
+    def validate_irc_identities(self) -> list:
+        """Find shows that would connect to IRC as the same nick on asyncio."""
+        if "plugin:IRC" not in self.configparser or self.engine != "asyncio":
+            return []
+        errors = []
+        identities = {}
+        for show in self.shows:
+            config = self.plugin_config("IRC", show)
+            identity = tuple(
+                config.get(key) for key in ["server", "port", "nick", "tls", "ipv6"]
+            )
+            if identity in identities:
+                errors.append(
+                    '[show:%s] and [show:%s] both connect to %s as "%s"; give each '
+                    'show its own IRC "nick", or use engine = "threads"'
+                    % (identities[identity], show, identity[0], identity[2])
+                )
+            else:
+                identities[identity] = show
+        return errors
+
     @staticmethod
     def get_log_level(verbose_count: int) -> str:
         """Convert a number of -v args into the log level.
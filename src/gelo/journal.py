@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""An append-only journal of published markers, for recovering from crashes.
+
+Every marker the mediator publishes is appended to the journal, and so is a
+note when its delayed delivery has happened. If Gelo crashes mid-show, the
+journal is replayed at startup: the time base is restored, so chapter times
+carry on where they left off, and markers that were still waiting out the
+broadcast delay are delivered after all.
+
+The file is a sequence of records, each laid out as::
+
+    u32 length | u32 crc32 | u8 kind | payload (length - 1 bytes)
+
+all little-endian. A crash can leave a partial record at the end of the file;
+recovery stops at the first record that is short or fails its checksum.
+"""
+
+import os
+import queue
+import itertools
+import struct
+import logging
+import zlib
+from threading import Event, Lock, Thread
+from gelo import arch
+
+RECORD_HEADER = struct.Struct("<IIB")
+ANCHOR = struct.Struct("<q")
+# seq, marker type, and wall-clock time, followed by the packed marker.
+PUBLISH = struct.Struct("<QBq")
+DELIVERED = struct.Struct("<Q")
+
+KIND_ANCHOR = 1
+KIND_PUBLISH = 2
+KIND_DELIVERED = 3
+
+
+class PendingMarker(object):
+    """A marker from the journal that never reached delayed subscribers."""
+
+    def __init__(
+        self,
+        seq: int,
+        marker_type: arch.MarkerType,
+        marker: arch.Marker,
+        published_wall_ns: int,
+    ):
+        self.seq = seq
+        self.marker_type = marker_type
+        self.marker = marker
+        self.published_wall_ns = published_wall_ns
+
+
+def decode_publish(payload: bytes) -> PendingMarker:
+    """Decode the payload of a publish record."""
+    seq, type_value, wall_ns = PUBLISH.unpack_from(payload)
+    marker, _ = arch.Marker.unpack(payload, PUBLISH.size)
+    return PendingMarker(seq, arch.MarkerType(type_value), marker, wall_ns)
+
+
+def scan(data: bytes):
+    """Walk the whole records in a journal.
+
+    :param data: The contents of a journal file.
+    :return: A generator of (end offset, kind, payload) for each record, in
+    order. It stops at the first record that is short or corrupt.
+    """
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc, kind = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length - 1
+        if length < 1 or end > len(data):
+            return
+        payload = data[start:end]
+        if zlib.crc32(bytes([kind]) + payload) != crc:
+            logging.getLogger("gelo.journal").warning(
+                "Journal record at %d is corrupt" % offset
+            )
+            return
+        offset = end
+        yield offset, kind, payload
+
+
+def read_published(path: str) -> list[PendingMarker]:
+    """Read every marker that was published, delivered or not.
+
+    Unlike Journal.recover, this never modifies the file.
+
+    :param path: The journal file.
+    :return: The published markers, in publish order.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    return [
+        decode_publish(payload)
+        for _, kind, payload in scan(data)
+        if kind == KIND_PUBLISH
+    ]
+
+
+class RecoveredState(object):
+    """What a journal says about the run that wrote it."""
+
+    def __init__(self):
+        # When the first marker was published, in ns since the Unix epoch.
+        self.first_wall_ns = None
+        # The highest sequence number written, or -1.
+        self.last_seq = -1
+        # Markers whose delayed delivery never happened, in publish order.
+        self.pending = []
+        # The number of records read.
+        self.records = 0
+
+
+class Journal(object):
+    """Append marker records to a file, fsyncing them in groups.
+
+    ``append_*`` never waits for the disk. A writer thread takes whatever
+    records have piled up since its last write, writes them all, and then
+    fsyncs once, so a burst of markers costs a single fsync.
+    """
+
+    def __init__(self, path: str):
+        """Open (or create) a journal file.
+
+        :param path: Where the journal lives.
+        """
+        self.path = path
+        self.log = logging.getLogger("gelo.journal")
+        self._seq = itertools.count()
+        self._records = queue.Queue()
+        self._file = None
+        self._writer = None
+        self._writer_lock = Lock()
+        self.fsync_count = 0
+
+    def recover(self) -> RecoveredState:
+        """Read the journal left behind by a previous run, if any.
+
+        This must be called before anything is appended.
+
+        :return: What the previous run left behind. It's empty if the journal
+        didn't exist.
+        """
+        state = RecoveredState()
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return state
+        pending = {}
+        offset = 0
+        for offset, kind, payload in scan(data):
+            state.records += 1
+            if kind == KIND_ANCHOR:
+                (state.first_wall_ns,) = ANCHOR.unpack_from(payload)
+            elif kind == KIND_PUBLISH:
+                p = decode_publish(payload)
+                pending[p.seq] = p
+                state.last_seq = max(state.last_seq, p.seq)
+            elif kind == KIND_DELIVERED:
+                (seq,) = DELIVERED.unpack_from(payload)
+                pending.pop(seq, None)
+        if offset != len(data):
+            self.log.warning(
+                "Ignoring %d bytes of partial record at the end of the journal"
+                % (len(data) - offset)
+            )
+            # Cut off the partial record, so new records follow whole ones.
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        state.pending = sorted(pending.values(), key=lambda p: p.seq)
+        self._seq = itertools.count(state.last_seq + 1)
+        self.log.info(
+            "Recovered %d records, %d undelivered markers"
+            % (state.records, len(state.pending))
+        )
+        return state
+
+    def append_anchor(self, first_wall_ns: int) -> None:
+        """Record when the first marker was published.
+
+        :param first_wall_ns: The wall-clock time of the first marker, in ns
+        since the Unix epoch.
+        """
+        self._append(KIND_ANCHOR, ANCHOR.pack(first_wall_ns))
+
+    def append_publish(
+        self, marker_type: arch.MarkerType, marker: arch.Marker, wall_ns: int
+    ) -> int:
+        """Record a published marker.
+
+        :param marker_type: The type of the marker.
+        :param marker: The marker, with its time already set.
+        :param wall_ns: When it was published, in ns since the Unix epoch.
+        :return: The sequence number to pass to ``append_delivered``.
+        """
+        seq = next(self._seq)
+        header = PUBLISH.pack(seq, marker_type.value, wall_ns)
+        self._append(KIND_PUBLISH, header + marker.pack())
+        return seq
+
+    def append_delivered(self, seq: int) -> None:
+        """Record that a marker was delivered to delayed subscribers.
+
+        :param seq: The sequence number from ``append_publish``.
+        """
+        self._append(KIND_DELIVERED, DELIVERED.pack(seq))
+
+    def _append(self, kind: int, payload: bytes) -> None:
+        """Hand a record to the writer thread."""
+        crc = zlib.crc32(bytes([kind]) + payload)
+        record = RECORD_HEADER.pack(len(payload) + 1, crc, kind) + payload
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._file = open(self.path, "ab")
+                    self._writer = Thread(
+                        target=self._write, name="gelo-journal", daemon=True
+                    )
+                    self._writer.start()
+        self._records.put(record)
+
+    def sync(self, timeout: float | None = None) -> bool:
+        """Wait until every record appended so far is on disk.
+
+        :param timeout: The most time to wait, in seconds.
+        :return: True if the records were synced in time.
+        """
+        if self._writer is None:
+            return True
+        done = Event()
+        self._records.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Sync everything and close the journal file."""
+        if self._writer is None:
+            return
+        self._records.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _write(self):
+        """Write and fsync records in batches. This is the writer thread."""
+        while True:
+            batch = [self._records.get()]
+            try:
+                while True:
+                    batch.append(self._records.get_nowait())
+            except queue.Empty:
+                pass
+            records = [r for r in batch if isinstance(r, bytes)]
+            if records:
+                try:
+                    self._file.write(b"".join(records))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self.fsync_count += 1
+                except OSError as e:
+                    self.log.error("Failed to write to journal: %s" % e)
+            for r in batch:
+                if isinstance(r, Event):
+                    r.set()
+            if None in batch:
+                self._file.close()
+                return
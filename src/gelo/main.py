@@ -3,12 +3,15 @@
 
 import os
 import logging
-from time import time
-from gelo import arch, mediator, shell
+from time import monotonic, time
+from gelo import aio, arch, bus, journal, mediator, shared, shell
+from gelo.scheduler import shared_scheduler, stop_shared_scheduler
 from gelo.plugins import (
     AudacityLabels,
     HttpPoller,
     HttpPusher,
+    IcecastReceiver,
+    IcyReader,
     IRC,
     NowPlayingFile,
 )
@@ -20,23 +23,43 @@ BUILTIN_PLUGIN_DIR = os.path.join(os.path.dirname(__file__), "plugins")
 class GeloPluginManager:
     """Load Gelo plugins."""
 
-    def __init__(self, config, mediator: arch.IMediator, show: str):
-        """Create the PluginManager for Gelo."""
+    def __init__(
+        self, config, mediator: arch.IMediator, show: str, use_asyncio=False
+    ):
+        """Create the PluginManager for Gelo.
+
+        :param use_asyncio: Load the asyncio versions of the plugins, which
+        require ``mediator`` to be an AsyncMediator.
+        """
         self.config = config
         self.mediator = mediator
         self.show = show
         self.plugins = []
-        self.pluginClasses = [
-            AudacityLabels.AudacityLabels,
-            HttpPoller.HttpPoller,
-            HttpPusher.HttpPusher,
-            IRC.IRC,
-            NowPlayingFile.NowPlayingFile,
-        ]
+        if use_asyncio:
+            self.pluginClasses = [
+                AudacityLabels.AsyncAudacityLabels,
+                HttpPoller.AsyncHttpPoller,
+                HttpPusher.AsyncHttpPusher,
+                # It has a thread of its own even here, for its HTTP server.
+                IcecastReceiver.IcecastReceiver,
+                IcyReader.AsyncIcyReader,
+                IRC.AsyncIRC,
+                NowPlayingFile.AsyncNowPlayingFile,
+            ]
+        else:
+            self.pluginClasses = [
+                AudacityLabels.AudacityLabels,
+                HttpPoller.HttpPoller,
+                HttpPusher.HttpPusher,
+                IcecastReceiver.IcecastReceiver,
+                IcyReader.IcyReader,
+                IRC.IRC,
+                NowPlayingFile.NowPlayingFile,
+            ]
 
     def instantiatePlugin(self, element, element_name):
         """Instantiate a plugin."""
-        c = self.config.configparser["plugin:" + element_name]
+        c = self.config.plugin_config(element_name, self.show)
         return element(c, self.mediator, self.show)
 
     def getAllPlugins(self):
@@ -81,8 +104,18 @@ class GeloPluginManager:
         This constructs each plugin object and then calls its activate method.
         """
         for k in self.pluginClasses:
-            name = k.__name__.removeprefix("gelo.plugins.")
-            instance = self.instantiatePlugin(k, name)
+            name = k.PLUGIN_MODULE_NAME
+            if name not in self.config.plugins:
+                # There's no [plugin:<name>] section, so it isn't wanted.
+                continue
+            c = self.config.plugin_config(name, self.show)
+            if c.get("process", False):
+                # Run it in a child process, connected over the show's bus.
+                instance = bus.RemotePlugin(
+                    k, c, self.config.bus_path(self.show), self.show, self.config
+                )
+            else:
+                instance = self.instantiatePlugin(k, name)
             instance.activate()
             self.plugins.append(instance)
 
@@ -91,35 +124,190 @@ class GeloPluginManager:
         for p in self.plugins:
             p.deactivate()
 
-    def joinAll(self):
+    def deactivateSources(self):
+        """Deactivate the plugins that publish markers, leaving the sinks."""
+        for p in self.plugins:
+            # A plugin in a child process is stood in for by a RemotePlugin.
+            plugin_class = getattr(p, "plugin_class", type(p))
+            if not issubclass(plugin_class, arch.IMarkerSink):
+                p.deactivate()
+
+    def joinAll(self, deadline: float | None = None):
         """Join all plugin threads.
         This calls .join() on each plugin thread to ensure that they all exit at the end of the program.
+
+        :param deadline: The time.monotonic reading to stop waiting at, or
+        None to wait for as long as it takes.
+        :return: The plugins that were still running at the deadline.
         """
+        stragglers = []
         for p in self.plugins:
-            p.join()
+            if deadline is None:
+                p.join()
+            else:
+                p.join(max(0.0, deadline - monotonic()))
+            if p.is_alive():
+                stragglers.append(p)
+        return stragglers
+
+
+class Show(object):
+    """One of the shows a Gelo process is hosting.
+
+    Each show has its own time base, marker channels, and plugins. The
+    scheduler (or event loop), HTTP connection pools, and IRC connections
+    are shared by every show in the process.
+    """
+
+    def __init__(self, name: str, configuration, scheduler, event_loop):
+        """Set up a show, without starting its plugins.
+
+        :param name: The slug and episode number of the show.
+        :param configuration: The Gelo configuration.
+        :param scheduler: The Scheduler every show shares, if using threads.
+        :param event_loop: The EventLoopThread every show shares, if using
+        asyncio.
+        """
+        self.name = name
+        self.journal = None
+        self.recovered = None
+        journal_path = configuration.journal_path(name)
+        if journal_path != "":
+            self.journal = journal.Journal(journal_path)
+            self.recovered = self.journal.recover()
+        if event_loop is not None:
+            self.m = aio.AsyncMediator(
+                configuration.broadcast_delay, event_loop.loop, self.journal
+            )
+        else:
+            self.m = mediator.Mediator(
+                configuration.broadcast_delay,
+                scheduler,
+                journal=self.journal,
+                lanes=[
+                    arch.MarkerType.from_string(name) for name in configuration.lanes
+                ],
+            )
+        self.gpm = GeloPluginManager(
+            configuration, self.m, name, use_asyncio=event_loop is not None
+        )
+        self.bus = None
+        bus_path = configuration.bus_path(name)
+        if bus_path != "":
+            self.bus = bus.BusServer(self.m, bus_path)
+
+    def start(self):
+        """Start the show's plugins, and pick up where a crash left off."""
+        # Sources can publish as soon as they're running, so the time base
+        # has to be back first, and the pending markers can only be sent once
+        # the sinks are there to take them.
+        if self.recovered is not None:
+            self.m.restore_time_base(self.recovered)
+        if self.bus is not None:
+            self.bus.start()
+        self.gpm.runAll()
+        if self.recovered is not None:
+            self.m.redeliver(self.recovered)
 
 
 class Gelo(object):
+    def __init__(self):
+        """Create a Gelo with no shows yet. It can be shut down at any point,
+        even before it has started."""
+        self.l = logging.getLogger("gelo")
+        self.shutdown_timeout = 5.0
+        # When shutdown has to be done by, once it has started.
+        self.deadline = None
+        self.event_loop = None
+        self.scheduler = None
+        self.shows = {}
+        self.m = None
+        self.gpm = None
+
     def main(self, configuration):
         """Use the provided configuration to load all plugins and run Gelo."""
+        try:
+            self.start(configuration)
+            s = shell.GeloShell(self, self.gpm, self.m, configuration.macro_file)
+            s.cmdloop()
+        finally:
+            self.shutdown()
+            self.finish()
+
+    def start(self, configuration):
+        """Set up every show in the configuration, and start their plugins,
+        without the shell."""
         logging.basicConfig(
             filename=configuration.log_file,
             format="%(asctime)s %(levelname)-8s %(name)s:%(message)s",
         )
-        self.l = logging.getLogger("gelo")
         self.l.setLevel(configuration.log_level)
         self.l.info("Starting gelo at %s" % time())
-        self.m = mediator.Mediator(configuration.broadcast_delay)
-        self.gpm = GeloPluginManager(configuration, self.m, configuration.show)
+        self.shutdown_timeout = configuration.shutdown_timeout
+        if configuration.engine == "asyncio":
+            self.event_loop = aio.EventLoopThread()
+            self.event_loop.start()
+        else:
+            self.scheduler = shared_scheduler()
+        for name in configuration.shows:
+            self.l.info("Hosting %s" % name)
+            self.shows[name] = Show(
+                name, configuration, self.scheduler, self.event_loop
+            )
+        for show in self.shows.values():
+            show.start()
+        # The shell starts out controlling the first show.
+        first = self.shows[configuration.show]
+        self.m = first.m
+        self.gpm = first.gpm
 
-        self.gpm.runAll()
+    def remaining(self) -> float:
+        """Get the number of seconds left until the shutdown deadline."""
+        return max(0.0, self.deadline - monotonic())
 
-        s = shell.GeloShell(self, self.gpm, self.m, configuration.macro_file)
-        s.cmdloop()
+    def shutdown(self):
+        """Stop every show, within ``shutdown_timeout`` seconds of now.
 
-        self.gpm.joinAll()
+        Sources are stopped first, so nothing new is published. Markers still
+        waiting out the broadcast delay are then delivered right away, rather
+        than lost, and the sinks are told to finish up. Calling this again
+        does nothing.
+        """
+        if self.deadline is not None:
+            return
+        self.deadline = monotonic() + self.shutdown_timeout
+        self.l.info("Shutting down within %.1f s..." % self.shutdown_timeout)
+        for show in self.shows.values():
+            show.gpm.deactivateSources()
+        schedulers = {
+            id(show.m.scheduler): show.m.scheduler for show in self.shows.values()
+        }
+        for scheduler in schedulers.values():
+            left = scheduler.flush(self.remaining())
+            if left > 0:
+                self.l.warning("Abandoning %d delayed deliveries" % left)
+        for show in self.shows.values():
+            show.m.terminate()
+            show.gpm.deactivateAll()
 
-    def shutdown(self):
-        self.l.info("Shutting down...")
-        self.m.terminate()
-        self.gpm.deactivateAll()
+    def finish(self):
+        """Wait for the plugins to stop, until the shutdown deadline, and
+        release everything the shows share."""
+        for show in self.shows.values():
+            for p in show.gpm.joinAll(self.deadline):
+                self.l.warning(
+                    "%s didn't stop in time, abandoning it" % p.PLUGIN_MODULE_NAME
+                )
+        if self.event_loop is not None:
+            self.event_loop.stop(self.remaining())
+        if self.scheduler is not None:
+            self.scheduler.stop(self.remaining())
+        # Plugins may have started it even with the asyncio engine.
+        stop_shared_scheduler(self.remaining())
+        for show in self.shows.values():
+            if show.bus is not None:
+                show.bus.stop()
+            if show.journal is not None:
+                show.journal.close()
+        shared.close_http_sessions()
+        shared.close_poll_executor()
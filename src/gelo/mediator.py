@@ -1,11 +1,110 @@
 import gelo.arch
+import heapq
 import queue
+import bisect
 import logging
-from time import time
-from threading import Lock, Timer
+from collections import deque
+from time import perf_counter_ns
+from types import MappingProxyType
+from threading import Condition, Lock
+from gelo.arch import BackpressurePolicy
+from gelo.clock import MarkerClock
+from gelo.journal import Journal, RecoveredState
+from gelo.metrics import ChannelStats, LatencyHistogram
+from gelo.scheduler import Scheduler, on_scheduler_thread
 
 
 class ListenableQueue(queue.Queue):
+    """A queue of markers that can be listened to.
+
+    Every item is stored alongside the time it was put in the queue, so that
+    if the queue has ChannelStats, taking a marker out records how long it
+    waited.
+    """
+
+    def __init__(self, maxsize: int = 0, stats: ChannelStats | None = None):
+        """Create a new ListenableQueue.
+
+        :param maxsize: The most markers the queue holds, or 0 for no limit.
+        :param stats: Where to record dequeue timings, if anywhere.
+        """
+        super().__init__(maxsize)
+        self.stats = stats
+
+    def _put(self, item):
+        self.queue.append((perf_counter_ns(), item))
+
+    def _get(self):
+        enqueued_ns, item = self.queue.popleft()
+        if item is not None and self.stats is not None:
+            self.stats.record_dequeue(perf_counter_ns(), enqueued_ns, item)
+        return item
+
+    def discard(self, limit: int) -> int:
+        """Throw away the oldest markers without recording them as dequeued.
+
+        :param limit: The most markers to throw away.
+        :return: How many were thrown away.
+        """
+        with self.mutex:
+            discarded = 0
+            while discarded < limit and self.queue:
+                self.queue.popleft()
+                discarded += 1
+            if discarded:
+                self.not_full.notify(discarded)
+            return discarded
+
+    def put_many(self, items: list, drop_oldest: bool = True) -> int:
+        """Add several items at once, without waiting for room.
+
+        :param items: The items to add, oldest first.
+        :param drop_oldest: If there isn't room for everything, whether to
+        throw away the oldest items in the queue (True) or the newest of
+        ``items`` (False).
+        :return: How many items were thrown away.
+        """
+        with self.mutex:
+            if self.maxsize <= 0:
+                accepted = items
+            elif drop_oldest:
+                accepted = items[-self.maxsize :]
+            else:
+                accepted = items[: self.maxsize - self._qsize()]
+            dropped = len(items) - len(accepted)
+            for item in accepted:
+                self._put(item)
+            if self.maxsize > 0:
+                while self._qsize() > self.maxsize:
+                    self.queue.popleft()
+                    dropped += 1
+            self.unfinished_tasks += len(accepted)
+            if accepted:
+                self.not_empty.notify()
+            return dropped
+
+    def get_all(self, block=True, timeout=None) -> list:
+        """Remove and return every item in the queue, up to the end-of-stream
+        marker.
+
+        :param block: Whether to wait for an item if the queue is empty.
+        :param timeout: The most time to wait, in seconds.
+        :return: The items, oldest first. This is ``[None]`` if the first
+        item is the end-of-stream marker.
+        :raises queue.Empty: If there was nothing to get.
+        """
+        with self.not_empty:
+            if block:
+                self.not_empty.wait_for(self._qsize, timeout)
+            if not self._qsize():
+                raise queue.Empty()
+            items = [self._get()]
+            # Leave the end-of-stream marker for the next call.
+            while items[0] is not None and self.queue and self.queue[0][1] is not None:
+                items.append(self._get())
+            self.not_full.notify(len(items))
+            return items
+
     def listen(self, block=True, timeout=None):
         """Retrieve the next item from a queue."""
         while True:
@@ -17,25 +116,599 @@ class ListenableQueue(queue.Queue):
                 raise UnsubscribeException()
             yield data
 
+    def listen_batch(self, block=True, timeout=None):
+        """Retrieve every item that's waiting in the queue at once.
+
+        Each wake-up yields a list of all the markers that arrived since the
+        last one, so a sink can handle a burst with one piece of work.
+        """
+        while True:
+            try:
+                data = self.get_all(block=block, timeout=timeout)
+            except queue.Empty:
+                return
+            if data[0] is None:
+                raise UnsubscribeException()
+            yield data
+
+
+class LatestValueChannel(object):
+    """A single-slot mailbox that only ever holds the newest marker.
+
+    Publishing into a LatestValueChannel overwrites any marker the subscriber
+    hasn't read yet, so a sink that only cares about the current state (like
+    a now playing file) does one piece of work for a burst of markers, rather
+    than one per marker. It can be listened to just like a ListenableQueue.
+    """
+
+    def __init__(self, stats: ChannelStats | None = None):
+        """Create a new, empty LatestValueChannel.
+
+        :param stats: Where to record dequeue timings, if anywhere.
+        """
+        self._cv = Condition()
+        self._value = None
+        self._enqueued_ns = None
+        self._closed = False
+        self.stats = stats
+
+    def put(self, marker: gelo.arch.Marker) -> bool:
+        """Replace the value in the mailbox.
+
+        :param marker: The new value.
+        :return: True if an unread value was overwritten.
+        """
+        with self._cv:
+            overwritten = self._value is not None
+            self._value = marker
+            self._enqueued_ns = perf_counter_ns()
+            self._cv.notify()
+        return overwritten
+
+    def close(self) -> None:
+        """Tell listeners to unsubscribe, once they've read the last value."""
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    def empty(self) -> bool:
+        """Check whether there is an unread value."""
+        return self._value is None
+
+    def qsize(self) -> int:
+        """Get the number of unread values, which is either 0 or 1."""
+        return 0 if self._value is None else 1
+
+    def listen(self, block=True, timeout=None):
+        """Retrieve the newest value from the mailbox."""
+        while True:
+            with self._cv:
+                if block:
+                    self._cv.wait_for(
+                        lambda: self._value is not None or self._closed, timeout
+                    )
+                data = self._value
+                self._value = None
+                closed = self._closed
+                enqueued_ns = self._enqueued_ns
+            if data is None:
+                if closed:
+                    raise UnsubscribeException()
+                return
+            if self.stats is not None:
+                self.stats.record_dequeue(perf_counter_ns(), enqueued_ns, data)
+            yield data
+
+    def listen_batch(self, block=True, timeout=None):
+        """Retrieve the newest value, as a batch of one."""
+        for data in self.listen(block, timeout):
+            yield [data]
+
+
+class MarkerRing(object):
+    """A bounded ring of published markers, each with a sequence number.
+
+    Every subscriber reading from the ring does so through its own
+    RingCursor, so a marker is stored once however many subscribers there
+    are, and memory stays bounded by the ring's size. Once the ring is full,
+    each new marker overwrites the oldest one; a cursor that hadn't read it
+    yet skips ahead, which is the DROP_OLDEST policy.
+    """
+
+    def __init__(self, size: int):
+        """Create a new, empty MarkerRing.
+
+        :param size: The most markers the ring holds.
+        """
+        self.size = size
+        # Entries are (marker type, marker, enqueued_ns), at seq % size.
+        self.entries = [None] * size
+        self.next_seq = 0
+        self.lock = Lock()
+
+    @property
+    def oldest_seq(self) -> int:
+        """The sequence number of the oldest marker still in the ring."""
+        return max(0, self.next_seq - self.size)
+
+    def append(
+        self, markers: list[tuple[gelo.arch.MarkerType, gelo.arch.Marker]]
+    ) -> int:
+        """Add markers to the ring. The cursors that want them are told by
+        the Mediator.
+
+        :param markers: The MarkerType and Marker of each marker, in order.
+        :return: The sequence number of the first marker.
+        """
+        now = perf_counter_ns()
+        with self.lock:
+            first = self.next_seq
+            for marker_type, marker in markers:
+                self.entries[self.next_seq % self.size] = (marker_type, marker, now)
+                self.next_seq += 1
+        return first
+
+
+class RingCursor(object):
+    """A subscriber's position in a MarkerRing.
+
+    It can be listened to just like a ListenableQueue. The Mediator checks
+    each marker's type and the subscriber's filter as it's published, and
+    only hands the cursor the sequence numbers of the markers that pass, so
+    the subscriber is never woken for a marker it doesn't want. Wanted
+    markers that were overwritten before the subscriber got to them count as
+    dropped.
+
+    With priority lanes, the cursor takes every marker waiting in the ring at
+    once and hands them out in lane order, so a burst of low-priority markers
+    doesn't hold up a high-priority one published after it. Within a lane,
+    markers keep the order they were published in.
+    """
+
+    def __init__(
+        self,
+        ring: MarkerRing,
+        marker_types: gelo.arch.MarkerTypeList,
+        stats: ChannelStats | None = None,
+        lanes: dict | None = None,
+    ):
+        """Create a new RingCursor, starting with the next marker published.
+
+        :param ring: The ring to read from.
+        :param marker_types: The MarkerTypes to read.
+        :param stats: Where to record dequeue timings and drops, if anywhere.
+        :param lanes: The priority of each MarkerType, where 0 is the highest,
+        or None to read markers in the order they were published.
+        """
+        self.ring = ring
+        self.marker_types = frozenset(marker_types)
+        self.stats = stats
+        self.lanes = lanes
+        self.cv = Condition()
+        # The sequence numbers of the wanted markers not read yet, in order.
+        self.wanted = deque()
+        # With lanes, the markers read from the ring but not handed out yet,
+        # as a heap of (priority, seq, marker type, marker, enqueued_ns).
+        self.held = []
+        # The sequence number after the last marker read.
+        with ring.lock:
+            self.position = ring.next_seq
+        self.closed = False
+
+    def want(self, seqs: list[int]) -> None:
+        """Hand the cursor markers its subscriber wants, waking it.
+
+        :param seqs: The markers' sequence numbers in the ring.
+        """
+        with self.cv:
+            for seq in seqs:
+                if not self.wanted or seq > self.wanted[-1]:
+                    self.wanted.append(seq)
+                    continue
+                # Markers published at once from several threads can be
+                # handed over out of order.
+                i = bisect.bisect_left(self.wanted, seq)
+                if i == len(self.wanted) or self.wanted[i] != seq:
+                    self.wanted.insert(i, seq)
+            self.cv.notify()
+
+    def catch_up(self, since: int, accepts) -> None:
+        """Hand the cursor the markers already in the ring that its
+        subscriber wants, from ``since`` on.
+
+        :param since: The sequence number to start from. If it has been
+        overwritten already, the overwritten markers count as dropped.
+        :param accepts: What to check each marker of a wanted type with.
+        """
+        ring = self.ring
+        since = max(since, 0)
+        with ring.lock:
+            oldest = ring.oldest_seq
+            entries = [
+                (seq, ring.entries[seq % ring.size])
+                for seq in range(max(since, oldest), ring.next_seq)
+            ]
+        if since < oldest and self.stats is not None:
+            self.stats.dropped += oldest - since
+        self.want(
+            [
+                seq
+                for seq, (marker_type, marker, _) in entries
+                if marker_type in self.marker_types and accepts(marker)
+            ]
+        )
+
+    def close(self) -> None:
+        """Tell listeners to unsubscribe, once they've read the markers they
+        were handed before now."""
+        with self.cv:
+            self.closed = True
+            self.cv.notify_all()
+
+    def qsize(self) -> int:
+        """Get the number of wanted markers in the ring that haven't been read
+        yet."""
+        oldest = self.ring.oldest_seq
+        with self.cv:
+            unread = len(self.wanted) - bisect.bisect_left(self.wanted, oldest)
+            return unread + len(self.held)
+
+    def empty(self) -> bool:
+        """Check whether there are wanted markers in the ring that haven't
+        been read yet."""
+        return self.qsize() == 0
+
+    def _read(self, limit: int | None) -> list[gelo.arch.Marker]:
+        """Read up to ``limit`` wanted markers, moving the cursor along. Call
+        with the cursor's lock held."""
+        now = perf_counter_ns()
+        markers = []
+        if self.lanes is None:
+            for _, marker_type, marker, enqueued_ns in self._advance(limit):
+                if self.stats is not None:
+                    self.stats.record_dequeue(now, enqueued_ns, marker, marker_type)
+                markers.append(marker)
+            return markers
+        lowest = len(self.lanes)
+        for seq, marker_type, marker, enqueued_ns in self._advance(None):
+            priority = self.lanes.get(marker_type, lowest)
+            heapq.heappush(self.held, (priority, seq, marker_type, marker, enqueued_ns))
+        while self.held and (limit is None or len(markers) < limit):
+            _, _, marker_type, marker, enqueued_ns = heapq.heappop(self.held)
+            if self.stats is not None:
+                self.stats.record_dequeue(now, enqueued_ns, marker, marker_type)
+            markers.append(marker)
+        return markers
+
+    def _advance(self, limit: int | None) -> list[tuple]:
+        """Take up to ``limit`` wanted markers out of the ring, as (seq,
+        marker type, marker, enqueued_ns). Call with the cursor's lock
+        held."""
+        seqs = []
+        while self.wanted and (limit is None or len(seqs) < limit):
+            seqs.append(self.wanted.popleft())
+        if not seqs:
+            return []
+        self.position = seqs[-1] + 1
+        ring = self.ring
+        with ring.lock:
+            oldest = ring.oldest_seq
+            taken = [
+                (seq, *ring.entries[seq % ring.size]) for seq in seqs if seq >= oldest
+            ]
+        if self.stats is not None:
+            self.stats.dropped += len(seqs) - len(taken)
+        return taken
+
+    def _take(self, limit, block, timeout) -> list[gelo.arch.Marker] | None:
+        """Wait for wanted markers and read them.
+
+        :return: The markers, or None if the cursor is closed and has read
+        everything. The list is empty if the wait timed out.
+        """
+        deadline = None if timeout is None else perf_counter_ns() + timeout * 1e9
+        with self.cv:
+            while True:
+                markers = self._read(limit)
+                if markers:
+                    return markers
+                if self.wanted:
+                    # Everything taken had been overwritten; try again.
+                    continue
+                if self.closed:
+                    return None
+                if not block:
+                    return []
+                remaining = None
+                if deadline is not None:
+                    remaining = (deadline - perf_counter_ns()) / 1e9
+                    if remaining <= 0:
+                        return []
+                self.cv.wait_for(
+                    lambda: self.held or self.wanted or self.closed, remaining
+                )
+
+    def listen(self, block=True, timeout=None):
+        """Retrieve the next marker from the ring."""
+        while True:
+            markers = self._take(1, block, timeout)
+            if markers is None:
+                raise UnsubscribeException()
+            if not markers:
+                return
+            yield markers[0]
+
+    def listen_batch(self, block=True, timeout=None):
+        """Retrieve every marker waiting in the ring at once."""
+        while True:
+            markers = self._take(None, block, timeout)
+            if markers is None:
+                raise UnsubscribeException()
+            if not markers:
+                return
+            yield markers
+
+
+class Subscription(object):
+    """Everything the Mediator knows about one subscriber."""
+
+    def __init__(
+        self,
+        name: str,
+        marker_types: gelo.arch.MarkerTypeList,
+        delayed: bool,
+        channel: ListenableQueue | LatestValueChannel,
+        policy: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+        block_timeout: float = 1.0,
+        stats: ChannelStats | None = None,
+        marker_filter: gelo.arch.MarkerFilter | None = None,
+    ):
+        """Create a new Subscription.
+
+        :param name: The class name of the subscriber.
+        :param marker_types: The MarkerTypes the subscriber wants.
+        :param delayed: Whether the subscriber gets markers after the
+        broadcast delay.
+        :param channel: The queue that markers are delivered to. This must be
+        a LatestValueChannel if ``policy`` is COALESCE. A RingCursor is only
+        handed the sequence numbers of markers in the Mediator's ring.
+        :param policy: What to do when ``channel`` is full.
+        :param block_timeout: How long the BLOCK policy waits for room. It
+        never waits for delayed subscribers, or on a scheduler thread.
+        :param stats: The ChannelStats ``channel`` records into. If not
+        provided, a new one is created.
+        :param marker_filter: Conditions markers must meet to be delivered.
+        """
+        self.name = name
+        self.marker_types = tuple(marker_types)
+        self.delayed = delayed
+        self.channel = channel
+        self.policy = policy
+        self.block_timeout = block_timeout
+        # The counters are only written by whichever thread is publishing, so
+        # they're approximate if several threads publish at once.
+        self.stats = stats if stats is not None else ChannelStats()
+        self.marker_filter = marker_filter
+
+    def accepts(self, marker: gelo.arch.Marker) -> bool:
+        """Check a marker against the subscription's filter, if any."""
+        if self.marker_filter is None:
+            return True
+        now_ns = marker.published_ns
+        if now_ns is None:
+            now_ns = perf_counter_ns()
+        if self.marker_filter.accepts(marker, now_ns):
+            return True
+        self.stats.filtered += 1
+        return False
+
+    def offer(self, marker: gelo.arch.Marker, seq: int | None = None) -> None:
+        """Deliver a marker to the channel, applying the backpressure policy.
+
+        :param marker: The marker to deliver.
+        :param seq: The marker's sequence number in the ring, for a
+        RingCursor.
+        """
+        if not self.accepts(marker):
+            return
+        if isinstance(self.channel, RingCursor):
+            self.channel.want([seq])
+            self.stats.record_enqueue(perf_counter_ns(), self.channel.qsize())
+            return
+        self._offer(marker)
+
+    def _offer(self, marker: gelo.arch.Marker) -> None:
+        """Deliver a marker that has passed the filter."""
+        q = self.channel
+        policy = self.policy
+        stats = self.stats
+        if policy is BackpressurePolicy.COALESCE:
+            if q.put(marker):
+                stats.dropped += 1
+        elif policy is BackpressurePolicy.BLOCK:
+            # Delayed markers are delivered on the scheduler thread, which
+            # every show shares, as is anything published by periodic work,
+            # so rather than wait there for room the new marker is dropped,
+            # as with DROP_NEWEST.
+            wait = not self.delayed and not on_scheduler_thread()
+            try:
+                q.put(marker, block=wait, timeout=self.block_timeout)
+            except queue.Full:
+                stats.dropped += 1
+                if not wait:
+                    stats.unblocked += 1
+                return
+        else:
+            while True:
+                try:
+                    q.put(marker, block=False)
+                    break
+                except queue.Full:
+                    if policy is BackpressurePolicy.DROP_NEWEST:
+                        stats.dropped += 1
+                        return
+                    stats.dropped += q.discard(1)
+        stats.record_enqueue(perf_counter_ns(), q.qsize())
+
+    def offer_many(
+        self, markers: list[gelo.arch.Marker], seqs: list[int] | None = None
+    ) -> None:
+        """Deliver several markers to the channel at once.
+
+        :param markers: The markers to deliver, oldest first.
+        :param seqs: The markers' sequence numbers in the ring, for a
+        RingCursor.
+        """
+        if isinstance(self.channel, RingCursor):
+            seqs = [seq for seq, m in zip(seqs, markers) if self.accepts(m)]
+            if not seqs:
+                return
+            self.channel.want(seqs)
+            self.stats.record_enqueue(
+                perf_counter_ns(), self.channel.qsize(), len(seqs)
+            )
+            return
+        if self.marker_filter is not None:
+            markers = [marker for marker in markers if self.accepts(marker)]
+            if not markers:
+                return
+        q = self.channel
+        policy = self.policy
+        stats = self.stats
+        if policy is BackpressurePolicy.COALESCE:
+            # Only the newest one would survive anyway.
+            stats.dropped += len(markers) - 1
+            self._offer(markers[-1])
+            return
+        if policy is BackpressurePolicy.BLOCK or not hasattr(q, "put_many"):
+            for marker in markers:
+                self._offer(marker)
+            return
+        dropped = q.put_many(markers, policy is BackpressurePolicy.DROP_OLDEST)
+        stats.dropped += dropped
+        stats.record_enqueue(perf_counter_ns(), q.qsize(), len(markers) - dropped)
+
+    def close(self) -> None:
+        """Send the end-of-stream marker, making room for it if necessary."""
+        if isinstance(self.channel, (LatestValueChannel, RingCursor)):
+            self.channel.close()
+            return
+        while True:
+            try:
+                self.channel.put(None, block=False)
+                return
+            except queue.Full:
+                self.channel.discard(1)
+
+    def __repr__(self):
+        return "Subscription(%s, %s, delayed=%s, policy=%s, filter=%s)" % (
+            self.name,
+            self.marker_types,
+            self.delayed,
+            self.policy.name,
+            self.marker_filter,
+        )
+
+
+# An empty channel table, shared so that a lookup of a MarkerType nobody has
+# subscribed to doesn't allocate anything.
+EMPTY_CHANNEL_TABLE = MappingProxyType({})
+
 
 class Mediator(gelo.arch.IMediator):
-    """Accept from IMarkerSources and relay to IMarkerSinks."""
+    """Accept from IMarkerSources and relay to IMarkerSinks.
+
+    The channel tables (``instant_channels`` and ``delayed_channels``) are
+    immutable snapshots mapping each MarkerType to a tuple of Subscriptions.
+    ``subscribe`` and ``unsubscribe`` build a new snapshot under
+    ``subscriber_lock`` and then swap it in with a single assignment, so
+    ``publish`` can read whichever snapshot is current without taking any
+    locks, and never sees a half-updated table.
+
+    Published markers are kept in two MarkerRings, one for each path, holding
+    the last ``RING_SIZE`` markers. Subscribers using the DROP_OLDEST policy
+    (the default) get a RingCursor into one of them rather than a queue of
+    their own, and can ask to start from any sequence number still in the
+    ring, to catch up on markers published before they subscribed. A
+    subscriber that unsubscribes and subscribes again under the same name
+    picks up where it left off.
+
+    Subscribers using the other policies get a queue that holds at most
+    ``QUEUE_MAX`` markers. What happens to markers beyond that is up to the
+    subscriber's BackpressurePolicy; the number of markers dropped is counted
+    on its Subscription. Subscribers using the COALESCE policy get a
+    LatestValueChannel instead of a queue.
+
+    Ring subscribers can be given priority lanes, ranking MarkerTypes so each
+    subscriber is handed the markers of higher-priority types first when
+    several are waiting. Without lanes, markers are handed out in the order
+    they were published.
+
+    Every Subscription has ChannelStats, recording queue depth and how long
+    markers take to reach the subscriber; ``metrics`` gathers them all up,
+    along with latency histograms for the instant and delayed paths, and for
+    each MarkerType.
+    """
 
     QUEUE_MAX = 100
+    RING_SIZE = 1024
+    # Whether DROP_OLDEST subscribers read from the rings.
+    RING_CURSORS = True
+
+    def __init__(
+        self,
+        broadcast_delay: float,
+        scheduler: Scheduler | None = None,
+        clock: MarkerClock | None = None,
+        journal: Journal | None = None,
+        ring_size: int | None = None,
+        lanes: gelo.arch.MarkerTypeList | None = None,
+    ):
+        """Create a new instance of this Mediator.
 
-    def __init__(self, broadcast_delay: float):
-        """Create a new instance of this Mediator."""
+        :param broadcast_delay: How long to wait before sending markers to
+        delayed subscribers.
+        :param scheduler: The Scheduler to run delayed deliveries on. If not
+        provided, the Mediator creates its own.
+        :param clock: The MarkerClock to time markers with. If not provided,
+        the Mediator creates its own.
+        :param journal: The Journal to record published markers in, if any.
+        :param ring_size: How many markers each ring keeps. If not provided,
+        it's ``RING_SIZE``.
+        :param lanes: MarkerTypes in priority order, highest first. Types not
+        listed come after all of them. If not provided, there are no lanes.
+        """
         super().__init__()
-        self.instant_channels = {}
-        self.delayed_channels = {}
-        self.subscriber_map = {}
-        self.instant_channel_lock = Lock()
-        self.delayed_channel_lock = Lock()
+        self.instant_channels = EMPTY_CHANNEL_TABLE
+        self.delayed_channels = EMPTY_CHANNEL_TABLE
+        self.subscriber_map = MappingProxyType({})
         self.subscriber_lock = Lock()
-        self.first_time = None
+        self.clock = clock if clock is not None else MarkerClock()
+        # The MarkerClock reading of the first marker, which every marker's
+        # time is measured from.
+        self.first_ns = None
+        self.journal = journal
         self.shouldSquelchNext = False
         self.stopped = False
         self.broadcast_delay = broadcast_delay
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.instant_latency = LatencyHistogram()
+        self.delayed_latency = LatencyHistogram()
+        self.lanes = None
+        if lanes:
+            self.lanes = {marker_type: i for i, marker_type in enumerate(lanes)}
+        self.lane_latency = {
+            marker_type: LatencyHistogram() for marker_type in gelo.arch.MarkerType
+        }
+        ring_size = ring_size if ring_size is not None else self.RING_SIZE
+        self.instant_ring = MarkerRing(ring_size)
+        self.delayed_ring = MarkerRing(ring_size)
+        # Statistics registered by plugins, keyed by name.
+        self.plugin_stats = MappingProxyType({})
+        # The cursors of ring subscribers that have unsubscribed, keyed by
+        # name, so they can pick up where they got to if they come back.
+        self.departed_cursors = {}
         self.log = logging.getLogger("gelo.mediator")
 
     def publish(
@@ -56,58 +729,276 @@ class Mediator(gelo.arch.IMediator):
         if self.stopped:
             self.log.debug("Ignoring marker because stopped")
             return
-        if self.first_time is None:
-            t = time()
-            self.log.debug("First time is none. Setting to %s" % t)
-            self.first_time = t
-        event.time = time() - self.first_time
-        delay = Timer(self.broadcast_delay, self._publish, args=[event_type, event])
-        delay.start()
+        now = self.clock.now_ns()
+        if self.first_ns is None:
+            self.log.debug("First time is none. Setting to %s" % now)
+            self.first_ns = now
+            if self.journal is not None:
+                self.journal.append_anchor(self.clock.to_wall_ns(now))
+        event = event.replace(
+            time_ns=now - self.first_ns, published_ns=perf_counter_ns()
+        )
+        seq = None
+        if self.journal is not None:
+            seq = self.journal.append_publish(
+                event_type, event, self.clock.to_wall_ns(now)
+            )
+        self.scheduler.schedule(
+            self.broadcast_delay, self._publish, event_type, event, seq
+        )
         self.log.info("Broadcast delay started.")
-        if event_type not in self.instant_channels:
-            self.instant_channel_lock.acquire()
-            if event_type not in self.instant_channels:
-                self.instant_channels[event_type] = []
-            self.instant_channel_lock.release()
         self.log.debug("Pushing marker to instant queues for %s" % event_type)
-        for q in self.instant_channels[event_type]:
-            if q.qsize() > self.QUEUE_MAX:
-                q.put(None, block=False)
-                continue
-            q.put(event, block=False)
+        ring_seq = self._append_ring(self.instant_ring, [(event_type, event)])
+        self._fan_out(self.instant_channels, event_type, event, ring_seq)
+
+    def publish_many(
+        self, markers: list[tuple[gelo.arch.MarkerType, gelo.arch.Marker]]
+    ) -> None:
+        """Publish several markers at once, in order.
+
+        The markers all get the same time, and are delivered to each
+        subscriber in one go, which costs much less than publishing them one
+        at a time. A squelch only swallows the first marker.
+
+        :param markers: The MarkerType and Marker of each marker to publish.
+        """
+        for marker_type, marker in markers:
+            if not marker_type or not marker:
+                raise ValueError()
+        self.log.info("Received %d new markers" % len(markers))
+        if self.shouldSquelchNext and markers:
+            self.log.debug("Ignoring first marker because squelch")
+            self.shouldSquelchNext = False
+            markers = markers[1:]
+        if self.stopped:
+            self.log.debug("Ignoring markers because stopped")
+            return
+        if not markers:
+            return
+        now = self.clock.now_ns()
+        if self.first_ns is None:
+            self.log.debug("First time is none. Setting to %s" % now)
+            self.first_ns = now
+            if self.journal is not None:
+                self.journal.append_anchor(self.clock.to_wall_ns(now))
+        published_ns = perf_counter_ns()
+        seqs = None
+        if self.journal is not None:
+            wall_ns = self.clock.to_wall_ns(now)
+            seqs = []
+        markers = [
+            (
+                marker_type,
+                marker.replace(time_ns=now - self.first_ns, published_ns=published_ns),
+            )
+            for marker_type, marker in markers
+        ]
+        for marker_type, marker in markers:
+            if seqs is not None:
+                seqs.append(self.journal.append_publish(marker_type, marker, wall_ns))
+        self.scheduler.schedule(self.broadcast_delay, self._publish_many, markers, seqs)
+        self.log.debug("Pushing %d markers to instant queues" % len(markers))
+        ring_seq = self._append_ring(self.instant_ring, markers)
+        self._fan_out_many(self.instant_channels, markers, ring_seq)
+
+    @property
+    def first_time(self) -> float | None:
+        """The wall-clock time of the first marker, in seconds since the epoch.
+
+        Setting this moves the time base, so that marker times continue from
+        an earlier run.
+        """
+        if self.first_ns is None:
+            return None
+        return self.clock.to_wall_ns(self.first_ns) / 1e9
+
+    @first_time.setter
+    def first_time(self, seconds: float | None):
+        if seconds is None:
+            self.first_ns = None
+        else:
+            self.first_ns = self.clock.from_wall_ns(round(seconds * 1e9))
+            if self.journal is not None:
+                self.journal.append_anchor(round(seconds * 1e9))
+
+    def marker_time(self) -> float | None:
+        """Get the time a marker published now would be given.
+
+        :return: Seconds since the first marker, or None if there hasn't been
+        one yet (nor a time base recovered from a journal).
+        """
+        if self.first_ns is None:
+            return None
+        return (self.clock.now_ns() - self.first_ns) / 1e9
 
     def _publish(
-        self, marker_type: gelo.arch.MarkerType, marker: gelo.arch.Marker
+        self,
+        marker_type: gelo.arch.MarkerType,
+        marker: gelo.arch.Marker,
+        seq: int | None = None,
     ) -> None:
         """Publish markers to delayed subscribers.
 
-        This is designed to be called by a threading.Timer, so that the
+        This is designed to be called by the Scheduler, so that the
         actual marker output occurs somewhat in-line with the actual broadcast.
 
         :param marker_type: The EventType corresponding to this marker.
         :param marker: The Marker to publish.
+        :param seq: The marker's journal sequence number, if it has one.
         """
-        if marker_type not in self.delayed_channels:
-            self.delayed_channel_lock.acquire()
-            if marker_type not in self.delayed_channels:
-                self.delayed_channels[marker_type] = []
-            self.delayed_channel_lock.release()
         self.log.debug("Pushing marker to delayed queues for %s" % marker_type)
-        for q in self.delayed_channels[marker_type]:
-            if q.qsize() > self.QUEUE_MAX:
-                q.put(None, block=False)
-                continue
-            q.put(marker, block=False)
+        ring_seq = self._append_ring(self.delayed_ring, [(marker_type, marker)])
+        self._fan_out(self.delayed_channels, marker_type, marker, ring_seq)
+        if seq is not None:
+            self.journal.append_delivered(seq)
+
+    def _publish_many(
+        self,
+        markers: list[tuple[gelo.arch.MarkerType, gelo.arch.Marker]],
+        seqs: list[int] | None = None,
+    ) -> None:
+        """Publish a batch of markers to delayed subscribers.
+
+        :param markers: The MarkerType and Marker of each marker.
+        :param seqs: The markers' journal sequence numbers, if they have them.
+        """
+        self.log.debug("Pushing %d markers to delayed queues" % len(markers))
+        ring_seq = self._append_ring(self.delayed_ring, markers)
+        self._fan_out_many(self.delayed_channels, markers, ring_seq)
+        if seqs is not None:
+            for seq in seqs:
+                self.journal.append_delivered(seq)
+
+    def recover(self, state: RecoveredState) -> None:
+        """Pick up where a crashed run left off, all at once.
+
+        Sources may publish as soon as they start, so when plugins are
+        running, call restore_time_base before starting them and redeliver
+        after, instead.
+
+        :param state: What the journal recovered from the previous run.
+        """
+        self.restore_time_base(state)
+        self.redeliver(state)
+
+    def restore_time_base(self, state: RecoveredState) -> None:
+        """Restore the time base, so marker times continue from the previous
+        run. Call it before anything can publish, or the first marker starts
+        a new time base of its own.
+
+        :param state: What the journal recovered from the previous run.
+        """
+        if state.first_wall_ns is not None:
+            self.first_ns = self.clock.from_wall_ns(state.first_wall_ns)
+            self.log.info("Restored first time to %s" % self.first_time)
+
+    def redeliver(self, state: RecoveredState) -> None:
+        """Schedule delivery of the markers that were still waiting out the
+        broadcast delay when the previous run crashed. Call it after the
+        plugins have subscribed.
+
+        :param state: What the journal recovered from the previous run.
+        """
+        delay_ns = int(self.broadcast_delay * 1e9)
+        now_wall_ns = self.clock.to_wall_ns(self.clock.now_ns())
+        for p in state.pending:
+            marker = p.marker.replace(
+                published_ns=perf_counter_ns() - (now_wall_ns - p.published_wall_ns)
+            )
+            remaining = (p.published_wall_ns + delay_ns - now_wall_ns) / 1e9
+            self.log.info(
+                "Redelivering %s to delayed queues in %.3f s"
+                % (marker, max(remaining, 0))
+            )
+            self.scheduler.schedule(
+                max(remaining, 0), self._publish, p.marker_type, marker, p.seq
+            )
+
+    def _append_ring(
+        self,
+        ring: MarkerRing,
+        markers: list[tuple[gelo.arch.MarkerType, gelo.arch.Marker]],
+    ) -> int | None:
+        """Add markers to a ring, if subscribers read from rings.
+
+        :param ring: The instant or delayed ring.
+        :param markers: The MarkerType and Marker of each marker.
+        :return: The sequence number of the first marker, or None if there
+        are no rings.
+        """
+        if self.RING_CURSORS:
+            return ring.append(markers)
+        return None
+
+    def _fan_out(
+        self,
+        table: MappingProxyType,
+        marker_type: gelo.arch.MarkerType,
+        marker: gelo.arch.Marker,
+        seq: int | None = None,
+    ) -> None:
+        """Offer a marker to every subscription for its type in ``table``.
+
+        :param table: The channel table snapshot to deliver from.
+        :param marker_type: The MarkerType of the marker.
+        :param marker: The marker to deliver.
+        :param seq: The marker's sequence number in the ring, if it's in one.
+        """
+        for sub in table.get(marker_type, ()):
+            sub.offer(marker, seq)
+
+    def _fan_out_many(
+        self,
+        table: MappingProxyType,
+        markers: list[tuple[gelo.arch.MarkerType, gelo.arch.Marker]],
+        first_seq: int | None = None,
+    ) -> None:
+        """Offer a batch of markers to the subscriptions in ``table``, handing
+        each subscription all of its markers at once.
+
+        :param table: The channel table snapshot to deliver from.
+        :param markers: The MarkerType and Marker of each marker.
+        :param first_seq: The first marker's sequence number in the ring, if
+        they're in one.
+        """
+        batches = {}
+        for i, (marker_type, marker) in enumerate(markers):
+            seq = None if first_seq is None else first_seq + i
+            for sub in table.get(marker_type, ()):
+                batch = batches.setdefault(sub, ([], []))
+                batch[0].append(marker)
+                batch[1].append(seq)
+        for sub, (batch, seqs) in batches.items():
+            sub.offer_many(batch, seqs)
 
     def subscribe(
-        self, event_types: gelo.arch.MarkerTypeList, subscriber: str, delayed=False
-    ) -> ListenableQueue:
+        self,
+        event_types: gelo.arch.MarkerTypeList,
+        subscriber: str,
+        delayed=False,
+        policy: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+        block_timeout: float = 1.0,
+        marker_filter: gelo.arch.MarkerFilter | None = None,
+        since: int | None = None,
+    ) -> ListenableQueue | LatestValueChannel | RingCursor:
         """Subscribe to all of the listed event types.
         :param marker_types: A list of MarkerType types to subscribe to.
         :param subscriber: The class name of the subscriber.
         :param delayed: Whether this subscriber should get markers as soon as
         they are published, or after the configured broadcast delay.
-        :return: A queue of markers
+        :param policy: What to do with markers when the subscriber's queue
+        is full.
+        :param block_timeout: How long the BLOCK policy waits for room before
+        dropping a marker.
+        :param marker_filter: Conditions markers must meet to be delivered.
+        They're checked before markers are queued, so the subscriber is never
+        woken for markers that don't meet them.
+        :param since: For DROP_OLDEST subscribers, the sequence number in the
+        ring to start from; 0 starts with the oldest marker still there. If
+        not provided, a subscriber that has subscribed before starts where it
+        left off, and a new one starts with the next marker published.
+        :return: A RingCursor if ``policy`` is DROP_OLDEST, a
+        LatestValueChannel if it's COALESCE, or else a queue of markers.
         """
         if not event_types:
             raise ValueError()
@@ -116,42 +1007,98 @@ class Mediator(gelo.arch.IMediator):
         if not subscriber:
             raise ValueError()
         self.log.info("New subscriber to %s: %s" % (event_types, subscriber))
-        q = ListenableQueue()
+        lane = event_types[0] if len(event_types) == 1 else None
         if delayed:
-            for marker_type in event_types:
-                if marker_type not in self.delayed_channels:
-                    self.delayed_channel_lock.acquire()
-                    if marker_type not in self.delayed_channels:
-                        self.delayed_channels[marker_type] = []
-                    self.delayed_channel_lock.release()
-                self.delayed_channels[marker_type].append(q)
+            stats = ChannelStats(
+                int(self.broadcast_delay * 1e9),
+                self.delayed_latency,
+                self.lane_latency,
+                lane,
+            )
         else:
-            for marker_type in event_types:
-                if marker_type not in self.instant_channels:
-                    self.instant_channel_lock.acquire()
-                    if marker_type not in self.instant_channels:
-                        self.instant_channels[marker_type] = []
-                    self.instant_channel_lock.release()
-                self.instant_channels[marker_type].append(q)
-        self.subscriber_lock.acquire()
-        self.subscriber_map[subscriber] = q
-        self.subscriber_lock.release()
+            stats = ChannelStats(0, self.instant_latency, self.lane_latency, lane)
+        with self.subscriber_lock:
+            if policy is BackpressurePolicy.DROP_OLDEST and self.RING_CURSORS:
+                ring = self.delayed_ring if delayed else self.instant_ring
+                departed = self.departed_cursors.pop(subscriber, None)
+                if since is None and departed is not None:
+                    since = departed.position
+                q = RingCursor(ring, event_types, stats, self.lanes)
+            else:
+                q = self._make_channel(policy, stats)
+            sub = Subscription(
+                subscriber,
+                event_types,
+                delayed,
+                q,
+                policy,
+                block_timeout,
+                stats,
+                marker_filter,
+            )
+            subscribers = dict(self.subscriber_map)
+            subscribers[subscriber] = sub
+            self._swap_tables(subscribers)
+            if since is not None and isinstance(q, RingCursor):
+                # Markers published from now on are handed over as they're
+                # published; those from before are picked out of the ring.
+                q.catch_up(since, sub.accepts)
         return q
 
+    def _make_channel(
+        self, policy: BackpressurePolicy, stats: ChannelStats
+    ) -> ListenableQueue | LatestValueChannel:
+        """Create the channel a new subscriber will listen to.
+
+        :param policy: The subscriber's backpressure policy.
+        :param stats: The subscriber's ChannelStats.
+        :return: A LatestValueChannel for COALESCE, otherwise a bounded
+        ListenableQueue.
+        """
+        if policy is BackpressurePolicy.COALESCE:
+            return LatestValueChannel(stats)
+        return ListenableQueue(self.QUEUE_MAX, stats)
+
+    def unsubscribe(self, subscriber: str) -> None:
+        """Stop delivering markers to a subscriber, and close its queue.
+
+        :param subscriber: The class name of the subscriber to remove.
+        """
+        with self.subscriber_lock:
+            subscribers = dict(self.subscriber_map)
+            sub = subscribers.pop(subscriber, None)
+            if sub is None:
+                return
+            self._swap_tables(subscribers)
+            if isinstance(sub.channel, RingCursor):
+                self.departed_cursors[subscriber] = sub.channel
+        self.log.info("Removed subscriber: %s" % subscriber)
+        sub.close()
+
+    def _swap_tables(self, subscribers: dict) -> None:
+        """Build new channel table snapshots and swap them in.
+
+        The caller must hold ``subscriber_lock``.
+
+        :param subscribers: The new mapping of subscriber name to Subscription.
+        """
+        instant = {}
+        delayed = {}
+        for sub in subscribers.values():
+            table = delayed if sub.delayed else instant
+            for marker_type in sub.marker_types:
+                table[marker_type] = table.get(marker_type, ()) + (sub,)
+        self.instant_channels = MappingProxyType(instant)
+        self.delayed_channels = MappingProxyType(delayed)
+        self.subscriber_map = MappingProxyType(subscribers)
+
     def terminate(self):
         """Close all of the queues so the plugins can terminate."""
-        self.instant_channel_lock.acquire()
-        for channel in self.instant_channels:
-            self.log.info("Terminating instant channel %s" % channel)
-            for q in self.instant_channels[channel]:
-                q.put(None, block=False)
-        self.instant_channel_lock.release()
-        self.delayed_channel_lock.acquire()
-        for channel in self.delayed_channels:
-            self.log.info("Terminating delayed channel %s" % channel)
-            for q in self.delayed_channels[channel]:
-                q.put(None, block=False)
-        self.delayed_channel_lock.release()
+        if self.owns_scheduler:
+            self.scheduler.stop()
+        for sub in self.subscriber_map.values():
+            self.log.info("Terminating channel for %s" % sub.name)
+            sub.close()
 
     def close_subscriber(self, subscriber: str):
         """Close the queue for a given subscriber.
@@ -159,9 +1106,53 @@ class Mediator(gelo.arch.IMediator):
         :param subscriber: The class name of the subscriber to close the
         queue for.
         """
-        self.subscriber_lock.acquire()
-        self.subscriber_map[subscriber].put(None, block=False)
-        self.subscriber_lock.release()
+        self.subscriber_map[subscriber].close()
+
+    def drop_counts(self) -> dict[str, int]:
+        """Get the number of markers dropped for each subscriber.
+
+        :return: A mapping of subscriber name to dropped marker count.
+        """
+        return {name: sub.stats.dropped for name, sub in self.subscriber_map.items()}
+
+    def register_metrics(self, name: str, stats) -> None:
+        """Include a plugin's own statistics in ``metrics``.
+
+        :param name: The name to report them under.
+        :param stats: An object with a ``summary()`` method returning a dict.
+        """
+        with self.subscriber_lock:
+            self.plugin_stats = MappingProxyType({**self.plugin_stats, name: stats})
+
+    def metrics(self) -> dict:
+        """Get delivery metrics for the instant and delayed paths, and for
+        every subscriber.
+
+        Latencies are in nanoseconds, measured from ``publish`` until the
+        subscriber took the marker out of its channel, minus the broadcast
+        delay for delayed subscribers.
+
+        :return: A dict with "instant" and "delayed" latency summaries, a
+        "lanes" dict of latency summaries keyed by MarkerType name, a
+        "subscribers" dict of ChannelStats summaries keyed by subscriber name,
+        and a "plugins" dict of whatever plugins registered with
+        ``register_metrics``.
+        """
+        return {
+            "instant": self.instant_latency.summary(),
+            "delayed": self.delayed_latency.summary(),
+            "lanes": {
+                marker_type.name: h.summary()
+                for marker_type, h in self.lane_latency.items()
+            },
+            "subscribers": {
+                name: sub.stats.summary(sub.channel.qsize())
+                for name, sub in self.subscriber_map.items()
+            },
+            "plugins": {
+                name: stats.summary() for name, stats in self.plugin_stats.items()
+            },
+        }
 
 
 class UnsubscribeException(Exception):
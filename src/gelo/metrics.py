@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""Instrumentation for the path markers take from sources to sinks."""
+
+from threading import Lock
+
+
+class LatencyHistogram(object):
+    """A log-linear histogram of durations, in the style of HdrHistogram.
+
+    Values are integer nanoseconds. Each power of two is split into
+    ``2 ** (SUB_BUCKET_BITS - 1)`` equal buckets, so any recorded value can be
+    read back with a relative error of at most ``2 ** -(SUB_BUCKET_BITS - 1)``
+    (about 3% with the default), no matter whether it's a microsecond or a
+    minute, while only ever using a few hundred counters.
+    """
+
+    SUB_BUCKET_BITS = 6
+
+    def __init__(self):
+        """Create a new, empty histogram."""
+        self._lock = Lock()
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        """Get the bucket index for a value."""
+        sub_buckets = 1 << cls.SUB_BUCKET_BITS
+        if value < sub_buckets:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        half = sub_buckets >> 1
+        return sub_buckets + (shift - 1) * half + (value >> shift) - half
+
+    @classmethod
+    def _upper_bound(cls, index: int) -> int:
+        """Get the largest value that falls into a bucket."""
+        sub_buckets = 1 << cls.SUB_BUCKET_BITS
+        if index < sub_buckets:
+            return index
+        half = sub_buckets >> 1
+        shift = (index - sub_buckets) // half + 1
+        top = (index - sub_buckets) % half + half
+        return ((top + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """Record one duration.
+
+        :param value: The duration, in nanoseconds. Negative values (which can
+        only come from clock weirdness) are recorded as zero.
+        """
+        value = max(int(value), 0)
+        index = self._index(value)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, p: float) -> int | None:
+        """Get the value below which ``p`` percent of durations fall.
+
+        :param p: The percentile, from 0 to 100.
+        :return: The duration in nanoseconds, or None if nothing was recorded.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = max(1, round(self.count * p / 100))
+            seen = 0
+            for index in sorted(self._counts):
+                seen += self._counts[index]
+                if seen >= target:
+                    return min(self._upper_bound(index), self.max)
+            return self.max
+
+    def summary(self) -> dict:
+        """Summarize the histogram.
+
+        :return: The count, and the min, mean, p50, p90, p99, and max
+        durations in nanoseconds.
+        """
+        return {
+            "count": self.count,
+            "min": self.min,
+            "mean": self.total // self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class ChannelStats(object):
+    """Counters, gauges, and timings for one subscriber's channel.
+
+    Enqueue times are recorded by the Mediator when it delivers a marker, and
+    dequeue times by the channel when the subscriber takes it out.
+    """
+
+    def __init__(
+        self,
+        delay_ns: int = 0,
+        path: LatencyHistogram | None = None,
+        lanes: dict | None = None,
+        lane=None,
+    ):
+        """Create a new ChannelStats.
+
+        :param delay_ns: The delay the subscriber is meant to have (the
+        broadcast delay, for delayed subscribers), which is subtracted from
+        the publish-to-delivery latency.
+        :param path: A histogram shared by every subscriber on the same path
+        (instant or delayed), to also record delivery latency into.
+        :param lanes: Histograms shared by every subscriber, keyed by
+        MarkerType, to also record delivery latency into by marker type.
+        :param lane: The MarkerType of every marker in the channel, if the
+        subscriber only takes one type.
+        """
+        self.delay_ns = delay_ns
+        self.path = path
+        self.lanes = lanes
+        self.lane = lane
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        # Markers the subscription's filter turned away.
+        self.filtered = 0
+        # Markers the BLOCK policy dropped right away, rather than wait for
+        # room on the scheduler thread.
+        self.unblocked = 0
+        self.high_water = 0
+        self.last_enqueue_ns = None
+        self.last_dequeue_ns = None
+        # Time spent waiting in the channel.
+        self.queue_latency = LatencyHistogram()
+        # Time from Mediator.publish until the subscriber took the marker,
+        # minus the intended delay.
+        self.delivery_latency = LatencyHistogram()
+
+    def record_enqueue(self, now_ns: int, depth: int, count: int = 1) -> None:
+        """Record that markers were put into the channel.
+
+        :param now_ns: When, from time.perf_counter_ns.
+        :param depth: How many markers the channel holds now.
+        :param count: How many markers were put in.
+        """
+        self.enqueued += count
+        self.last_enqueue_ns = now_ns
+        if depth > self.high_water:
+            self.high_water = depth
+
+    def record_dequeue(
+        self, now_ns: int, enqueued_ns: int, marker, marker_type=None
+    ) -> None:
+        """Record that the subscriber took a marker out of the channel.
+
+        :param now_ns: When, from time.perf_counter_ns.
+        :param enqueued_ns: When the marker was put into the channel.
+        :param marker: The marker.
+        :param marker_type: The MarkerType of the marker, if the channel
+        knows it.
+        """
+        self.dequeued += 1
+        self.last_dequeue_ns = now_ns
+        self.queue_latency.record(now_ns - enqueued_ns)
+        published_ns = getattr(marker, "published_ns", None)
+        if published_ns is not None:
+            latency = now_ns - published_ns - self.delay_ns
+            self.delivery_latency.record(latency)
+            if self.path is not None:
+                self.path.record(latency)
+            lane = marker_type if marker_type is not None else self.lane
+            if self.lanes is not None and lane is not None:
+                self.lanes[lane].record(latency)
+
+    def summary(self, depth: int) -> dict:
+        """Summarize the statistics.
+
+        :param depth: How many markers the channel holds right now.
+        """
+        return {
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "dropped": self.dropped,
+            "filtered": self.filtered,
+            "unblocked": self.unblocked,
+            "depth": depth,
+            "high_water": self.high_water,
+            "last_enqueue_ns": self.last_enqueue_ns,
+            "last_dequeue_ns": self.last_dequeue_ns,
+            "queue_latency": self.queue_latency.summary(),
+            "delivery_latency": self.delivery_latency.summary(),
+        }
+
+
+class PollStats(object):
+    """Counters and timings for a source that polls a server for markers."""
+
+    def __init__(self):
+        """Create a new PollStats."""
+        self.polls = 0
+        # Responses that differed from the last one.
+        self.changed = 0
+        # Responses the server said (or the content hash showed) were the
+        # same as the last one, which were never decoded.
+        self.unchanged = 0
+        self.errors = 0
+        # Polls skipped because the last one was still going when they were
+        # due.
+        self.overruns = 0
+        # Time from sending the request until the whole response was read.
+        self.request_latency = LatencyHistogram()
+        # CPU time the polling thread spent on a whole poll cycle.
+        self.cycle_cost = LatencyHistogram()
+
+    def summary(self) -> dict:
+        """Summarize the statistics."""
+        return {
+            "polls": self.polls,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "errors": self.errors,
+            "overruns": self.overruns,
+            "request_latency": self.request_latency.summary(),
+            "cycle_cost": self.cycle_cost.summary(),
+        }
@@ -20,8 +20,15 @@ class AudacityLabels(arch.IMarkerSink):
         self.filename = self.avoid_overwrite_filename()
         self.log.info("Using %s as the data file path" % self.filename)
         self.delayed = self.config["delayed"]
+        # Every marker becomes a chapter, so wait for room rather than
+        # dropping markers if the file falls behind (on the instant path; the
+        # scheduler thread never waits).
         self.channel = self.mediator.subscribe(
-            [arch.MarkerType.TRACK], AudacityLabels.__name__, delayed=self.delayed
+            [arch.MarkerType.TRACK],
+            AudacityLabels.__name__,
+            delayed=self.delayed,
+            policy=arch.BackpressurePolicy.BLOCK,
+            marker_filter=arch.MarkerFilter.from_config(self.config),
         )
         self.last_marker = None
 
@@ -29,24 +36,36 @@ class AudacityLabels(arch.IMarkerSink):
         """Run the marker-receiving code."""
         while not self.should_terminate:
             try:
-                current_marker = next(self.channel.listen())
+                markers = next(self.channel.listen_batch())
                 if not self.is_enabled:
                     continue
-                self.log.debug("Received marker from channel: %s" % current_marker)
-                if self.last_marker is not None:
-                    line = self.create_line(current_marker, self.last_marker)
-                    with open(self.filename, "a") as f:
-                        f.write(line)
-                    self.last_marker = current_marker
-                else:
-                    self.last_marker = current_marker
-                    continue
+                self.receive_markers(markers)
             except queue.Empty:
                 continue
             except mediator.UnsubscribeException:
                 self.should_terminate = True
             except StopIteration:
                 self.should_terminate = True
+        self.write_final_marker()
+
+    def receive_marker(self, current_marker: arch.Marker):
+        """Write a line for the previous marker, now that we know its end."""
+        self.receive_markers([current_marker])
+
+    def receive_markers(self, markers: list[arch.Marker]):
+        """Write lines for a batch of markers, opening the file just once."""
+        lines = []
+        for current_marker in markers:
+            self.log.debug("Received marker from channel: %s" % current_marker)
+            if self.last_marker is not None:
+                lines.append(self.create_line(current_marker, self.last_marker))
+            self.last_marker = current_marker
+        if lines:
+            with open(self.filename, "a") as f:
+                f.write("".join(lines))
+
+    def write_final_marker(self):
+        """Write the last marker, which has no following marker to end it."""
         if self.last_marker is not None:
             self.log.info("Writing final marker to file")
             with open(self.filename, "a") as f:
@@ -81,13 +100,15 @@ class AudacityLabels(arch.IMarkerSink):
         end of the file which indicates the program was restarted.
         """
         # If there is no collision avoidance marker, write another entry that
-        # says the program was restarted.
+        # says the program was restarted, at the time it restarted if the
+        # journal has carried the time base over from before.
         if "{count}" not in self.config["path"]:
             self.log.info("Data file path missing {count} tag, writing restart marker")
+            restarted = self.mediator.marker_time() or 0
             with open(self.config["path"], "a") as f:
                 f.write(
                     self.LINE_TEMPLATE.format(
-                        start=0, finish=0, label="PROGRAM RESTART"
+                        start=restarted, finish=restarted, label="PROGRAM RESTART"
                     )
                 )
             return self.config["path"]
@@ -120,3 +141,18 @@ class AudacityLabels(arch.IMarkerSink):
         # Return errors, if any
         if len(errors) > 0:
             raise conf.InvalidConfigurationError(errors)
+
+
+class AsyncAudacityLabels(AudacityLabels, arch.IAsyncMarkerSink):
+    """Write every MarkerType.TRACK marker to a label file, on the event loop."""
+
+    async def arun(self):
+        """Run the marker-receiving code."""
+        try:
+            async for current_marker in self.channel.listen():
+                if not self.is_enabled:
+                    continue
+                self.receive_marker(current_marker)
+        except mediator.UnsubscribeException:
+            self.should_terminate = True
+        self.write_final_marker()
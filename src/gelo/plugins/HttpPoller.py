@@ -1,11 +1,25 @@
-import re
+import enum
+import json
 import time
+import asyncio
+import hashlib
 import logging
 import requests
 import dataclasses
 import requests.exceptions
+from threading import Event
+from urllib.parse import urlsplit
+from concurrent.futures import Future
 from typing import Optional, Callable
-from gelo import arch, conf
+from gelo import arch, conf, shared, sidecar
+from gelo.metrics import PollStats
+from gelo.scheduler import shared_scheduler
+
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp is only needed by AsyncHttpPoller, which checks for it.
+    aiohttp = None
 
 
 @dataclasses.dataclass
@@ -17,13 +31,7 @@ class Track:
         return f"{self.artist} — {self.title}"
 
 
-def icecast_status_to_track(status) -> Optional[Track]:
-    if type(status) is not dict or "icestats" not in status:
-        return None
-    icestats = status["icestats"]
-    if type(icestats) is not dict or "source" not in icestats:
-        return None
-    source = icestats["source"]
+def icecast_source_to_track(source) -> Optional[Track]:
     if type(source) is not dict:
         return None
     if "artist" not in source:
@@ -33,89 +41,372 @@ def icecast_status_to_track(status) -> Optional[Track]:
     return Track(str(source["artist"]), str(source["title"]))
 
 
-def do_every(
-    period: float, keep_going: Callable[[], bool], fn: Callable, *args, **kwargs
-):
-    def g_tick():
-        t = time.time()
-        while True:
-            t += period
-            yield max(t - time.time(), 0)
+def icecast_status_to_tracks(status) -> dict[str, Track]:
+    """Get the track playing on each mount in an Icecast status.
+
+    Icecast sends a lone source as an object, and several as a list.
+
+    :param status: The decoded status-json.xsl.
+    :return: The tracks, by the mount they're playing on. A source that
+    doesn't say what its mount is goes under "".
+    """
+    if type(status) is not dict or "icestats" not in status:
+        return {}
+    icestats = status["icestats"]
+    if type(icestats) is not dict or "source" not in icestats:
+        return {}
+    sources = icestats["source"]
+    if type(sources) is not list:
+        sources = [sources]
+    tracks = {}
+    for source in sources:
+        track = icecast_source_to_track(source)
+        if track is not None:
+            tracks[urlsplit(str(source.get("listenurl", ""))).path] = track
+    return tracks
+
+
+def icecast_status_to_track(status) -> Optional[Track]:
+    """Get the track playing on the first mount in an Icecast status."""
+    return next(iter(icecast_status_to_tracks(status).values()), None)
+
+
+@dataclasses.dataclass
+class PolledServer:
+    """A status URL, and what it said last time, for conditional requests."""
+
+    url: str
+    etag: str | None = None
+    last_modified: str | None = None
+    # A hash of the last response, for servers that send neither header.
+    last_digest: bytes | None = None
+
+
+class PollResult(enum.Enum):
+    """What came of one poll of the server.
+
+    Enum values:
+    :CHANGED: the track changed, and a marker was published.
+    :UNCHANGED: the server answered, but the track was the same.
+    :FAILED: the server couldn't be reached, or sent something unusable.
+    """
+
+    CHANGED = 1
+    UNCHANGED = 2
+    FAILED = 3
+
+
+def combine_results(results: list[PollResult]) -> PollResult:
+    """Sum up the polls of several servers or mounts.
 
-    g = g_tick()
-    while keep_going():
-        time.sleep(next(g))
-        fn(*args, **kwargs)
+    :return: CHANGED if anything changed, FAILED if every one failed, and
+    UNCHANGED otherwise.
+    """
+    if PollResult.CHANGED in results:
+        return PollResult.CHANGED
+    if results and all(result is PollResult.FAILED for result in results):
+        return PollResult.FAILED
+    return PollResult.UNCHANGED
+
+
+class AdaptiveInterval(object):
+    """How long to wait between polls, adjusted to what the polls find.
+
+    Track changes cluster around DJ transitions, so right after a change the
+    interval snaps to the minimum. After a long stretch with no change, it
+    creeps up towards the maximum, and while the server can't be reached, it
+    backs off exponentially.
+    """
+
+    # How long the track has to stay the same before polling slows down.
+    IDLE_AFTER_SECS = 30.0
+    # How much the interval grows with each poll after that.
+    IDLE_GROWTH = 1.25
+    # How much the interval grows with each failed poll in a row.
+    FAILURE_GROWTH = 2.0
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create a new AdaptiveInterval, starting at the minimum.
+
+        :param min_interval: The shortest time between polls, in seconds.
+        :param max_interval: The longest time between polls, in seconds.
+        :param clock: Where to get the time from.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self.current = min_interval
+        self.last_change = clock()
+
+    def update(self, result: PollResult | None) -> float:
+        """Adjust the interval after a poll.
+
+        :param result: What came of the poll, or None if there wasn't one.
+        :return: How long to wait before the next poll.
+        """
+        if result is PollResult.CHANGED:
+            self.last_change = self.clock()
+            self.current = self.min_interval
+        elif result is PollResult.FAILED:
+            self.current = min(
+                self.max_interval,
+                max(self.current * self.FAILURE_GROWTH, self.min_interval),
+            )
+        elif self.clock() - self.last_change >= self.IDLE_AFTER_SECS:
+            self.current = min(self.max_interval, self.current * self.IDLE_GROWTH)
+        return self.current
 
 
 class HttpPoller(arch.IMarkerSource):
     """Poll an HTTP server of some description for markers."""
 
     PLUGIN_MODULE_NAME = "HttpPoller"
+    # Polls happen up to four times a second, so there's no point waiting long
+    # for one; the next poll will be along shortly.
+    CONNECT_TIMEOUT_SECS = 1.0
+    READ_TIMEOUT_SECS = 2.0
 
     def __init__(self, config, mediator: arch.IMediator, show: str):
         """Create a new instance of HttpPoller."""
         super().__init__(config, mediator, show)
         self.log = logging.getLogger("gelo.plugins.HttpPoller")
-        self.last_track = Track()
         self.config_test()
-        self.poll_url = self.config["poll_url"]
+        self.servers = [PolledServer(url) for url in self.config["poll_url"]]
+        # The mounts to mark the tracks of, or None for all of them.
+        self.mounts = self.config.get("mounts")
         self.prefix_file = self.config["prefix_file"]
-        # Match anything inside parenthesis
-        self.special_matcher = re.compile(r".*\((.*)\).*")
+        self.prefix = sidecar.SidecarFile(
+            self.prefix_file, sidecar.parse_prefix, self.prefix_changed
+        )
+        # The last marker published, to mark again if the prefix changes.
+        self.last_marker = None
+        # The last track on each mount, by (server URL, mount), so each mount
+        # has its changes detected on its own.
+        self.last_tracks = {}
+        self.poll_stats = PollStats()
+        self.mediator.register_metrics(self.PLUGIN_MODULE_NAME, self.poll_stats)
+        self.interval = AdaptiveInterval(
+            self.config["min_interval"], self.config["max_interval"]
+        )
+        # Set when it's time to poll, or to stop.
+        self.wakeup = Event()
+        self.polling = False
+        self.poll_task = None
 
     def run(self):
         """Run the code that creates markers from the HTTP server.
         This should be run as a thread."""
         self.log.info("now running")
-        starttime = time.time()
+        sidecar.watch(self.prefix)
+        # The shared scheduler says when to poll, and this thread polls, so
+        # a slow server can't hold up anything else.
+        scheduler = shared_scheduler()
+        self.poll_task = scheduler.schedule_every(
+            self.interval.current, self.request_poll, first_delay=0
+        )
+        try:
+            while True:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                if self.should_terminate:
+                    break
+                self.polling = True
+                result = self.run_cycle(None)
+                self.polling = False
+                self.poll_stats.overruns = self.poll_task.overruns
+                interval = self.interval.update(result)
+                if interval != self.poll_task.period:
+                    scheduler.set_period(self.poll_task, interval)
+        finally:
+            scheduler.cancel(self.poll_task)
+            sidecar.unwatch(self.prefix)
 
-        def keep_going():
-            return not self.should_terminate
+    def request_poll(self) -> bool:
+        """Wake the thread up to poll, unless it's still busy with the last
+        poll. This runs on the scheduler thread.
 
-        do_every(0.25, keep_going, self.run_cycle, starttime)
+        :return: Whether the thread was free to poll.
+        """
+        if self.polling:
+            return False
+        self.wakeup.set()
+        return True
+
+    def deactivate(self):
+        super().deactivate()
+        self.wakeup.set()
+
+    def run_cycle(self, _) -> PollResult | None:
+        """Poll the server once, if the plugin is enabled.
 
-    def run_cycle(self, _):
+        :return: What came of the poll, or None if there wasn't one.
+        """
         if not self.is_enabled:
-            return
+            return None
+        start_ns = time.thread_time_ns()
         try:
-            icecast_status = self.poll_server()
-            track = icecast_status_to_track(icecast_status)
-        except requests.exceptions.ConnectionError as ce:
-            self.log.info("connection error while polling server: %s", ce)
-            return
-        except requests.exceptions.JSONDecodeError as jde:
-            self.log.info("invalid JSON returned by server: %s", jde)
-            return
-        if (
-            not track
-            or track == self.last_track
-            or track.artist.strip() == ""
-            or track.title.strip() == ""
-        ):
-            self.log.info("ignoring empty track metadata")
-            return
-        m = arch.Marker(str(track), track.artist, track.title)
-        m.special = self.check_prefix_file()
-        self.mediator.publish(arch.MarkerType.TRACK, m)
-        self.last_track = track
+            return self.poll_cycle()
+        finally:
+            self.poll_stats.cycle_cost.record(time.thread_time_ns() - start_ns)
+
+    def poll_cycle(self) -> PollResult:
+        """Poll every server once, and publish a marker for each mount whose
+        track changed.
 
-    def poll_server(self) -> dict:
-        """Connect to the HTTP server and request the current track.
-        :return: Whatever the server responded with
+        Several servers are requested at once, on the shared thread pool, but
+        their responses are handled here, in order.
         """
-        return requests.get(self.poll_url).json()
+        if len(self.servers) > 1:
+            pool = shared.poll_executor()
+            fetches = [pool.submit(self.fetch, server) for server in self.servers]
+        else:
+            fetches = [None]
+        results = [
+            self.poll_server(server, fetch)
+            for server, fetch in zip(self.servers, fetches)
+        ]
+        return combine_results(results)
 
-    def check_prefix_file(self) -> str | None:
-        """Check the prefix file to see if the track needs a special prefix.
-        :return: The prefix, or None if there shouldn't be one."""
+    def fetch(self, server: PolledServer) -> tuple[int, dict, bytes]:
+        """Request a server's status.
+
+        :param server: The server to request it from.
+        :return: The status code, headers and body of the response.
+        """
+        start_ns = time.perf_counter_ns()
+        r = shared.http_session().get(
+            server.url,
+            headers=self.conditional_headers(server),
+            timeout=(self.CONNECT_TIMEOUT_SECS, self.READ_TIMEOUT_SECS),
+        )
+        self.poll_stats.request_latency.record(time.perf_counter_ns() - start_ns)
+        if r.status_code != 304:
+            r.raise_for_status()
+        return r.status_code, r.headers, r.content
+
+    def poll_server(self, server: PolledServer, fetch: Future | None) -> PollResult:
+        """Handle a server's response to a poll.
+
+        :param server: The server that was polled.
+        :param fetch: The request for its status, or None to make it now.
+        """
+        self.poll_stats.polls += 1
         try:
-            with open(self.prefix_file, "r") as pf:
-                first_line = pf.readline()
-                g = self.special_matcher.match(first_line)
-                return g.group(1) if g is not None else None
-        except IOError:
+            if fetch is None:
+                status, headers, body = self.fetch(server)
+            else:
+                status, headers, body = fetch.result()
+        except requests.exceptions.ConnectionError as ce:
+            self.poll_stats.errors += 1
+            self.log.info("connection error while polling %s: %s", server.url, ce)
+            return PollResult.FAILED
+        except requests.exceptions.RequestException as e:
+            self.poll_stats.errors += 1
+            self.log.info("error while polling %s: %s", server.url, e)
+            return PollResult.FAILED
+        return self.handle_response(server, status, headers, body)
+
+    def handle_response(
+        self, server: PolledServer, status: int, headers, body: bytes
+    ) -> PollResult:
+        """Publish markers for whatever changed in a server's status.
+
+        :param server: The server that responded.
+        :param status: The HTTP status code.
+        :param headers: The response headers.
+        :param body: The response body.
+        """
+        digest = self.note_response(server, status, body)
+        if digest is None:
+            return PollResult.UNCHANGED
+        try:
+            icecast_status = json.loads(body)
+        except ValueError as jde:
+            self.poll_stats.errors += 1
+            self.log.info("invalid JSON returned by %s: %s", server.url, jde)
+            return PollResult.FAILED
+        # Only remembered once it's decoded, so that a bad response is decoded
+        # again, and fails again, rather than going unnoticed as unchanged.
+        server.etag = headers.get("ETag")
+        server.last_modified = headers.get("Last-Modified")
+        server.last_digest = digest
+        tracks = icecast_status_to_tracks(icecast_status)
+        return combine_results(
+            [
+                self.handle_track(track, (server.url, mount))
+                for mount, track in tracks.items()
+                if self.mounts is None or mount in self.mounts
+            ]
+        )
+
+    def conditional_headers(self, server: PolledServer) -> dict[str, str]:
+        """Get the headers that ask a server for a response only if it has
+        changed since the last one."""
+        headers = {}
+        if server.etag is not None:
+            headers["If-None-Match"] = server.etag
+        if server.last_modified is not None:
+            headers["If-Modified-Since"] = server.last_modified
+        return headers
+
+    def note_response(
+        self, server: PolledServer, status: int, body: bytes
+    ) -> bytes | None:
+        """Check whether a response is different from the server's last one.
+
+        :param server: The server that responded.
+        :param status: The HTTP status code.
+        :param body: The response body.
+        :return: The response's digest if it's new, and worth decoding, or
+        None if it isn't.
+        """
+        if status == 304:
+            self.poll_stats.unchanged += 1
             return None
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        if digest == server.last_digest:
+            self.poll_stats.unchanged += 1
+            return None
+        self.poll_stats.changed += 1
+        return digest
+
+    def handle_track(self, track: Track | None, key=None) -> PollResult:
+        """Publish a marker for the track, if it's new and not empty.
+
+        :param track: The track the server says is playing, if any.
+        :param key: Which mount the track is playing on.
+        :return: CHANGED if a marker was published, otherwise UNCHANGED.
+        """
+        if track == self.last_tracks.get(key):
+            return PollResult.UNCHANGED
+        if not track or track.artist.strip() == "" or track.title.strip() == "":
+            self.log.info("ignoring empty track metadata")
+            return PollResult.UNCHANGED
+        m = arch.Marker(
+            artist=track.artist, title=track.title, special=self.prefix.value
+        )
+        self.mediator.publish(arch.MarkerType.TRACK, m)
+        self.last_tracks[key] = track
+        self.last_marker = m
+        return PollResult.CHANGED
+
+    def prefix_changed(self, special: str | None):
+        """Mark the current track again, with its new special status, if the
+        prefix file changed partway through it and that's wanted.
+
+        :param special: The new special status.
+        """
+        if not self.config["mark_prefix_changes"] or not self.is_enabled:
+            return
+        if self.last_marker is None:
+            return
+        self.last_marker = self.last_marker.replace(special=special)
+        self.mediator.publish(arch.MarkerType.TRACK, self.last_marker)
 
     def config_test(self):
         """Test the configuration to ensure that it contains the required items.
@@ -125,10 +416,112 @@ class HttpPoller(arch.IMarkerSource):
         errors = []
         if "poll_url" not in self.config:
             errors.append('[plugin:icecast] does not have the required key "poll_url"')
+        elif type(self.config["poll_url"]) is str:
+            self.config["poll_url"] = [self.config["poll_url"]]
+        elif not self.config["poll_url"] or any(
+            type(url) is not str for url in self.config["poll_url"]
+        ):
+            errors.append('[plugin:HttpPoller] "poll_url" must be a URL or a list')
+        if "mounts" in self.config and (
+            type(self.config["mounts"]) is not list
+            or any(type(mount) is not str for mount in self.config["mounts"])
+        ):
+            errors.append('[plugin:HttpPoller] "mounts" must be a list of mounts')
         if "prefix_file" not in self.config:
             errors.append(
                 '[plugin:icecast] does not have the required key "prefix_file"'
             )
+        self.config.setdefault("mark_prefix_changes", False)
+        if type(self.config["mark_prefix_changes"]) is not bool:
+            errors.append('[plugin:HttpPoller] "mark_prefix_changes" must be a bool')
+        self.config.setdefault("min_interval", 0.25)
+        self.config.setdefault("max_interval", 5.0)
+        for key in ["min_interval", "max_interval"]:
+            if type(self.config[key]) not in [int, float]:
+                errors.append('[plugin:HttpPoller] has a non-numeric "%s"' % key)
+            elif self.config[key] <= 0:
+                errors.append('[plugin:HttpPoller] "%s" must be positive' % key)
+        if not errors and self.config["min_interval"] > self.config["max_interval"]:
+            errors.append(
+                '[plugin:HttpPoller] "min_interval" is more than "max_interval"'
+            )
         # Throw exception if necessary.
         if len(errors) > 0:
             raise conf.InvalidConfigurationError(errors)
+
+
+class AsyncHttpPoller(HttpPoller, arch.IAsyncMarkerSource):
+    """Poll an HTTP server for markers, on the event loop."""
+
+    HTTP_TIMEOUT_SECS = 5
+
+    def __init__(self, config, mediator: arch.IMediator, show: str):
+        """Create a new instance of AsyncHttpPoller."""
+        super().__init__(config, mediator, show)
+        if aiohttp is None:
+            raise conf.InvalidConfigurationError(
+                ['engine = "asyncio" requires aiohttp. Install gelo[aio].']
+            )
+
+    async def arun(self):
+        """Poll the server as often as the AdaptiveInterval says to."""
+        self.log.info("now running")
+        loop = asyncio.get_running_loop()
+        # Shared with every other show in the process.
+        session = shared.aio_http_session()
+        sidecar.watch(self.prefix)
+        try:
+            t = loop.time()
+            while not self.should_terminate:
+                result = await self.arun_cycle(session)
+                t = max(t + self.interval.update(result), loop.time())
+                await asyncio.sleep(t - loop.time())
+        finally:
+            sidecar.unwatch(self.prefix)
+
+    async def arun_cycle(self, session) -> PollResult | None:
+        """Poll every server at once, and publish a marker for each mount
+        whose track changed.
+
+        :return: What came of the poll, or None if the plugin is disabled.
+        """
+        if not self.is_enabled:
+            return None
+        fetches = await asyncio.gather(
+            *[self.afetch(session, server) for server in self.servers],
+            return_exceptions=True,
+        )
+        results = []
+        for server, fetched in zip(self.servers, fetches):
+            self.poll_stats.polls += 1
+            if isinstance(fetched, (aiohttp.ClientError, asyncio.TimeoutError)):
+                self.poll_stats.errors += 1
+                self.log.info(
+                    "connection error while polling %s: %s", server.url, fetched
+                )
+                results.append(PollResult.FAILED)
+            elif isinstance(fetched, BaseException):
+                raise fetched
+            else:
+                results.append(self.handle_response(server, *fetched))
+        return combine_results(results)
+
+    async def afetch(self, session, server: PolledServer) -> tuple[int, dict, bytes]:
+        """Request a server's status.
+
+        :param session: The aiohttp session to request it with.
+        :param server: The server to request it from.
+        :return: The status code, headers and body of the response.
+        """
+        start_ns = time.perf_counter_ns()
+        timeout = aiohttp.ClientTimeout(
+            total=self.HTTP_TIMEOUT_SECS, connect=self.CONNECT_TIMEOUT_SECS
+        )
+        async with session.get(
+            server.url, headers=self.conditional_headers(server), timeout=timeout
+        ) as response:
+            if response.status != 304:
+                response.raise_for_status()
+            body = await response.read()
+        self.poll_stats.request_latency.record(time.perf_counter_ns() - start_ns)
+        return response.status, response.headers, body
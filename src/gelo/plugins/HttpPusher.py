@@ -1,11 +1,18 @@
 import gelo.arch
 import gelo.conf
 import gelo.mediator
+import gelo.shared
 import queue
+import asyncio
 import logging
 import requests
-from requests.adapters import HTTPAdapter, Retry
-from threading import Timer
+from threading import Thread
+
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp is only needed by AsyncHttpPusher, which checks for it.
+    aiohttp = None
 
 
 class HttpPusher(gelo.arch.IMarkerSink):
@@ -39,24 +46,28 @@ class HttpPusher(gelo.arch.IMarkerSink):
                     self.webhooks[webhook]["extra_delay"]
                 )
         self.channel = self.mediator.subscribe(
-            [gelo.arch.MarkerType.TRACK], HttpPusher.__name__, delayed=self.delayed
+            [gelo.arch.MarkerType.TRACK],
+            HttpPusher.__name__,
+            delayed=self.delayed,
+            marker_filter=gelo.arch.MarkerFilter.from_config(self.config),
         )
-        self.session = requests.Session()
-        retries = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504, 429],
-            raise_on_status=True,
-            # False makes sure this retries for every method type, not just the
-            # "safe" ones.
-            allowed_methods=None,
+        # Shared with every other show in the process.
+        self.session = gelo.shared.http_session(retrying=True)
+        # Requests delayed by extra_delay are handed to this queue by the
+        # mediator's scheduler, so that slow webhooks never block the
+        # scheduler thread.
+        self.delayed_requests = queue.Queue()
+        self.delayed_worker = Thread(
+            target=self.run_delayed_requests,
+            name="HttpPusher-delayed",
+            daemon=True,
         )
-        self.session.mount("http://", HTTPAdapter(max_retries=retries))
-        self.session.mount("https://", HTTPAdapter(max_retries=retries))
 
     def run(self):
         """Run the code that will send HTTP requests with the markers."""
         self.log.info("Starting plugin")
+        if any("extra_delay" in options for options in self.webhooks.values()):
+            self.delayed_worker.start()
         while not self.should_terminate:
             try:
                 marker = next(self.channel.listen())
@@ -68,6 +79,19 @@ class HttpPusher(gelo.arch.IMarkerSink):
                 continue
             except gelo.mediator.UnsubscribeException:
                 self.should_terminate = True
+        # Requests that shutdown brought forward are already in the queue, so
+        # wait for them to be made; joining the plugin waits for this too.
+        self.delayed_requests.put(None)
+        if self.delayed_worker.is_alive():
+            self.delayed_worker.join()
+
+    def run_delayed_requests(self):
+        """Make the requests that were delayed by extra_delay, one at a time."""
+        while True:
+            job = self.delayed_requests.get()
+            if job is None:
+                return
+            self.request(*job)
 
     def request_all(self, marker: gelo.arch.Marker):
         """Make HTTP requests to every webhook."""
@@ -78,10 +102,11 @@ class HttpPusher(gelo.arch.IMarkerSink):
                         name, options["extra_delay"]
                     )
                 )
-                delay = Timer(
-                    options["extra_delay"], self.request, args=[marker, name, options]
+                self.mediator.scheduler.schedule(
+                    options["extra_delay"],
+                    self.delayed_requests.put,
+                    (marker, name, options),
                 )
-                delay.start()
             else:
                 self.log.debug("Sending marker for {} immediately…".format(name))
                 self.request(marker, name, options)
@@ -153,6 +178,9 @@ class HttpPusher(gelo.arch.IMarkerSink):
                     "Connection Error while trying to make a request to"
                     "{}, attempt {}: {}".format(webhook_name, attempts, ce)
                 )
+                if self.should_terminate:
+                    # Gelo is shutting down; don't hold it up with retries.
+                    break
                 continue
             except requests.RequestException as re:
                 self.log.warning(
@@ -235,3 +263,142 @@ class HttpPusher(gelo.arch.IMarkerSink):
                     ).format(webhook_name)
                 )
         return errors
+
+
+class AsyncHttpPusher(HttpPusher, gelo.arch.IAsyncMarkerSink):
+    """Push the marker to an HTTP endpoint, on the event loop.
+
+    Every request is its own task, so a slow webhook never holds up the
+    others. Requests delayed by extra_delay are started by the mediator's
+    scheduler, like HttpPusher's, so that shutting down sends them right
+    away rather than cutting them off.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, config, mediator: gelo.arch.IMediator, show: str):
+        """Create a new AsyncHttpPusher."""
+        super().__init__(config, mediator, show)
+        if aiohttp is None:
+            raise gelo.conf.InvalidConfigurationError(
+                ['engine = "asyncio" requires aiohttp. Install gelo[aio].']
+            )
+        self.requests_in_flight = set()
+        # The requests waiting out their extra_delay on the scheduler.
+        self.requests_scheduled = set()
+        # Set once there are no more markers coming, to cut retries short.
+        self.stopping = None
+
+    async def arun(self):
+        """Run the code that will send HTTP requests with the markers."""
+        self.log.info("Starting plugin")
+        self.stopping = asyncio.Event()
+        # Shared with every other show in the process.
+        session = gelo.shared.aio_http_session()
+        try:
+            async for marker in self.channel.listen():
+                if not self.is_enabled:
+                    continue
+                self.log.debug("Received marker from channel: %s" % marker)
+                self.arequest_all(session, marker)
+        except gelo.mediator.UnsubscribeException:
+            self.should_terminate = True
+        self.stopping.set()
+        # Shutdown flushes the scheduler before closing the channel, but the
+        # markers that flush delivered schedule requests of their own, which
+        # terminating the mediator can cancel before they run. Once flushed,
+        # those are due now; otherwise they were abandoned.
+        for task in list(self.requests_scheduled):
+            self.mediator.scheduler.cancel(task)
+            if task.lateness is None and self.mediator.scheduler.flushed:
+                self.start_request(*task.args)
+        if self.requests_in_flight:
+            await asyncio.gather(*self.requests_in_flight)
+
+    def arequest_all(self, session, marker: gelo.arch.Marker):
+        """Start a task to make a request to every webhook, or schedule one
+        for when its extra_delay is up."""
+        for name, options in self.webhooks.items():
+            if "extra_delay" in options.keys():
+                self.log.debug(
+                    "Delaying marker for {} by {} seconds…".format(
+                        name, options["extra_delay"]
+                    )
+                )
+                task = self.mediator.scheduler.schedule(
+                    options["extra_delay"],
+                    self.start_request,
+                    session,
+                    marker,
+                    name,
+                    options,
+                )
+                self.requests_scheduled.add(task)
+            else:
+                self.start_request(session, marker, name, options)
+
+    def start_request(
+        self, session, marker: gelo.arch.Marker, webhook_name: str, webhook_options
+    ):
+        """Start a task to make one webhook request. This runs on the loop."""
+        self.requests_scheduled = {
+            t for t in self.requests_scheduled if t.lateness is None and not t.cancelled
+        }
+        task = asyncio.create_task(
+            self.arequest(session, marker, webhook_name, webhook_options)
+        )
+        self.requests_in_flight.add(task)
+        task.add_done_callback(self.requests_in_flight.discard)
+
+    async def backoff(self, seconds: float):
+        """Wait before retrying, unless it's time to stop."""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def arequest(
+        self,
+        session,
+        marker: gelo.arch.Marker,
+        webhook_name: str,
+        webhook_options: dict,
+    ):
+        """Make one webhook request, retrying connection and server errors."""
+        payload = self.make_payload(webhook_options, marker)
+        method = webhook_options["method"]
+        if method == "GET":
+            self.log.warning(
+                "[{}] Non-repeatable GET requests are bad...".format(webhook_name)
+            )
+            kwargs = {"params": payload}
+        else:
+            kwargs = {"data": payload}
+        timeout = aiohttp.ClientTimeout(total=self.HTTP_TIMEOUT_SECS)
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                async with session.request(
+                    method, webhook_options["url"], timeout=timeout, **kwargs
+                ) as r:
+                    if r.status in self.RETRY_STATUSES and attempt < self.MAX_ATTEMPTS:
+                        await self.backoff(2 ** (attempt - 1))
+                        continue
+                    r.raise_for_status()
+                    self.log.info(
+                        "Request to {} made successfully.".format(webhook_name)
+                    )
+                    self.log.debug("Response data: {}".format(await r.read()))
+                    return
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ce:
+                self.log.warning(
+                    "Connection Error while trying to make a request to "
+                    "{}, attempt {}: {}".format(webhook_name, attempt, ce)
+                )
+                continue
+            except aiohttp.ClientError as re:
+                self.log.warning(
+                    "Non-retryable exception encountered while trying to make a "
+                    "request to {}: {}".format(webhook_name, re)
+                )
+                return
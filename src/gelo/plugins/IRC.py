@@ -4,9 +4,19 @@ import gelo.mediator
 import sys
 import ssl
 import queue
+import socket
+import asyncio
 import logging
 import irc.client
+import irc.client_aio
+import irc.strings
+import irc.connection
+import irc.schedule
+import datetime
 import functools
+from time import time
+from threading import Event, Lock, Thread
+from gelo.scheduler import PeriodicTask, shared_scheduler
 
 
 class IRC(gelo.arch.IMarkerSink):
@@ -27,6 +37,7 @@ class IRC(gelo.arch.IMarkerSink):
         else:
             self.log.debug("Disabling NickServ authentication")
             self.nickserv_enable = False
+            self.nickserv_pass = None
         self.server = self.config["server"]
         self.port = self.config["port"]
         self.tls = self.config["tls"]
@@ -39,9 +50,14 @@ class IRC(gelo.arch.IMarkerSink):
         self.message = self.config["message"]
         self.delayed = self.config["delayed"]
         self.channel = self.mediator.subscribe(
-            [gelo.arch.MarkerType.TRACK], IRC.__name__, delayed=self.delayed
+            [gelo.arch.MarkerType.TRACK],
+            IRC.__name__,
+            delayed=self.delayed,
+            marker_filter=gelo.arch.MarkerFilter.from_config(self.config),
         )
         self.ready = False
+        # Set when the plugin is ready to send, or should stop waiting to.
+        self.woken = Event()
 
     def on_connect(self, connection, event):
         self.log.debug("Finished connecting to IRC")
@@ -51,59 +67,42 @@ class IRC(gelo.arch.IMarkerSink):
             connection.join(self.send_to)
         else:
             self.ready = True
+            self.woken.set()
 
     def on_disconnect(self, connection, event):
         self.log.info("IRC server disconnected.")
         self.should_terminate = True
+        self.woken.set()
 
     def on_join(self, connection, event):
         self.log.debug("Joined output channel")
         self.ready = True
+        self.woken.set()
+
+    def deactivate(self):
+        super().deactivate()
+        self.woken.set()
 
     def run(self):
         """Run the code that will receive markers and post them to IRC."""
         self.log.debug("Plugin started")
-        reactor = irc.client.Reactor()
+        link = IrcLink.acquire(self)
         try:
-            wrapper = irc.client.connection.identity
-            if self.tls:
-                ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-                wrapper = functools.partial(
-                    ctx.wrap_socket, server_hostname=self.server
-                )
-            factory = irc.client.connection.Factory(ipv6=self.ipv6, wrapper=wrapper)
-            self.log.debug(
-                "Attempting to connect to %s:%s with nick %s"
-                % (self.server, self.port, self.nick)
-            )
-            c = reactor.server().connect(
-                self.server,
-                self.port,
-                self.nick,
-                password=self.nickserv_pass,
-                connect_factory=factory,
-                sasl_login=self.nick if self.nickserv_enable else None,
-            )
-            self.log.debug("Connected!")
-            c.add_global_handler("welcome", self.on_connect)
-            c.add_global_handler("disconnect", self.on_disconnect)
-            c.add_global_handler("join", self.on_join)
-
             while not self.should_terminate:
-                reactor.process_once(timeout=0.2)
-                self.main_once(c)
-        except irc.client.ServerConnectionError:
-            self.log.critical("IRC connection error: " + str(sys.exc_info()[1]))
+                self.main_once(link)
+        finally:
+            link.release(self, "Metadata system shutdown")
 
-    def main_once(self, connection: irc.client.ServerConnection, timeout=0.2):
+    def main_once(self, link: "IrcLink", timeout=None):
         """Fetch new markers from the queue and send them in IRC.
 
-        :param connection: The connection to the IRC server to send messages
-        via.
+        :param link: The connection to the IRC server to send messages via.
         :param timeout: The length of time (in seconds, float) to wait before
-        continuing.
+        continuing, or None to wait until there's something to do. The wait
+        is cut short when the plugin is deactivated, or its queue is closed.
         """
         if not self.ready:
+            self.woken.wait(timeout)
             return
         try:
             marker = next(self.channel.listen(timeout=timeout))
@@ -111,7 +110,7 @@ class IRC(gelo.arch.IMarkerSink):
                 return
             self.log.debug("Received marker from channel: %s" % marker)
             try:
-                self.send_message(marker, connection)
+                self.send_message(marker, link)
             except (irc.client.IRCError, ValueError, OSError) as e:
                 # Brought to you by https://00000ooooo.bandcamp.com/album/--5
                 self.log.warning("Failed to send IRC message because: %s" % e)
@@ -122,9 +121,8 @@ class IRC(gelo.arch.IMarkerSink):
         except gelo.mediator.UnsubscribeException:
             self.log.info("Queue closed, exiting...")
             self.should_terminate = True
-            connection.quit(message="Metadata system shutdown")
 
-    def send_message(self, marker: gelo.arch.Marker, c: irc.client.ServerConnection):
+    def send_message(self, marker: gelo.arch.Marker, c):
         """Use the provided connection to send a message (or several,
         if configured) about the provided marker.
         :param marker: The marker to message about.
@@ -211,3 +209,298 @@ class IRC(gelo.arch.IMarkerSink):
                         break
         if len(errors) > 0:
             raise gelo.conf.InvalidConfigurationError(errors)
+
+
+def seconds(period) -> float:
+    """Convert a period from the IRC library to seconds."""
+    if isinstance(period, datetime.timedelta):
+        return period.total_seconds()
+    return float(period)
+
+
+class IrcScheduler(irc.schedule.IScheduler):
+    """Run the IRC library's timed commands on Gelo's shared Scheduler.
+
+    Left to itself, the library runs them when the reactor's thread comes
+    around to check, which it would have to do every fraction of a second.
+    """
+
+    def __init__(self):
+        """Create a new IrcScheduler. The reactor sets its ``mutex``."""
+        self.mutex = None
+        self.tasks = []
+
+    def execute_every(self, period, func):
+        self.add(shared_scheduler().schedule_every(seconds(period), self.call, func))
+
+    def execute_at(self, when, func):
+        if isinstance(when, datetime.datetime):
+            when = when.timestamp()
+        self.execute_after(when - time(), func)
+
+    def execute_after(self, delay, func):
+        delay = max(seconds(delay), 0.0)
+        self.add(shared_scheduler().schedule(delay, self.call, func))
+
+    def run_pending(self):
+        # Everything runs on the shared scheduler, so nothing is ever left
+        # for the reactor to run.
+        pass
+
+    def add(self, task):
+        self.tasks = [
+            t
+            for t in self.tasks
+            if isinstance(t, PeriodicTask) or (t.lateness is None and not t.cancelled)
+        ]
+        self.tasks.append(task)
+
+    def call(self, func):
+        with self.mutex:
+            func()
+
+    def cancel_all(self):
+        """Cancel every command, once the connection is closed."""
+        for task in self.tasks:
+            shared_scheduler().cancel(task)
+        self.tasks = []
+
+
+class IrcReactor(irc.client.Reactor):
+    """A Reactor whose timed commands run on Gelo's shared Scheduler."""
+
+    scheduler_class = IrcScheduler
+
+    def __init__(self):
+        super().__init__()
+        self.scheduler.mutex = self.mutex
+
+
+class IrcLink(object):
+    """One IRC connection, shared by every IRC plugin that uses the same server
+    and nick.
+
+    When one process hosts several shows, each show has an IRC plugin of its
+    own, but they only need one connection between them: the link runs one
+    reactor thread, joins each plugin's channel, and passes the connection's
+    events on to the plugins they concern. The first plugin to connect
+    decides the NickServ password.
+    """
+
+    _links = {}
+    _links_lock = Lock()
+    # How often the thread checks whether the link was closed, if the server
+    # doesn't hang up first.
+    IDLE_SECS = 5.0
+
+    def __init__(self, plugin: IRC):
+        """Create a new link, using a plugin's connection settings.
+
+        Use ``acquire`` instead.
+        """
+        self.log = logging.getLogger("gelo.plugins.irc")
+        self.key = IrcLink.key_for(plugin)
+        self.server = plugin.server
+        self.port = plugin.port
+        self.nick = plugin.nick
+        self.password = plugin.nickserv_pass
+        self.sasl = plugin.nickserv_enable
+        self.tls = plugin.tls
+        self.ipv6 = plugin.ipv6
+        self.plugins = []
+        self.reactor = IrcReactor()
+        self.connection = None
+        self.welcome = None
+        # The join event for each channel the link is in, by lowercase name.
+        self.joined = {}
+        self.closed = False
+        self.thread = Thread(target=self.run, name="IRC-%s" % self.server, daemon=True)
+
+    @staticmethod
+    def key_for(plugin: IRC) -> tuple:
+        return plugin.server, plugin.port, plugin.nick, plugin.tls, plugin.ipv6
+
+    @classmethod
+    def acquire(cls, plugin: IRC) -> "IrcLink":
+        """Get the link for a plugin's server and nick, connecting if needed.
+
+        :param plugin: The plugin that will send messages over the link.
+        """
+        key = cls.key_for(plugin)
+        with cls._links_lock:
+            link = cls._links.get(key)
+            if link is None:
+                link = IrcLink(plugin)
+                cls._links[key] = link
+                link.thread.start()
+        with link.reactor.mutex:
+            link.plugins.append(plugin)
+            if link.welcome is not None:
+                # The server has already welcomed us, so catch up.
+                plugin.on_connect(link.connection, link.welcome)
+                # Joining a channel the link is already in gets no reply, so
+                # the plugin is told it's joined now.
+                join = link.joined.get(irc.strings.lower(plugin.send_to))
+                if join is not None:
+                    plugin.on_join(link.connection, join)
+        return link
+
+    def release(self, plugin: IRC, message: str) -> None:
+        """Stop sending messages for a plugin, disconnecting after the last.
+
+        :param plugin: The plugin that's done with the link.
+        :param message: The quit message.
+        """
+        # Event handlers run with the reactor's mutex held, and take the lock
+        # on the table of links, so take them in that order here too.
+        with self.reactor.mutex:
+            if plugin in self.plugins:
+                self.plugins.remove(plugin)
+            if self.plugins:
+                return
+            self.closed = True
+            with IrcLink._links_lock:
+                if IrcLink._links.get(self.key) is self:
+                    del IrcLink._links[self.key]
+            if self.connection is not None and self.connection.is_connected():
+                self.connection.quit(message=message)
+
+    def privmsg(self, target: str, text: str) -> None:
+        """Send a message, from any thread."""
+        with self.reactor.mutex:
+            self.connection.privmsg(target, text)
+
+    def run(self):
+        """Connect, and then process IRC events. This is the link's thread."""
+        try:
+            wrapper = irc.client.connection.identity
+            if self.tls:
+                ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+                wrapper = functools.partial(
+                    ctx.wrap_socket, server_hostname=self.server
+                )
+            factory = irc.client.connection.Factory(ipv6=self.ipv6, wrapper=wrapper)
+            self.log.debug(
+                "Attempting to connect to %s:%s with nick %s"
+                % (self.server, self.port, self.nick)
+            )
+            with self.reactor.mutex:
+                self.connection = self.reactor.server().connect(
+                    self.server,
+                    self.port,
+                    self.nick,
+                    password=self.password,
+                    connect_factory=factory,
+                    sasl_login=self.nick if self.sasl else None,
+                )
+                self.connection.add_global_handler("welcome", self.on_welcome)
+                self.connection.add_global_handler("disconnect", self.on_disconnect)
+                self.connection.add_global_handler("join", self.on_join)
+            self.log.debug("Connected!")
+            # Timed commands run on the shared scheduler, so the thread only
+            # has to wake up when the server sends something.
+            while not self.closed:
+                self.reactor.process_once(timeout=self.IDLE_SECS)
+        except irc.client.ServerConnectionError:
+            self.log.critical("IRC connection error: " + str(sys.exc_info()[1]))
+            self.on_disconnect(self.connection, None)
+        finally:
+            self.reactor.scheduler.cancel_all()
+
+    def on_welcome(self, connection, event):
+        self.welcome = event
+        for plugin in list(self.plugins):
+            plugin.on_connect(connection, event)
+
+    def on_join(self, connection, event):
+        nick = irc.strings.lower(connection.get_nickname())
+        if irc.strings.lower(event.source.nick) != nick:
+            return
+        self.joined[irc.strings.lower(event.target)] = event
+        for plugin in list(self.plugins):
+            if irc.strings.lower(event.target) == irc.strings.lower(plugin.send_to):
+                plugin.on_join(connection, event)
+
+    def on_disconnect(self, connection, event):
+        with IrcLink._links_lock:
+            self.closed = True
+            if IrcLink._links.get(self.key) is self:
+                del IrcLink._links[self.key]
+        for plugin in list(self.plugins):
+            plugin.on_disconnect(connection, event)
+
+
+class AsyncIRC(IRC, gelo.arch.IAsyncMarkerSink):
+    """Connect to IRC to send track names, on the event loop.
+
+    The asyncio IRC client doesn't support SASL, so if ``nickserv_pass`` is
+    set it is sent as the server password instead, which most services
+    packages accept as a way to identify.
+    """
+
+    def __init__(self, config, mediator: gelo.arch.IMediator, show: str):
+        super().__init__(config, mediator, show)
+        self.ready_event = None
+        self.task = None
+
+    def on_connect(self, connection, event):
+        super().on_connect(connection, event)
+        if self.ready:
+            self.ready_event.set()
+
+    def on_join(self, connection, event):
+        super().on_join(connection, event)
+        self.ready_event.set()
+
+    def on_disconnect(self, connection, event):
+        shutting_down = self.should_terminate
+        super().on_disconnect(connection, event)
+        # Stop waiting for markers; there's nowhere to send them anymore.
+        if not shutting_down and self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def arun(self):
+        """Run the code that will receive markers and post them to IRC."""
+        self.log.debug("Plugin started")
+        self.task = asyncio.current_task()
+        self.ready_event = asyncio.Event()
+        reactor = irc.client_aio.AioReactor(loop=asyncio.get_running_loop())
+        factory_args = {}
+        if self.tls:
+            factory_args["ssl"] = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        if self.ipv6:
+            factory_args["family"] = socket.AF_INET6
+        try:
+            self.log.debug(
+                "Attempting to connect to %s:%s with nick %s"
+                % (self.server, self.port, self.nick)
+            )
+            c = reactor.server()
+            c.add_global_handler("welcome", self.on_connect)
+            c.add_global_handler("disconnect", self.on_disconnect)
+            c.add_global_handler("join", self.on_join)
+            await c.connect(
+                self.server,
+                self.port,
+                self.nick,
+                password=self.nickserv_pass if self.nickserv_enable else None,
+                connect_factory=irc.connection.AioFactory(**factory_args),
+            )
+            self.log.debug("Connected!")
+            await self.ready_event.wait()
+            async for marker in self.channel.listen():
+                if not self.is_enabled:
+                    continue
+                self.log.debug("Received marker from channel: %s" % marker)
+                try:
+                    self.send_message(marker, c)
+                except (irc.client.IRCError, ValueError, OSError) as e:
+                    self.log.warning("Failed to send IRC message because: %s" % e)
+        except gelo.mediator.UnsubscribeException:
+            self.log.info("Queue closed, exiting...")
+            self.should_terminate = True
+            c.disconnect("Metadata system shutdown")
+        except asyncio.CancelledError:
+            self.log.info("Stopped sending markers to IRC.")
+        except (irc.client.ServerConnectionError, OSError):
+            self.log.critical("IRC connection error: " + str(sys.exc_info()[1]))
@@ -0,0 +1,376 @@
+import os
+import hmac
+import base64
+import logging
+import binascii
+from threading import Event, Lock, Thread
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gelo import arch, conf, sidecar
+from gelo.plugins.IcyReader import stream_title_to_marker
+
+log = logging.getLogger("gelo.plugins.IcecastReceiver")
+
+METADATA_RESPONSE = (
+    b'<?xml version="1.0"?>\n<iceresponse><message>Metadata update successful'
+    b"</message><return>1</return></iceresponse>\n"
+)
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    """Speak just enough of Icecast's protocol to take a stream from Traktor.
+
+    A source client sends its stream with SOURCE (or PUT, since Icecast 2.4)
+    and its track changes with GET /admin/metadata. Each request is handed to
+    the IcecastReceiver for its mount, by the IcecastListener that the server
+    this handler belongs to has as its ``listener``.
+    """
+
+    server_version = "Icecast 2.4.4"
+    # How long a source can go quiet before it's hung up on.
+    timeout = 30
+
+    def do_SOURCE(self):
+        self.receive_stream()
+
+    def do_PUT(self):
+        self.receive_stream()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/admin/metadata":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        mount = query.get("mount", [None])[0]
+        plugin = self.server.listener.receiver_for(mount)
+        if plugin is None:
+            self.send_error(404)
+            return
+        if not self.authorized(plugin):
+            return
+        if query.get("mode", [None])[0] != "updinfo":
+            self.send_error(400)
+            return
+        if "song" in query:
+            song = query["song"][0]
+        else:
+            song = " - ".join(
+                query[key][0] for key in ["artist", "title"] if key in query
+            )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(METADATA_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(METADATA_RESPONSE)
+        self.wfile.flush()
+        plugin.handle_song(song)
+
+    def authorized(self, plugin: "IcecastReceiver") -> bool:
+        """Check the request's credentials, and turn it away if they're wrong.
+
+        :param plugin: The IcecastReceiver the request is for.
+        :return: Whether the request may go ahead.
+        """
+        scheme, _, credentials = self.headers.get("Authorization", "").partition(" ")
+        try:
+            decoded = base64.b64decode(credentials, validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            decoded = ""
+        if scheme.lower() == "basic" and plugin.check_credentials(decoded):
+            return True
+        self.send_response(401)
+        self.send_header("WWW-Authenticate", 'Basic realm="Icecast2 Server"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return False
+
+    def receive_stream(self):
+        """Take a source's stream, and throw it away or save it."""
+        mount = urlsplit(self.path).path
+        plugin = self.server.listener.receiver_for(mount)
+        if plugin is None:
+            self.send_error(404)
+            return
+        if not self.authorized(plugin):
+            return
+        if not plugin.claim(mount):
+            self.send_error(403, "Mountpoint in use")
+            return
+        try:
+            if self.headers.get("Expect", "").lower() == "100-continue":
+                self.send_response_only(100)
+                self.end_headers()
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.flush()
+            plugin.log.info("source connected to %s", mount)
+            plugin.receive_audio(self.rfile)
+            plugin.log.info("source disconnected from %s", mount)
+        finally:
+            plugin.release(mount)
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+class IcecastListener(object):
+    """One HTTP server, taking sources for the IcecastReceivers of every show
+    that listens on the same address and port, each on its own mount.
+
+    Shows hosted by the same process can't each bind the same port, so the
+    first receiver to ask for an address and port gets a new listener, and
+    the others share it. The listener stops once the last one releases it.
+    """
+
+    listeners = {}
+    lock = Lock()
+
+    def __init__(self, address: str, port: int):
+        """Create a new IcecastListener, bound but not serving yet.
+
+        :raises OSError: If the address and port can't be listened on.
+        """
+        self.server = ThreadingHTTPServer((address, port), SourceHandler)
+        self.server.listener = self
+        self.key = (address, port)
+        # The receiver for each mount, where None is every mount.
+        self.receivers = {}
+        self.thread = None
+
+    @classmethod
+    def acquire(cls, plugin: "IcecastReceiver") -> "IcecastListener":
+        """Get the listener for a receiver's address and port, and give the
+        receiver its mount on it.
+
+        :raises conf.InvalidConfigurationError: If the port can't be listened
+        on, or another show already takes sources on the mount.
+        """
+        address, port = plugin.config["address"], plugin.config["port"]
+        with cls.lock:
+            # Port 0 picks a free port, so it's never shared.
+            listener = cls.listeners.get((address, port)) if port != 0 else None
+            if listener is None:
+                try:
+                    listener = cls(address, port)
+                except OSError as e:
+                    raise conf.InvalidConfigurationError(
+                        [
+                            "[plugin:IcecastReceiver] can't listen on %s:%s: %s"
+                            % (address, port, e)
+                        ]
+                    )
+                if port != 0:
+                    cls.listeners[listener.key] = listener
+            # A receiver for every mount can't share with any other.
+            if plugin.mount is None and listener.receivers:
+                taken = next(iter(listener.receivers.values()))
+            else:
+                taken = listener.receivers.get(plugin.mount)
+                taken = taken or listener.receivers.get(None)
+            if taken is not None:
+                raise conf.InvalidConfigurationError(
+                    [
+                        "[plugin:IcecastReceiver] show %s takes sources on %s at "
+                        "%s:%s already; give each show its own mount or port"
+                        % (
+                            taken.show,
+                            taken.mount or "every mount",
+                            address,
+                            port,
+                        )
+                    ]
+                )
+            listener.receivers[plugin.mount] = plugin
+        return listener
+
+    def start(self) -> None:
+        """Start serving, unless another receiver already started it."""
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(
+                    target=self.server.serve_forever,
+                    kwargs={"poll_interval": 0.5},
+                    name="IcecastListener",
+                    daemon=True,
+                )
+                self.thread.start()
+                log.info("listening on %s:%d", *self.server.server_address[:2])
+
+    def release(self, plugin: "IcecastReceiver") -> None:
+        """Stop taking sources for a receiver, and stop serving after the
+        last one."""
+        with self.lock:
+            if self.receivers.get(plugin.mount) is plugin:
+                del self.receivers[plugin.mount]
+            if self.receivers:
+                return
+            if self.listeners.get(self.key) is self:
+                del self.listeners[self.key]
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
+
+    def receiver_for(self, mount: str | None) -> "IcecastReceiver | None":
+        """Get the receiver that takes sources on a mount, if any."""
+        if mount is None:
+            return None
+        with self.lock:
+            return self.receivers.get(mount) or self.receivers.get(None)
+
+
+class IcecastReceiver(arch.IMarkerSource):
+    """Pretend to be an Icecast server, and mark the tracks sent to it."""
+
+    PLUGIN_MODULE_NAME = "IcecastReceiver"
+    BUFFER_SIZE = 16384
+
+    def __init__(self, config, mediator: arch.IMediator, show: str):
+        """Create a new instance of IcecastReceiver, listening on its port."""
+        super().__init__(config, mediator, show)
+        self.log = logging.getLogger("gelo.plugins.IcecastReceiver")
+        self.config_test()
+        self.mount = self.config.get("mount")
+        self.username = self.config["username"]
+        self.password = self.config["password"]
+        self.audio_file = self.config.get("audio_file")
+        self.prefix = None
+        if "prefix_file" in self.config:
+            self.prefix = sidecar.SidecarFile(
+                self.config["prefix_file"], sidecar.parse_prefix, self.prefix_changed
+            )
+        # The last marker published, to mark again if the prefix changes.
+        self.last_marker = None
+        self.last_song = None
+        # Metadata updates are handled on the listener's threads, several at
+        # once, so the last song and marker are only touched with this held.
+        self.song_lock = Lock()
+        self.mounts_lock = Lock()
+        self.mounts_in_use = set()
+        self.stopped = Event()
+        # Bind now, so a port or mount that can't be had is a config error.
+        self.listener = IcecastListener.acquire(self)
+
+    def run(self):
+        """Take connections from source clients until deactivated.
+        This should be run as a thread."""
+        sidecar.watch(self.prefix)
+        self.listener.start()
+        try:
+            self.stopped.wait()
+        finally:
+            sidecar.unwatch(self.prefix)
+            self.listener.release(self)
+
+    def deactivate(self):
+        super().deactivate()
+        self.stopped.set()
+
+    def check_credentials(self, credentials: str) -> bool:
+        """Check a "username:password" pair from a request."""
+        expected = "%s:%s" % (self.username, self.password)
+        return hmac.compare_digest(credentials.encode(), expected.encode())
+
+    def claim(self, mount: str) -> bool:
+        """Claim a mount for a source, if no other source has it.
+
+        :return: Whether the mount was claimed.
+        """
+        with self.mounts_lock:
+            if mount in self.mounts_in_use:
+                return False
+            self.mounts_in_use.add(mount)
+            return True
+
+    def release(self, mount: str):
+        """Let another source use a mount."""
+        with self.mounts_lock:
+            self.mounts_in_use.discard(mount)
+
+    def receive_audio(self, stream):
+        """Read a source's audio until it hangs up.
+
+        The audio is read into one buffer, over and over, and written from it
+        to the audio file if there is one.
+
+        :param stream: Where to read the audio from.
+        """
+        buffer = memoryview(bytearray(self.BUFFER_SIZE))
+        audio = None
+        if self.audio_file is not None:
+            audio = open(self.audio_file, "ab")
+        try:
+            while not self.should_terminate:
+                n = stream.readinto(buffer)
+                if not n:
+                    break
+                if audio is not None:
+                    audio.write(buffer[:n])
+        except OSError as e:
+            self.log.info("error while receiving audio: %s", e)
+        finally:
+            if audio is not None:
+                audio.close()
+
+    def handle_song(self, song: str):
+        """Publish a marker for a metadata update, if the song is new.
+
+        :param song: The song, as the source client described it.
+        """
+        with self.song_lock:
+            if song == self.last_song:
+                return
+            self.last_song = song
+            if song.strip() == "":
+                self.log.info("ignoring empty track metadata")
+                return
+            if not self.is_enabled:
+                return
+            special = self.prefix.value if self.prefix is not None else None
+            m = stream_title_to_marker(song, special)
+            self.mediator.publish(arch.MarkerType.TRACK, m)
+            self.last_marker = m
+
+    def prefix_changed(self, special: str | None):
+        """Mark the current track again, with its new special status, if the
+        prefix file changed partway through it and that's wanted.
+
+        :param special: The new special status.
+        """
+        if not self.config["mark_prefix_changes"] or not self.is_enabled:
+            return
+        with self.song_lock:
+            if self.last_marker is None:
+                return
+            self.last_marker = self.last_marker.replace(special=special)
+            self.mediator.publish(arch.MarkerType.TRACK, self.last_marker)
+
+    def config_test(self):
+        """Test the configuration to ensure that it contains the required items.
+        Also, convert any configuration items to the right formats, and perform
+        variable expansions.
+        """
+        errors = []
+        if "password" not in self.config:
+            errors.append(
+                '[plugin:IcecastReceiver] does not have the required key "password"'
+            )
+        self.config.setdefault("username", "source")
+        self.config.setdefault("address", "127.0.0.1")
+        self.config.setdefault("port", 8000)
+        if type(self.config["port"]) is not int or not 0 <= self.config["port"] < 2**16:
+            errors.append('[plugin:IcecastReceiver] "port" must be a port number')
+        if "mount" in self.config and not self.config["mount"].startswith("/"):
+            errors.append('[plugin:IcecastReceiver] "mount" must start with "/"')
+        if "audio_file" in self.config:
+            self.config["audio_file"] = os.path.expandvars(self.config["audio_file"])
+        self.config.setdefault("mark_prefix_changes", False)
+        if type(self.config["mark_prefix_changes"]) is not bool:
+            errors.append(
+                '[plugin:IcecastReceiver] "mark_prefix_changes" must be a bool'
+            )
+        # Throw exception if necessary.
+        if len(errors) > 0:
+            raise conf.InvalidConfigurationError(errors)
@@ -0,0 +1,349 @@
+import re
+import socket
+import asyncio
+import logging
+import http.client
+from threading import Event
+from urllib.parse import urlsplit
+from gelo import arch, conf, shared, sidecar
+
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp is only needed by AsyncIcyReader, which checks for it.
+    aiohttp = None
+
+
+class IcyError(Exception):
+    """The server didn't send a stream with ICY metadata in it."""
+
+    pass
+
+
+class IcyDemuxer(object):
+    """Pick the metadata blocks out of an ICY stream.
+
+    A server that was asked for ``Icy-MetaData: 1`` sends ``icy-metaint``
+    bytes of audio, then one length byte, then that many times 16 bytes of
+    metadata, and so on. The audio is only counted past, never copied; only
+    the metadata blocks are kept.
+    """
+
+    def __init__(self, metaint: int):
+        """Create a new IcyDemuxer, at the start of a stream.
+
+        :param metaint: The number of audio bytes between metadata blocks.
+        """
+        self.metaint = metaint
+        self.audio_left = metaint
+        # How much of the current metadata block is still to come, or None
+        # if the length byte is next.
+        self.meta_left = None
+        self.meta = bytearray()
+
+    def feed(self, data) -> list[bytes]:
+        """Take the next piece of the stream.
+
+        :param data: Bytes from the stream, of any length.
+        :return: The metadata blocks that were completed by this piece, with
+        their padding removed. Empty blocks aren't returned.
+        """
+        view = memoryview(data)
+        pos = 0
+        end = len(view)
+        blocks = []
+        while pos < end:
+            if self.audio_left > 0:
+                step = min(self.audio_left, end - pos)
+                self.audio_left -= step
+                pos += step
+            elif self.meta_left is None:
+                self.meta_left = view[pos] * 16
+                pos += 1
+                if self.meta_left == 0:
+                    self.meta_left = None
+                    self.audio_left = self.metaint
+            else:
+                step = min(self.meta_left, end - pos)
+                self.meta += view[pos : pos + step]
+                self.meta_left -= step
+                pos += step
+                if self.meta_left == 0:
+                    block = bytes(self.meta.rstrip(b"\0"))
+                    if block:
+                        blocks.append(block)
+                    self.meta.clear()
+                    self.meta_left = None
+                    self.audio_left = self.metaint
+        return blocks
+
+
+STREAM_TITLE = re.compile(r"StreamTitle='(.*?)';(?=\w+=|$)", re.S)
+
+
+def parse_stream_title(block: bytes) -> str | None:
+    """Get the StreamTitle out of a metadata block.
+
+    :param block: A metadata block, like ``StreamTitle='Artist - Title';``.
+    :return: The title, or None if the block doesn't have one.
+    """
+    try:
+        text = block.decode("utf-8")
+    except UnicodeDecodeError:
+        # Older sources send Latin-1, which can decode anything.
+        text = block.decode("latin-1")
+    g = STREAM_TITLE.search(text)
+    return g.group(1) if g is not None else None
+
+
+def stream_title_to_marker(stream_title: str, special: str | None) -> arch.Marker:
+    """Make a marker from a StreamTitle.
+
+    Icecast joins the artist and title with " - ", so a StreamTitle with that
+    in it is split back up. One without is used as the label as it is.
+
+    :param stream_title: The StreamTitle.
+    :param special: The special status to give the marker, if any.
+    """
+    if " - " in stream_title:
+        artist, title = stream_title.split(" - ", 1)
+        if artist.strip() != "" and title.strip() != "":
+            return arch.Marker(artist=artist, title=title, special=special)
+    return arch.Marker(stream_title, special=special)
+
+
+class IcyReader(arch.IMarkerSource):
+    """Read the track metadata from an Icecast stream as it's sent."""
+
+    PLUGIN_MODULE_NAME = "IcyReader"
+    # Audio never stops flowing on a live stream, so waiting this long for any
+    # of it means the stream has died.
+    TIMEOUT_SECS = 15.0
+    BUFFER_SIZE = 16384
+
+    def __init__(self, config, mediator: arch.IMediator, show: str):
+        """Create a new instance of IcyReader."""
+        super().__init__(config, mediator, show)
+        self.log = logging.getLogger("gelo.plugins.IcyReader")
+        self.config_test()
+        self.stream_url = self.config["stream_url"]
+        self.prefix = None
+        if "prefix_file" in self.config:
+            self.prefix = sidecar.SidecarFile(
+                self.config["prefix_file"], sidecar.parse_prefix, self.prefix_changed
+            )
+        # The last marker published, to mark again if the prefix changes.
+        self.last_marker = None
+        self.last_title = None
+        self.reconnect_delay = self.config["min_reconnect_delay"]
+        self.sock = None
+        # Set to cut a wait between connections short.
+        self.wakeup = Event()
+
+    def run(self):
+        """Read the stream, connecting again whenever it drops.
+        This should be run as a thread."""
+        self.log.info("now running")
+        sidecar.watch(self.prefix)
+        try:
+            while not self.should_terminate:
+                try:
+                    self.read_stream()
+                except (OSError, http.client.HTTPException, IcyError) as e:
+                    if self.should_terminate:
+                        break
+                    self.log.info("error while reading stream: %s", e)
+                self.wait_to_reconnect()
+        finally:
+            sidecar.unwatch(self.prefix)
+
+    def deactivate(self):
+        super().deactivate()
+        self.wakeup.set()
+        sock = self.sock
+        if sock is not None:
+            # Wake the thread up if it's waiting for the stream.
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def wait_to_reconnect(self):
+        """Wait before connecting again, longer each time it fails in a row."""
+        if self.should_terminate:
+            return
+        self.log.info("reconnecting in %.1f s", self.reconnect_delay)
+        self.wakeup.wait(self.reconnect_delay)
+        self.reconnect_delay = min(
+            self.reconnect_delay * 2, self.config["max_reconnect_delay"]
+        )
+
+    def read_stream(self):
+        """Connect to the stream, and read it until it ends."""
+        url = urlsplit(self.stream_url)
+        if url.scheme == "https":
+            connection_class = http.client.HTTPSConnection
+        else:
+            connection_class = http.client.HTTPConnection
+        connection = connection_class(url.hostname, url.port, timeout=self.TIMEOUT_SECS)
+        response = None
+        try:
+            connection.connect()
+            # The connection lets go of its socket once the response starts,
+            # so keep hold of it for deactivate.
+            self.sock = connection.sock
+            path = url.path or "/"
+            if url.query:
+                path += "?" + url.query
+            connection.request(
+                "GET", path, headers={"Icy-MetaData": "1", "User-Agent": "Gelo"}
+            )
+            response = connection.getresponse()
+            demuxer = IcyDemuxer(
+                self.check_response(response.status, response.getheader("icy-metaint"))
+            )
+            self.reconnect_delay = self.config["min_reconnect_delay"]
+            self.log.info("connected to %s", self.stream_url)
+            buffer = memoryview(bytearray(self.BUFFER_SIZE))
+            while not self.should_terminate:
+                n = response.readinto(buffer)
+                if n == 0:
+                    raise IcyError("the stream ended")
+                for block in demuxer.feed(buffer[:n]):
+                    self.handle_block(block)
+        finally:
+            self.sock = None
+            if response is not None:
+                response.close()
+            connection.close()
+
+    def check_response(self, status: int, metaint_header: str | None) -> int:
+        """Make sure the server sent a stream with metadata in it.
+
+        :param status: The HTTP status code.
+        :param metaint_header: The icy-metaint header, if there was one.
+        :return: The number of audio bytes between metadata blocks.
+        """
+        if status != 200:
+            raise IcyError("the server responded with status %d" % status)
+        try:
+            metaint = int(metaint_header)
+        except (TypeError, ValueError):
+            raise IcyError("the server didn't send a valid icy-metaint")
+        if metaint <= 0:
+            raise IcyError("the server didn't send a valid icy-metaint")
+        return metaint
+
+    def handle_block(self, block: bytes):
+        """Publish a marker for a metadata block, if the title is new.
+
+        :param block: A metadata block from the stream.
+        """
+        stream_title = parse_stream_title(block)
+        if stream_title is None or stream_title == self.last_title:
+            return
+        self.last_title = stream_title
+        if stream_title.strip() == "":
+            self.log.info("ignoring empty track metadata")
+            return
+        if not self.is_enabled:
+            return
+        special = self.prefix.value if self.prefix is not None else None
+        m = stream_title_to_marker(stream_title, special)
+        self.mediator.publish(arch.MarkerType.TRACK, m)
+        self.last_marker = m
+
+    def prefix_changed(self, special: str | None):
+        """Mark the current track again, with its new special status, if the
+        prefix file changed partway through it and that's wanted.
+
+        :param special: The new special status.
+        """
+        if not self.config["mark_prefix_changes"] or not self.is_enabled:
+            return
+        if self.last_marker is None:
+            return
+        self.last_marker = self.last_marker.replace(special=special)
+        self.mediator.publish(arch.MarkerType.TRACK, self.last_marker)
+
+    def config_test(self):
+        """Test the configuration to ensure that it contains the required items.
+        Also, convert any configuration items to the right formats, and perform
+        variable expansions.
+        """
+        errors = []
+        if "stream_url" not in self.config:
+            errors.append(
+                '[plugin:IcyReader] does not have the required key "stream_url"'
+            )
+        elif urlsplit(self.config["stream_url"]).scheme not in ["http", "https"]:
+            errors.append('[plugin:IcyReader] "stream_url" must be an HTTP URL')
+        self.config.setdefault("min_reconnect_delay", 1.0)
+        self.config.setdefault("max_reconnect_delay", 30.0)
+        for key in ["min_reconnect_delay", "max_reconnect_delay"]:
+            if type(self.config[key]) not in [int, float]:
+                errors.append('[plugin:IcyReader] has a non-numeric "%s"' % key)
+            elif self.config[key] <= 0:
+                errors.append('[plugin:IcyReader] "%s" must be positive' % key)
+        self.config.setdefault("mark_prefix_changes", False)
+        if type(self.config["mark_prefix_changes"]) is not bool:
+            errors.append('[plugin:IcyReader] "mark_prefix_changes" must be a bool')
+        # Throw exception if necessary.
+        if len(errors) > 0:
+            raise conf.InvalidConfigurationError(errors)
+
+
+class AsyncIcyReader(IcyReader, arch.IAsyncMarkerSource):
+    """Read the track metadata from an Icecast stream, on the event loop."""
+
+    def __init__(self, config, mediator: arch.IMediator, show: str):
+        """Create a new instance of AsyncIcyReader."""
+        super().__init__(config, mediator, show)
+        if aiohttp is None:
+            raise conf.InvalidConfigurationError(
+                ['engine = "asyncio" requires aiohttp. Install gelo[aio].']
+            )
+
+    async def arun(self):
+        """Read the stream, connecting again whenever it drops."""
+        self.log.info("now running")
+        # Shared with every other show in the process.
+        session = shared.aio_http_session()
+        sidecar.watch(self.prefix)
+        try:
+            while not self.should_terminate:
+                try:
+                    await self.aread_stream(session)
+                except (aiohttp.ClientError, asyncio.TimeoutError, IcyError) as e:
+                    self.log.info("error while reading stream: %s", e)
+                if self.should_terminate:
+                    break
+                self.log.info("reconnecting in %.1f s", self.reconnect_delay)
+                await asyncio.sleep(self.reconnect_delay)
+                self.reconnect_delay = min(
+                    self.reconnect_delay * 2, self.config["max_reconnect_delay"]
+                )
+        finally:
+            sidecar.unwatch(self.prefix)
+
+    async def aread_stream(self, session):
+        """Connect to the stream, and read it until it ends."""
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.TIMEOUT_SECS, sock_read=self.TIMEOUT_SECS
+        )
+        async with session.get(
+            self.stream_url, headers={"Icy-MetaData": "1"}, timeout=timeout
+        ) as response:
+            demuxer = IcyDemuxer(
+                self.check_response(
+                    response.status, response.headers.get("icy-metaint")
+                )
+            )
+            self.reconnect_delay = self.config["min_reconnect_delay"]
+            self.log.info("connected to %s", self.stream_url)
+            async for chunk in response.content.iter_any():
+                if self.should_terminate:
+                    return
+                for block in demuxer.feed(chunk):
+                    self.handle_block(block)
+            raise IcyError("the stream ended")
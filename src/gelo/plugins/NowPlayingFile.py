@@ -13,8 +13,14 @@ class NowPlayingFile(arch.IMarkerSink):
         super().__init__(config, med, show)
         self.validate_config()
         self.delayed = self.config["delayed"]
+        # Only the newest marker matters, so if the file falls behind there's
+        # no point writing out the stale ones.
         self.channel = self.mediator.subscribe(
-            [arch.MarkerType.TRACK], NowPlayingFile.__name__, delayed=self.delayed
+            [arch.MarkerType.TRACK],
+            NowPlayingFile.__name__,
+            delayed=self.delayed,
+            policy=arch.BackpressurePolicy.COALESCE,
+            marker_filter=arch.MarkerFilter.from_config(self.config),
         )
 
     def run(self):
@@ -24,16 +30,20 @@ class NowPlayingFile(arch.IMarkerSink):
                 marker = next(self.channel.listen())
                 if not self.is_enabled:
                     continue
-                with open(self.config["path"], "wb") as f:
-                    # B.U.T.T. doesn't Do the Right Thing™ when encountering
-                    # Unicode characters.
-                    text = marker.label.replace("—", "-")
-                    f.write(text.encode("latin-1", "ignore"))
+                self.write_marker(marker)
             except queue.Empty:
                 continue
             except mediator.UnsubscribeException:
                 self.should_terminate = True
 
+    def write_marker(self, marker: arch.Marker):
+        """Replace the contents of the file with the marker's label."""
+        with open(self.config["path"], "wb") as f:
+            # B.U.T.T. doesn't Do the Right Thing™ when encountering
+            # Unicode characters.
+            text = marker.label.replace("—", "-")
+            f.write(text.encode("latin-1", "ignore"))
+
     def validate_config(self):
         """Ensure the configuration is valid, and perform path expansion."""
         errors = []
@@ -54,3 +64,19 @@ class NowPlayingFile(arch.IMarkerSink):
         # Return errors, if any
         if len(errors) > 0:
             raise conf.InvalidConfigurationError(errors)
+
+
+class AsyncNowPlayingFile(NowPlayingFile, arch.IAsyncMarkerSink):
+    """Write the current TRACK marker to a text file, on the event loop."""
+
+    async def arun(self):
+        """Run the marker-receiving code."""
+        try:
+            async for marker in self.channel.listen():
+                if not self.is_enabled:
+                    continue
+                # The file is tiny and local, so writing it inline is quicker
+                # than handing it off to a thread.
+                self.write_marker(marker)
+        except mediator.UnsubscribeException:
+            self.should_terminate = True
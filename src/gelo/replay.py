@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""Replay a recorded show through the configured sinks.
+
+``gelo replay`` reads the markers from an Audacity label file or a marker
+journal and publishes them through a real Mediator, to the sink plugins in
+the configuration, at the original pace, some multiple of it, or as fast as
+the sinks will take them. Marker times are the recorded ones no matter the
+speed, so the sinks write what they wrote during the show.
+"""
+
+import json
+import logging
+import itertools
+from threading import Event
+from time import perf_counter_ns, sleep
+from gelo import arch, journal, mediator
+from gelo.clock import MarkerClock
+from gelo.main import GeloPluginManager
+
+# What separates the artist from the title in a label. Gelo joins them with
+# an em dash; older label files, and people, use a hyphen.
+ARTIST_TITLE_SEPARATORS = [" — ", " - "]
+
+
+def read_audacity_labels(path: str) -> list[tuple[arch.MarkerType, arch.Marker]]:
+    """Read the markers from a label file written by AudacityLabels.
+
+    The "PROGRAM RESTART" lines that AudacityLabels writes when it's started
+    again are skipped.
+
+    :param path: The label file.
+    :return: The TRACK markers, with their recorded times.
+    """
+    markers = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line == "":
+                continue
+            start, _, label = line.split("\t", 2)
+            if label == "PROGRAM RESTART":
+                continue
+            artist, title = None, None
+            for separator in ARTIST_TITLE_SEPARATORS:
+                if separator in label:
+                    artist, title = label.split(separator, 1)
+                    break
+            marker = arch.Marker.withtime(
+                label, float(start), artist=artist, title=title
+            )
+            markers.append((arch.MarkerType.TRACK, marker))
+    return markers
+
+
+def read_journal(path: str) -> list[tuple[arch.MarkerType, arch.Marker]]:
+    """Read every marker published in a journal.
+
+    :param path: The journal file.
+    :return: The markers, with their recorded times.
+    """
+    return [(p.marker_type, p.marker) for p in journal.read_published(path)]
+
+
+def read_session(path: str) -> list[tuple[arch.MarkerType, arch.Marker]]:
+    """Read a recorded session, working out what kind of file it is.
+
+    :param path: An Audacity label file or a marker journal.
+    :return: The markers, with their recorded times.
+    """
+    with open(path, "rb") as f:
+        head = f.read(4096)
+    try:
+        lines = head.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        lines = []
+    if lines and all(line.count("\t") >= 2 for line in lines[:-1] or lines):
+        return read_audacity_labels(path)
+    return read_journal(path)
+
+
+class ReplayClock(MarkerClock):
+    """A MarkerClock that reads whatever time the replay has got up to."""
+
+    def __init__(self):
+        """Create a new ReplayClock, at the start of the recording."""
+        super().__init__()
+        self.current_ns = self.mono_anchor_ns
+
+    def now_ns(self) -> int:
+        return self.current_ns
+
+    def seek(self, marker_time_ns: int) -> None:
+        """Move the clock to a marker time in the recording."""
+        self.current_ns = self.mono_anchor_ns + marker_time_ns
+
+
+class Replayer(object):
+    """Publish recorded markers to a Mediator on the recorded schedule."""
+
+    def __init__(
+        self,
+        m: mediator.Mediator,
+        clock: ReplayClock,
+        markers: list[tuple[arch.MarkerType, arch.Marker]],
+        speed: float | None = 1.0,
+    ):
+        """Create a new Replayer.
+
+        :param m: The Mediator to publish to. It must use ``clock``.
+        :param clock: The Mediator's clock.
+        :param markers: The markers to replay, with their recorded times.
+        :param speed: How many times faster than the recording to go, or
+        None to go as fast as possible.
+        """
+        self.log = logging.getLogger("gelo.replay")
+        self.mediator = m
+        self.clock = clock
+        self.markers = markers
+        self.speed = speed
+
+    def run(self) -> None:
+        """Publish every marker, waiting between them as needed."""
+        # Marker times from the recording are kept as they are.
+        self.mediator.first_ns = self.clock.mono_anchor_ns
+        start_ns = perf_counter_ns()
+        if not self.markers:
+            return
+        base_ns = self.markers[0][1].time_ns
+        # Markers recorded at the same time (like the ones a source published
+        # together) are published together, which is much cheaper when going
+        # as fast as possible.
+        runs = itertools.groupby(self.markers, key=lambda m: m[1].time_ns)
+        for time_ns, run in runs:
+            if self.speed is not None:
+                due_ns = start_ns + (time_ns - base_ns) / self.speed
+                remaining = (due_ns - perf_counter_ns()) / 1e9
+                if remaining > 0:
+                    sleep(remaining)
+            self.clock.seek(time_ns)
+            run = list(run)
+            self.log.debug("Replaying %d markers at %d ns" % (len(run), time_ns))
+            if len(run) == 1:
+                self.mediator.publish(*run[0])
+            else:
+                self.mediator.publish_many(run)
+        # Let the delayed subscribers catch up before reporting. This is
+        # scheduled after the last delayed delivery, so it runs after it.
+        delivered = Event()
+        self.mediator.scheduler.schedule(self.mediator.broadcast_delay, delivered.set)
+        delivered.wait()
+
+
+def report(markers: int, elapsed_ns: int, metrics: dict) -> dict:
+    """Summarize a replay.
+
+    :param markers: The number of markers replayed.
+    :param elapsed_ns: How long the replay took, until the sinks finished.
+    :param metrics: The Mediator's metrics, once the sinks have finished.
+    """
+    elapsed = elapsed_ns / 1e9
+    return {
+        "markers": markers,
+        "elapsed": elapsed,
+        "markers_per_second": markers / elapsed if elapsed > 0 else None,
+        "metrics": metrics,
+    }
+
+
+def print_report(summary: dict) -> None:
+    """Print a replay summary for people."""
+
+    def ms(ns):
+        return "-" if ns is None else "%.2f" % (ns / 1e6)
+
+    rate = summary["markers_per_second"]
+    print(
+        "Replayed %d markers in %.3f s (%s markers/s)"
+        % (
+            summary["markers"],
+            summary["elapsed"],
+            "-" if rate is None else "%.1f" % rate,
+        )
+    )
+    for name, stats in summary["metrics"]["subscribers"].items():
+        h = stats["delivery_latency"]
+        print(
+            "\t%s: %d delivered, %d dropped, max depth %d, p50 %s ms, p99 %s ms"
+            % (
+                name,
+                stats["dequeued"],
+                stats["dropped"],
+                stats["high_water"],
+                ms(h["p50"]),
+                ms(h["p99"]),
+            )
+        )
+
+
+def main(configuration, session: str, speed: float | None, delay: bool, output=None):
+    """Replay a recorded session through the configured sinks.
+
+    :param configuration: The Gelo configuration.
+    :param session: An Audacity label file or a marker journal.
+    :param speed: How many times faster than the recording to go, or None to
+    go as fast as possible.
+    :param delay: Whether to keep the broadcast delay (scaled by the speed).
+    :param output: A file to write the summary to as JSON, if any.
+    """
+    logging.basicConfig(
+        filename=configuration.log_file,
+        format="%(asctime)s %(levelname)-8s %(name)s:%(message)s",
+    )
+    log = logging.getLogger("gelo")
+    log.setLevel(configuration.log_level)
+    markers = read_session(session)
+    log.info("Replaying %d markers from %s" % (len(markers), session))
+    broadcast_delay = 0.0
+    if delay and speed is not None:
+        broadcast_delay = configuration.broadcast_delay / speed
+    clock = ReplayClock()
+    m = mediator.Mediator(
+        broadcast_delay,
+        clock=clock,
+        lanes=[arch.MarkerType.from_string(name) for name in configuration.lanes],
+    )
+    gpm = GeloPluginManager(configuration, m, configuration.show)
+    # Only the sinks take part; the sources would publish live markers.
+    gpm.pluginClasses = [
+        c
+        for c in gpm.pluginClasses
+        if issubclass(c, arch.IMarkerSink)
+        and c.PLUGIN_MODULE_NAME in configuration.plugins
+    ]
+    gpm.runAll()
+    start_ns = perf_counter_ns()
+    Replayer(m, clock, markers, speed).run()
+    # Sinks may have delayed work of their own (like HttpPusher's
+    # extra_delay) on the scheduler, which terminating would throw away.
+    m.scheduler.flush()
+    m.terminate()
+    gpm.joinAll()
+    summary = report(len(markers), perf_counter_ns() - start_ns, m.metrics())
+    print_report(summary)
+    if output is not None:
+        json.dump(summary, output, indent=2)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""Run delayed and periodic work on a single thread.
+
+Gelo delays markers by the broadcast delay (and, for some webhooks, by an extra
+delay on top of that). Rather than starting a ``threading.Timer`` for every
+marker, everything that needs to happen later is registered with a Scheduler,
+which keeps the pending work in a heap and runs it from one thread.
+
+Plugins register the things they do every so often with the process-wide
+Scheduler too, instead of each waking up on a timer of its own. Periodic work
+is due on a shared grid of ticks, so tasks that come due at about the same time
+run in the same wake-up, and an idle Gelo hardly ever wakes at all.
+"""
+
+import math
+import heapq
+import itertools
+import logging
+from threading import Condition, Lock, Thread, current_thread, local
+from time import monotonic
+from typing import Callable
+
+# Periodic work is due on multiples of this many seconds, so that tasks due
+# at about the same time share a wake-up. Delayed markers aren't rounded.
+TICK_SECS = 0.05
+
+
+def on_tick(when: float) -> float:
+    """Get the first tick at or after a time."""
+    return math.ceil(when / TICK_SECS) * TICK_SECS
+
+
+_thread_state = local()
+
+
+def on_scheduler_thread() -> bool:
+    """Check whether this is a Scheduler's thread, which must never wait."""
+    return getattr(_thread_state, "scheduler", False)
+
+
+class ScheduledTask(object):
+    """A handle for a piece of work registered with a Scheduler."""
+
+    __slots__ = ("when", "seq", "fn", "args", "kwargs", "cancelled", "lateness")
+
+    def __init__(self, when: float, seq: int, fn: Callable, args, kwargs):
+        """Create a new ScheduledTask. Use Scheduler.schedule instead."""
+        self.when = when
+        self.seq = seq
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        # How late (in seconds) the task ran, once it has run.
+        self.lateness = None
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def __repr__(self):
+        return "ScheduledTask(%s, %s, cancelled=%s, lateness=%s)" % (
+            self.fn,
+            self.when,
+            self.cancelled,
+            self.lateness,
+        )
+
+
+class PeriodicTask(object):
+    """A handle for work that a Scheduler runs over and over."""
+
+    def __init__(self, period: float, fn: Callable, args, kwargs, start: float):
+        """Create a new PeriodicTask. Use Scheduler.schedule_every instead."""
+        self.period = period
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        # When the last run was due, or when the task was created, and when
+        # the next one is. These are the times the runs should happen, not
+        # when they did, which keeps the runs from drifting.
+        self.last_due = start
+        self.due = start
+        # The ScheduledTask for the next run.
+        self.next = None
+        self.runs = 0
+        # How many runs were skipped, because the last one overran them.
+        self.overruns = 0
+
+    def __repr__(self):
+        return "PeriodicTask(%s, every %s, runs=%d, overruns=%d)" % (
+            self.fn,
+            self.period,
+            self.runs,
+            self.overruns,
+        )
+
+
+class Scheduler(object):
+    """A single thread that runs callables after a delay, or periodically.
+
+    The thread is created the first time something is scheduled, so a
+    Scheduler that is never used costs nothing.
+    """
+
+    def __init__(self, name: str = "gelo-scheduler"):
+        """Create a new Scheduler.
+
+        :param name: The name to give the scheduler thread.
+        """
+        self.name = name
+        self.log = logging.getLogger("gelo.scheduler")
+        self._heap = []
+        self._counter = itertools.count()
+        self._cv = Condition()
+        self._thread = None
+        self._stopped = False
+        # Once flushed, tasks run as soon as they're scheduled.
+        self._hurry = False
+        # The task the thread is running right now, if any.
+        self._running = None
+        # Statistics about how late tasks ran, in seconds.
+        self.run_count = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    def schedule(self, delay: float, fn: Callable, *args, **kwargs) -> ScheduledTask:
+        """Run ``fn(*args, **kwargs)`` after ``delay`` seconds.
+
+        :param delay: The number of seconds to wait before running ``fn``.
+        :param fn: The callable to run.
+        :return: A handle that can be passed to ``cancel``.
+        """
+        if delay < 0:
+            raise ValueError("delay must not be negative")
+        return self._schedule_at(monotonic() + delay, fn, args, kwargs)
+
+    def _schedule_at(self, when: float, fn: Callable, args, kwargs) -> ScheduledTask:
+        """Run ``fn(*args, **kwargs)`` once ``monotonic()`` reaches ``when``."""
+        task = ScheduledTask(when, next(self._counter), fn, args, kwargs)
+        with self._cv:
+            if self._stopped:
+                self.log.debug("Not scheduling %s, scheduler is stopped" % fn)
+                task.cancelled = True
+                return task
+            heapq.heappush(self._heap, task)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            # Only wake the thread if this task is now the next one due.
+            if self._heap[0] is task:
+                self._cv.notify()
+        return task
+
+    def schedule_every(
+        self,
+        period: float,
+        fn: Callable,
+        *args,
+        first_delay: float | None = None,
+        **kwargs,
+    ) -> PeriodicTask:
+        """Run ``fn(*args, **kwargs)`` every ``period`` seconds, until cancelled.
+
+        Each run is due a whole period after the last one was due, not after
+        it finished, so the runs don't drift. Runs that a slow one overran are
+        skipped, and counted in the task's ``overruns``. ``fn`` runs on the
+        scheduler thread, so it must be quick; anything slow should be handed
+        to another thread. If it returns False, that's counted as an overrun
+        too, for work that was handed off and hasn't finished.
+
+        :param period: The number of seconds between runs.
+        :param fn: The callable to run.
+        :param first_delay: The number of seconds before the first run, if
+        not ``period``.
+        :return: A handle that can be passed to ``cancel`` and
+        ``set_period``.
+        """
+        if period <= 0:
+            raise ValueError("period must be positive")
+        task = PeriodicTask(period, fn, args, kwargs, monotonic())
+        with self._cv:
+            if self._stopped or self._hurry:
+                task.cancelled = True
+                return task
+            task.due = task.last_due + (period if first_delay is None else first_delay)
+            self._arm(task)
+        return task
+
+    def set_period(self, task: PeriodicTask, period: float) -> None:
+        """Change how often a periodic task runs.
+
+        The next run is moved to a new period after the last one was due, or
+        to right away, if that has already gone by.
+
+        :param task: The handle returned by ``schedule_every``.
+        :param period: The new number of seconds between runs.
+        """
+        if period <= 0:
+            raise ValueError("period must be positive")
+        with self._cv:
+            task.period = period
+            # While the task is running, the new period is picked up when
+            # its next run is scheduled.
+            if task.cancelled or not self.cancel(task.next):
+                return
+            task.due = max(task.last_due + period, monotonic())
+            self._arm(task)
+
+    def _arm(self, task: PeriodicTask) -> None:
+        """Schedule the next run of a periodic task, on the next tick."""
+        task.next = self._schedule_at(
+            on_tick(task.due), self._run_periodic, (task,), {}
+        )
+
+    def _run_periodic(self, task: PeriodicTask) -> None:
+        """Run a periodic task, and schedule its next run."""
+        with self._cv:
+            if task.cancelled:
+                return
+            task.last_due = task.due
+            task.runs += 1
+        try:
+            if task.fn(*task.args, **task.kwargs) is False:
+                task.overruns += 1
+        except Exception:
+            self.log.exception("Periodic task %s raised an exception" % task)
+        with self._cv:
+            if task.cancelled or self._hurry:
+                return
+            task.due = task.last_due + task.period
+            now = monotonic()
+            if now > on_tick(task.due):
+                skipped = math.floor((now - task.due) / task.period) + 1
+                task.overruns += skipped
+                task.due += skipped * task.period
+            self._arm(task)
+
+    def cancel(self, task: ScheduledTask | PeriodicTask | None) -> bool:
+        """Cancel a task that has not run yet, or a periodic task.
+
+        :param task: The handle returned by ``schedule`` or
+        ``schedule_every``.
+        :return: True if the task was cancelled, False if it already ran or
+        was already cancelled.
+        """
+        if task is None:
+            return False
+        with self._cv:
+            if isinstance(task, PeriodicTask):
+                if task.cancelled:
+                    return False
+                task.cancelled = True
+                self.cancel(task.next)
+                return True
+            if task.cancelled or task.lateness is not None:
+                return False
+            task.cancelled = True
+            # Leave the task in the heap; the thread discards it when it
+            # comes up, which keeps cancel O(1).
+            return True
+
+    def pending(self) -> int:
+        """Get the number of tasks that have not run or been cancelled, not
+        counting periodic ones."""
+        with self._cv:
+            return self._pending()
+
+    def _pending(self) -> int:
+        return sum(
+            1 for t in self._heap if not t.cancelled and t.fn != self._run_periodic
+        )
+
+    def flush(self, timeout: float | None = None) -> int:
+        """Run every pending task now, in the order they were due, and wait
+        for them to finish.
+
+        From then on, tasks run as soon as they're scheduled, since this is
+        meant for shutting down. Periodic tasks don't run again.
+
+        :param timeout: The most time to wait, in seconds, or None to wait
+        until every task has run.
+        :return: The number of tasks that still hadn't run by the timeout.
+        """
+        with self._cv:
+            self._hurry = True
+            for t in self._heap:
+                if t.fn == self._run_periodic:
+                    t.cancelled = True
+            self._cv.notify_all()
+            if current_thread() is not self._thread:
+                self._cv.wait_for(
+                    lambda: self._running is None and self._pending() == 0,
+                    timeout,
+                )
+            return self._pending()
+
+    def stop(self, timeout: float | None = None):
+        """Stop the scheduler thread, discarding any tasks that have not run.
+
+        :param timeout: The most time to wait for a task that's running to
+        finish, in seconds, or None to wait for as long as it takes.
+        """
+        with self._cv:
+            self._stopped = True
+            self._heap.clear()
+            self._cv.notify()
+        if self._thread is not None and self._thread is not current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Run tasks as they come due. This is the body of the thread."""
+        _thread_state.scheduler = True
+        while True:
+            with self._cv:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cv.wait()
+                        continue
+                    task = self._heap[0]
+                    if task.cancelled:
+                        heapq.heappop(self._heap)
+                        continue
+                    remaining = task.when - monotonic()
+                    if remaining <= 0 or self._hurry:
+                        heapq.heappop(self._heap)
+                        break
+                    self._cv.wait(remaining)
+                if self._stopped:
+                    return
+                task.lateness = monotonic() - task.when
+                self.run_count += 1
+                self.total_lateness += task.lateness
+                self.max_lateness = max(self.max_lateness, task.lateness)
+                self._running = task
+            self.log.debug("Running %s, %.6f s late" % (task.fn, task.lateness))
+            try:
+                task.fn(*task.args, **task.kwargs)
+            except Exception:
+                self.log.exception("Scheduled task %s raised an exception" % task)
+            with self._cv:
+                self._running = None
+                if self._hurry:
+                    self._cv.notify_all()
+
+
+_shared = None
+_shared_lock = Lock()
+
+
+def shared_scheduler() -> Scheduler:
+    """Get the process-wide Scheduler.
+
+    Plugins register their periodic work with it, and with the threads
+    engine, every show's Mediator delivers delayed markers on it too.
+
+    :return: The Scheduler. It's created the first time it's asked for.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Scheduler()
+        return _shared
+
+
+def stop_shared_scheduler(timeout: float | None = None) -> None:
+    """Stop the process-wide Scheduler, if it was ever created.
+
+    :param timeout: The most time to wait for a task that's running to
+    finish, in seconds, or None to wait for as long as it takes.
+    """
+    global _shared
+    with _shared_lock:
+        scheduler, _shared = _shared, None
+    if scheduler is not None:
+        scheduler.stop(timeout)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Resources shared by every show that one Gelo process hosts.
+
+When Gelo hosts several shows at once, each show has its own mediator and its
+own plugins, but there's no reason for each of them to keep its own pool of
+HTTP connections to the same servers. Plugins get their sessions from here
+instead of creating them, so one pool serves every show. Pollers that watch
+several servers also share one pool of threads to request them with. With
+the asyncio engine, plugins on the event loop share one aiohttp session.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+# The most requests that pollers make at once, across every show.
+POLL_WORKERS = 8
+
+_sessions = {}
+_sessions_lock = Lock()
+_executor = None
+# Only ever touched from the event loop, so it needs no lock.
+_aio_session = None
+
+
+def http_session(retrying: bool = False) -> requests.Session:
+    """Get the process-wide HTTP session.
+
+    :param retrying: Whether to get the session that retries failed requests
+    (for webhooks), rather than the one that doesn't (for polling).
+    :return: The session. It's created the first time it's asked for.
+    """
+    with _sessions_lock:
+        session = _sessions.get(retrying)
+        if session is None:
+            session = requests.Session()
+            if retrying:
+                retries = Retry(
+                    total=3,
+                    backoff_factor=1,
+                    status_forcelist=[500, 502, 503, 504, 429],
+                    raise_on_status=True,
+                    # False makes sure this retries for every method type, not
+                    # just the "safe" ones.
+                    allowed_methods=None,
+                )
+                session.mount("http://", HTTPAdapter(max_retries=retries))
+                session.mount("https://", HTTPAdapter(max_retries=retries))
+            _sessions[retrying] = session
+        return session
+
+
+def close_http_sessions() -> None:
+    """Close every HTTP session, once no plugin will use them again."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def aio_http_session():
+    """Get the process-wide aiohttp session, for plugins on the event loop.
+
+    Call it from the event loop. Plugins wait different lengths of time for
+    different things, so they pass their own timeouts with each request.
+
+    :return: The session. It's created the first time it's asked for.
+    """
+    global _aio_session
+    # aiohttp is only needed, and only installed, for the asyncio engine.
+    import aiohttp
+
+    if _aio_session is None or _aio_session.closed:
+        _aio_session = aiohttp.ClientSession()
+    return _aio_session
+
+
+async def close_aio_http_session() -> None:
+    """Close the aiohttp session, once no plugin will use it again."""
+    global _aio_session
+    if _aio_session is not None:
+        await _aio_session.close()
+        _aio_session = None
+
+
+def poll_executor() -> ThreadPoolExecutor:
+    """Get the process-wide pool of threads that pollers make requests on.
+
+    :return: The pool. It's created the first time it's asked for.
+    """
+    global _executor
+    with _sessions_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(POLL_WORKERS, thread_name_prefix="poll")
+        return _executor
+
+
+def close_poll_executor() -> None:
+    """Shut down the pool of polling threads, once no plugin will use it."""
+    global _executor
+    with _sessions_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -312,6 +312,89 @@ class GeloShell(cmd.Cmd):
         opts = ["macros", "plugins"]
         return [opt for opt in opts if opt.startswith(text)]
 
+    def do_show(self, arg):
+        """Choose which show the other commands control.
+
+        When Gelo hosts several shows, commands like `squelch`, `disable`,
+        and `inject` only affect one of them. With no argument, this lists
+        the shows, marking the one in control with an asterisk.
+
+        Usage: `show fnt-192`"""
+        if arg == "":
+            for name, show in self.gelo.shows.items():
+                marker = "*" if show.m is self.mediator else " "
+                print("%s %s" % (marker, name))
+            return False
+        if arg not in self.gelo.shows:
+            print('gelo: show: unknown show "%s"' % arg)
+            return False
+        show = self.gelo.shows[arg]
+        self.mediator = show.m
+        self.plugin_manager = show.gpm
+        self.log.info("Controlling show: %s" % arg)
+
+    def complete_show(self, text, *ignored):
+        return [name for name in self.gelo.shows if name.startswith(text)]
+
+    def do_stats(self, arg):
+        """Show how quickly markers are reaching each plugin.
+
+        Latencies are from when the marker was received until the plugin
+        picked it up, not counting the broadcast delay, in milliseconds.
+
+        Usage: `stats`
+        """
+        metrics = self.mediator.metrics()
+
+        def ms(ns):
+            return "-" if ns is None else "%.2f" % (ns / 1e6)
+
+        for path in ["instant", "delayed"]:
+            h = metrics[path]
+            print(
+                "%s path: %d markers, p50 %s ms, p99 %s ms, max %s ms"
+                % (path, h["count"], ms(h["p50"]), ms(h["p99"]), ms(h["max"]))
+            )
+        for lane, h in metrics["lanes"].items():
+            print(
+                "%s lane: %d markers, p50 %s ms, p99 %s ms, max %s ms"
+                % (lane, h["count"], ms(h["p50"]), ms(h["p99"]), ms(h["max"]))
+            )
+        for name, stats in metrics["plugins"].items():
+            if "polls" in stats:
+                h = stats["request_latency"]
+                print(
+                    "%s: %d polls, %d changed, %d unchanged, %d errors, "
+                    "%d overruns, request p50 %s ms, p99 %s ms, cycle CPU p50 %s ms"
+                    % (
+                        name,
+                        stats["polls"],
+                        stats["changed"],
+                        stats["unchanged"],
+                        stats["errors"],
+                        stats["overruns"],
+                        ms(h["p50"]),
+                        ms(h["p99"]),
+                        ms(stats["cycle_cost"]["p50"]),
+                    )
+                )
+        print("Plugins:")
+        for name, stats in metrics["subscribers"].items():
+            h = stats["delivery_latency"]
+            print(
+                "\t%s: depth %d (max %d), %d dropped, %d filtered, "
+                "p50 %s ms, p99 %s ms"
+                % (
+                    name,
+                    stats["depth"],
+                    stats["high_water"],
+                    stats["dropped"],
+                    stats["filtered"],
+                    ms(h["p50"]),
+                    ms(h["p99"]),
+                )
+            )
+
     def do_inject(self, arg):
         """Inject a marker into the system, as if from a source plugin.
 
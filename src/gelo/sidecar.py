@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Small files that plugins read settings from while a show is running.
+
+A sidecar file, like the prefix file that gives tracks a special status, can
+be changed at any moment, but reading it every time it's needed puts disk I/O
+in the way of the plugin. A SidecarFile keeps the parsed contents in memory
+instead, and one periodic task on the shared scheduler checks each watched
+file's size and modification time every so often. Only a file that has
+changed is read again, and the plugin can be told when its value changes.
+"""
+
+import os
+import re
+import logging
+from threading import Lock
+from typing import Any, Callable
+from gelo.scheduler import shared_scheduler
+
+# How often the watched files are checked, in seconds.
+POLL_SECS = 0.5
+
+# Match anything inside parenthesis
+SPECIAL_MATCHER = re.compile(r".*\((.*)\).*")
+
+log = logging.getLogger("gelo.sidecar")
+
+
+def parse_prefix(text: str | None) -> str | None:
+    """Get the special status out of a prefix file.
+
+    :param text: What's in the file, or None if it couldn't be read.
+    :return: Whatever is in parenthesis on the first line, if anything.
+    """
+    if text is None:
+        return None
+    g = SPECIAL_MATCHER.match(text.split("\n", 1)[0])
+    return g.group(1) if g is not None else None
+
+
+class SidecarFile(object):
+    """A file whose parsed contents are kept in memory."""
+
+    def __init__(
+        self,
+        path: str,
+        parse: Callable[[str | None], Any],
+        on_change: Callable[[Any], None] | None = None,
+    ):
+        """Create a new SidecarFile, reading the file for the first time.
+
+        :param path: The file.
+        :param parse: What to make of the file's text, which is None if the
+        file couldn't be read.
+        :param on_change: What to call with the new value when it changes.
+        """
+        self.path = path
+        self.parse = parse
+        self.on_change = on_change
+        self.signature = None
+        self.value = parse(self.read())
+
+    def read(self) -> str | None:
+        """Read the file's text, or None if it can't be read."""
+        try:
+            st = os.stat(self.path)
+            self.signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+            with open(self.path, "r") as f:
+                return f.read()
+        except OSError:
+            self.signature = None
+            return None
+
+    def refresh(self) -> bool:
+        """Read the file again, if it has changed since it was last read.
+
+        :return: Whether the value changed.
+        """
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            signature = None
+        if signature == self.signature:
+            return False
+        value = self.parse(self.read())
+        if value == self.value:
+            return False
+        self.value = value
+        if self.on_change is not None:
+            self.on_change(value)
+        return True
+
+
+# The files being watched, and the periodic task on the shared scheduler that
+# checks them, which only exists while there are files to check.
+_files = []
+_task = None
+_scheduler = None
+_lock = Lock()
+
+
+def check_all() -> None:
+    """Refresh every watched file. This runs on the shared scheduler."""
+    with _lock:
+        files = list(_files)
+    for sidecar in files:
+        try:
+            sidecar.refresh()
+        except Exception:
+            log.exception("Error while refreshing %s" % sidecar.path)
+
+
+def watch(sidecar: SidecarFile | None) -> None:
+    """Start checking a SidecarFile for changes, every POLL_SECS.
+
+    :param sidecar: The file, or None (for a plugin without one) to do
+    nothing.
+    """
+    global _task, _scheduler
+    if sidecar is None:
+        return
+    with _lock:
+        _files.append(sidecar)
+        scheduler = shared_scheduler()
+        if _task is None or _scheduler is not scheduler:
+            # The first file, or the scheduler was stopped and replaced.
+            _scheduler = scheduler
+            _task = scheduler.schedule_every(POLL_SECS, check_all)
+
+
+def unwatch(sidecar: SidecarFile | None) -> None:
+    """Stop checking a SidecarFile for changes. Once nothing is watched, the
+    check stops running."""
+    global _task, _scheduler
+    with _lock:
+        if sidecar is None or sidecar not in _files:
+            return
+        _files.remove(sidecar)
+        if not _files and _task is not None:
+            _scheduler.cancel(_task)
+            _task = None
+            _scheduler = None
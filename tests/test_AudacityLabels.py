@@ -1,6 +1,6 @@
 from unittest import mock
 from tempfile import NamedTemporaryFile
-from time import sleep
+from time import sleep, time
 from configparser import ConfigParser
 from gelo.plugins import AudacityLabels
 from gelo import arch, mediator
@@ -18,8 +18,10 @@ class TestAudacityLabels:
             arch.Marker.withtime("Justice - Fire", 0.7),
         ]
         m = mock.create_autospec(mediator.Mediator)
+        m.marker_time.return_value = None
         q = mock.create_autospec(mediator.ListenableQueue)
-        q.listen = mock.Mock(return_value=iter(markers))
+        # Deliver the markers in two batches.
+        q.listen_batch = mock.Mock(return_value=iter([markers[:3], markers[3:]]))
         m.subscribe = mock.Mock(return_value=q)
         c = ConfigParser()
         with NamedTemporaryFile(suffix=".csv") as out_csv:
@@ -33,3 +35,15 @@ class TestAudacityLabels:
             with open("testdata/audacitylabels.csv", "rb") as expected_file:
                 expected = b"".join(expected_file.readlines())
                 assert contents == expected
+
+    def test_restart_marker_on_recovered_time_base(self, tmp_path):
+        path = tmp_path / "labels.txt"
+        m = mediator.Mediator(0.0)
+        # As if the journal had carried the time base over from a crashed run.
+        m.first_time = time() - 30.0
+        AudacityLabels.AudacityLabels({"path": str(path), "delayed": False}, m, "ex-1")
+        m.terminate()
+        start, finish, label = path.read_text().rstrip("\n").split("\t")
+        assert label == "PROGRAM RESTART"
+        assert start == finish
+        assert 30.0 <= float(start) < 35.0
@@ -1,4 +1,6 @@
+import threading
 import responses
+from time import sleep
 import requests
 from responses.registries import OrderedRegistry
 from unittest import mock
@@ -203,3 +205,164 @@ class TestHttpPoller:
         assert len(call_args_list) == 2
         check_marker(expected1, call_args_list[0])
         check_marker(expected2, call_args_list[1])
+
+    @responses.activate(registry=OrderedRegistry)
+    def test_unchanged_responses_are_not_decoded(self):
+        """Confirm that 304s and repeated bodies skip decoding, and are counted."""
+        poll_url = "http://example.com/status-json.xsl"
+        a = "Screamarts"
+        t1 = "Resonant Stride (Original Mix)"
+        t2 = "Cultus (Original Mix)"
+        first = responses.get(poll_url, json=icestats(a, t1), headers={"ETag": '"v1"'})
+        not_modified = responses.get(poll_url, status=304)
+        responses.get(poll_url, json=icestats(a, t2))
+        responses.get(poll_url, json=icestats(a, t2))
+        m = mock.create_autospec(mediator.Mediator)
+        cut = HttpPoller.HttpPoller(fake_config(poll_url=poll_url), m, "ex-1")
+        m.register_metrics.assert_called_once_with("HttpPoller", cut.poll_stats)
+
+        with mock.patch.object(
+            HttpPoller,
+            "icecast_status_to_tracks",
+            wraps=HttpPoller.icecast_status_to_tracks,
+        ) as decode:
+            for _ in range(4):
+                cut.run_cycle(0)
+            assert decode.call_count == 2
+
+        assert "If-None-Match" not in first.calls[0].request.headers
+        assert not_modified.calls[0].request.headers["If-None-Match"] == '"v1"'
+        assert m.publish.call_count == 2
+        stats = cut.poll_stats.summary()
+        assert stats["polls"] == 4
+        assert stats["changed"] == 2
+        assert stats["unchanged"] == 2
+        assert stats["request_latency"]["count"] == 4
+        assert stats["cycle_cost"]["count"] == 4
+
+    @responses.activate(registry=OrderedRegistry)
+    def test_malformed_responses_keep_failing(self):
+        """Confirm that a malformed body fails every time it's sent, not just
+        the first."""
+        poll_url = "http://example.com/status-json.xsl"
+        for _ in range(2):
+            responses.get(poll_url, body="{", headers={"ETag": '"bad"'})
+        responses.get(poll_url, json=icestats("Screamarts", "Cultus"))
+        m = mock.create_autospec(mediator.Mediator)
+        cut = HttpPoller.HttpPoller(fake_config(poll_url=poll_url), m, "ex-1")
+        assert cut.run_cycle(0) is HttpPoller.PollResult.FAILED
+        assert cut.run_cycle(0) is HttpPoller.PollResult.FAILED
+        assert "If-None-Match" not in responses.calls[1].request.headers
+        assert cut.run_cycle(0) is HttpPoller.PollResult.CHANGED
+
+    def test_adaptive_interval(self):
+        """Confirm that polling slows when idle or failing, and snaps back."""
+        now = [0.0]
+        interval = HttpPoller.AdaptiveInterval(0.25, 5.0, clock=lambda: now[0])
+        assert interval.update(HttpPoller.PollResult.UNCHANGED) == 0.25
+        now[0] = 31.0
+        assert interval.update(HttpPoller.PollResult.UNCHANGED) == 0.3125
+        for _ in range(50):
+            interval.update(HttpPoller.PollResult.UNCHANGED)
+        assert interval.current == 5.0
+        assert interval.update(HttpPoller.PollResult.CHANGED) == 0.25
+        assert interval.update(HttpPoller.PollResult.FAILED) == 0.5
+        assert interval.update(HttpPoller.PollResult.FAILED) == 1.0
+        for _ in range(10):
+            interval.update(HttpPoller.PollResult.FAILED)
+        assert interval.current == 5.0
+        now[0] = 40.0
+        assert interval.update(HttpPoller.PollResult.CHANGED) == 0.25
+
+    @responses.activate
+    def test_several_servers_and_mounts(self):
+        """Confirm that each mount on each server has its changes detected on
+        its own, and that only the configured mounts are marked."""
+
+        def mount(path: str, artist: str, title: str) -> dict:
+            return {
+                "listenurl": "http://example.com:8000" + path,
+                "artist": artist,
+                "title": title,
+            }
+
+        one = "http://one.example.com/status-json.xsl"
+        two = "http://two.example.com/status-json.xsl"
+        responses.get(
+            one,
+            json={
+                "icestats": {
+                    "source": [mount("/fnt", "A", "1"), mount("/gs", "B", "1")]
+                }
+            },
+        )
+        responses.get(
+            one,
+            json={
+                "icestats": {
+                    "source": [mount("/fnt", "A", "1"), mount("/gs", "B", "2")]
+                }
+            },
+        )
+        responses.get(two, json={"icestats": {"source": mount("/fnt", "C", "1")}})
+        m = mock.create_autospec(mediator.Mediator)
+        config = fake_config()
+        config["poll_url"] = [one, two]
+        config["mounts"] = ["/fnt", "/gs"]
+        cut = HttpPoller.HttpPoller(config, m, "ex-1")
+        assert cut.run_cycle(0) is HttpPoller.PollResult.CHANGED
+        labels = sorted(c.args[1].label for c in m.publish.call_args_list)
+        assert labels == ["A — 1", "B — 1", "C — 1"]
+        m.reset_mock()
+        assert cut.run_cycle(0) is HttpPoller.PollResult.CHANGED
+        assert [c.args[1].label for c in m.publish.call_args_list] == ["B — 2"]
+
+        m.reset_mock()
+        config = fake_config(poll_url=one)
+        config["mounts"] = ["/fnt"]
+        cut = HttpPoller.HttpPoller(config, m, "ex-1")
+        cut.run_cycle(0)
+        assert [c.args[1].label for c in m.publish.call_args_list] == ["A — 1"]
+
+    @responses.activate
+    def test_prefix_change_marks_track_again(self, tmp_path):
+        """Confirm that the prefix is cached, and can mark the track again."""
+        prefix_file = tmp_path / "prefix.txt"
+        prefix_file.write_text("(intro)\n")
+        poll_url = "http://example.com/status-json.xsl"
+        responses.get(poll_url, json=icestats("Screamarts", "Cultus"))
+        m = mock.create_autospec(mediator.Mediator)
+        config = fake_config(poll_url=poll_url, prefix_file=str(prefix_file))
+        config["mark_prefix_changes"] = True
+        cut = HttpPoller.HttpPoller(config, m, "ex-1")
+        with mock.patch("builtins.open") as opened:
+            cut.run_cycle(0)
+            assert not opened.called
+        assert m.publish.call_args.args[1].special == "intro"
+
+        prefix_file.write_text("(live set)\n")
+        assert cut.prefix.refresh()
+        assert m.publish.call_count == 2
+        marker = m.publish.call_args.args[1]
+        assert (marker.label, marker.special) == ("Screamarts — Cultus", "live set")
+
+    @responses.activate
+    def test_run_polls_on_the_shared_scheduler(self):
+        """Confirm that the shared scheduler sets the pace of polling."""
+        poll_url = "http://example.com/status-json.xsl"
+        responses.get(poll_url, json=icestats("Screamarts", "Cultus"))
+        published = threading.Event()
+        m = mock.create_autospec(mediator.Mediator)
+        m.publish.side_effect = lambda *_: published.set()
+        config = fake_config(poll_url=poll_url)
+        config["min_interval"] = 0.05
+        cut = HttpPoller.HttpPoller(config, m, "ex-1")
+        cut.activate()
+        assert published.wait(5)
+        sleep(0.3)
+        cut.deactivate()
+        cut.join(5)
+        assert not cut.is_alive()
+        assert cut.poll_task.cancelled
+        assert cut.poll_stats.polls > 1
+        assert m.publish.call_count == 1
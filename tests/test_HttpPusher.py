@@ -1,6 +1,7 @@
 import pytest
+from time import monotonic, sleep
 from typing import Tuple
-from gelo.arch import Marker
+from gelo.arch import Marker, MarkerType
 from gelo.plugins import HttpPusher
 from gelo.mediator import Mediator
 from gelo.conf import InvalidConfigurationError
@@ -112,3 +113,23 @@ class TestHttpPusher:
             actual = cut.make_payload(input[0], input[1])
 
             assert actual == expected
+
+    def test_shutdown_makes_delayed_requests(self):
+        # The delivery to delayed subscribers is pending too, until flushed.
+        m = Mediator(3600.0)
+        config = stub_config()
+        config["webhooks"]["example"]["extra_delay"] = 60.0
+        cut = HttpPusher.HttpPusher(config, m, "ex-1")
+        made = []
+        cut.request = lambda marker, *_: made.append(marker.label)
+        cut.activate()
+        m.publish(MarkerType.TRACK, Marker("Delayed"))
+        deadline = monotonic() + 5
+        while m.scheduler.pending() < 2 and monotonic() < deadline:
+            sleep(0.01)
+        assert m.scheduler.flush(5) == 0
+        m.terminate()
+        cut.join(5)
+        assert not cut.is_alive()
+        assert not cut.delayed_worker.is_alive()
+        assert made == ["Delayed"]
@@ -0,0 +1,109 @@
+import time
+import base64
+import socket
+import http.client
+import threading
+import pytest
+from unittest import mock
+from gelo.plugins import IcecastReceiver
+from gelo import conf, mediator
+
+AUTH = "Basic " + base64.b64encode(b"source:hackme").decode("ascii")
+
+
+def connect_source(port: int, password_auth: str = AUTH) -> tuple[socket.socket, bytes]:
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    sock.sendall(
+        b"SOURCE /live HTTP/1.0\r\nAuthorization: %s\r\n"
+        b"Content-Type: audio/mpeg\r\n\r\n" % password_auth.encode("ascii")
+    )
+    return sock, sock.recv(1024)
+
+
+def update_metadata(port: int, song: str, mount: str = "%2Flive") -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    query = "mode=updinfo&mount=%s&song=%s" % (mount, song.replace(" ", "+"))
+    connection.request(
+        "GET", "/admin/metadata?" + query, headers={"Authorization": AUTH}
+    )
+    status = connection.getresponse().status
+    connection.close()
+    return status
+
+
+class TestIcecastReceiver:
+    def test_source_stream_and_metadata(self, tmp_path):
+        audio_file = tmp_path / "show.mp3"
+        published = threading.Semaphore(0)
+        m = mock.create_autospec(mediator.Mediator)
+        m.publish.side_effect = lambda *_: published.release()
+        config = {
+            "password": "hackme",
+            "port": 0,
+            "mount": "/live",
+            "audio_file": str(audio_file),
+        }
+        cut = IcecastReceiver.IcecastReceiver(config, m, "ex-1")
+        port = cut.listener.server.server_address[1]
+        cut.activate()
+        try:
+            _, response = connect_source(port, "Basic bm9wZQ==")
+            assert response.startswith(b"HTTP/1.0 401")
+            source, response = connect_source(port)
+            assert response.startswith(b"HTTP/1.0 200")
+            _, response = connect_source(port)
+            assert response.startswith(b"HTTP/1.0 403")
+            source.sendall(b"\xff\xfb" * 1000)
+
+            assert update_metadata(port, "Screamarts - Resonant Stride") == 200
+            assert published.acquire(timeout=5)
+            assert update_metadata(port, "Screamarts - Resonant Stride") == 200
+            assert update_metadata(port, "Screamarts - Cultus") == 200
+            assert published.acquire(timeout=5)
+            source.close()
+            deadline = time.monotonic() + 5
+            while cut.mounts_in_use and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            cut.deactivate()
+            cut.join(5)
+        assert not cut.is_alive()
+        markers = [c.args[1] for c in m.publish.call_args_list]
+        assert [(x.artist, x.title) for x in markers] == [
+            ("Screamarts", "Resonant Stride"),
+            ("Screamarts", "Cultus"),
+        ]
+        assert audio_file.read_bytes() == b"\xff\xfb" * 1000
+
+    def test_shows_share_a_port_by_mount(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        mediators = {}
+        receivers = []
+        try:
+            for show, mount in [("ex-1", "/a"), ("ex-2", "/b")]:
+                mediators[show] = mock.create_autospec(mediator.Mediator)
+                config = {"password": "hackme", "port": port, "mount": mount}
+                receivers.append(
+                    IcecastReceiver.IcecastReceiver(config, mediators[show], show)
+                )
+            assert receivers[0].listener is receivers[1].listener
+            with pytest.raises(conf.InvalidConfigurationError):
+                IcecastReceiver.IcecastReceiver(
+                    {"password": "hackme", "port": port, "mount": "/b"},
+                    mock.create_autospec(mediator.Mediator),
+                    "ex-3",
+                )
+            for r in receivers:
+                r.activate()
+            assert update_metadata(port, "Justice - Fire", "%2Fb") == 200
+            assert update_metadata(port, "Justice - Fire", "%2Fc") == 404
+        finally:
+            for r in receivers:
+                r.deactivate()
+                r.join(5)
+        mediators["ex-1"].publish.assert_not_called()
+        marker = mediators["ex-2"].publish.call_args.args[1]
+        assert (marker.artist, marker.title) == ("Justice", "Fire")
+        assert ("127.0.0.1", port) not in IcecastReceiver.IcecastListener.listeners
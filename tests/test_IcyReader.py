@@ -0,0 +1,82 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from gelo.plugins import IcyReader
+from gelo import mediator
+
+METAINT = 16
+
+
+def metadata_block(stream_title: str) -> bytes:
+    meta = ("StreamTitle='%s';" % stream_title).encode("utf-8")
+    length = -(-len(meta) // 16)
+    return bytes([length]) + meta.ljust(length * 16, b"\0")
+
+
+def icy_stream(*stream_titles: str) -> bytes:
+    stream = b""
+    for stream_title in stream_titles:
+        stream += b"\xff" * METAINT + metadata_block(stream_title)
+        # Servers send an empty block when the title hasn't changed.
+        stream += b"\xff" * METAINT + b"\0"
+    return stream + b"\xff" * METAINT
+
+
+class StandInIcecast(BaseHTTPRequestHandler):
+    """Send one stream to each connection, then hang up."""
+
+    streams = []
+
+    def do_GET(self):
+        assert self.headers["Icy-MetaData"] == "1"
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("icy-metaint", str(METAINT))
+        self.end_headers()
+        self.wfile.write(self.streams.pop(0) if self.streams else b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestIcyReader:
+    def test_demuxer_skips_audio_in_any_split(self):
+        stream = icy_stream("Screamarts - Resonant Stride", "Cultus")
+        for size in [1, 7, 16, 17, len(stream)]:
+            demuxer = IcyReader.IcyDemuxer(METAINT)
+            blocks = []
+            for i in range(0, len(stream), size):
+                blocks += demuxer.feed(stream[i : i + size])
+            titles = [IcyReader.parse_stream_title(b) for b in blocks]
+            assert titles == ["Screamarts - Resonant Stride", "Cultus"]
+
+    def test_publishes_changes_and_reconnects(self):
+        StandInIcecast.streams = [
+            icy_stream("Screamarts - Resonant Stride"),
+            icy_stream("Screamarts - Resonant Stride", "Screamarts - Cultus"),
+        ]
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInIcecast)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        published = threading.Semaphore(0)
+        m = mock.create_autospec(mediator.Mediator)
+        m.publish.side_effect = lambda *_: published.release()
+        config = {
+            "stream_url": "http://127.0.0.1:%d/live.mp3" % server.server_port,
+            "min_reconnect_delay": 0.01,
+        }
+        cut = IcyReader.IcyReader(config, m, "ex-1")
+        cut.activate()
+        try:
+            assert published.acquire(timeout=5)
+            assert published.acquire(timeout=5)
+        finally:
+            cut.deactivate()
+            cut.join(5)
+            server.shutdown()
+            server.server_close()
+        assert not cut.is_alive()
+        markers = [c.args[1] for c in m.publish.call_args_list]
+        assert [(x.artist, x.title) for x in markers] == [
+            ("Screamarts", "Resonant Stride"),
+            ("Screamarts", "Cultus"),
+        ]
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import socketserver
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import NamedTemporaryFile
+from time import monotonic, sleep
+from urllib.parse import parse_qs
+from gelo import aio, arch, mediator, shared
+from gelo.plugins import HttpPoller, HttpPusher, IcyReader, IRC, NowPlayingFile
+from test_IcyReader import StandInIcecast, icy_stream
+
+
+@pytest.fixture
+def loop_thread():
+    lt = aio.EventLoopThread()
+    lt.start()
+    yield lt
+    lt.stop(1)
+
+
+class Webhook(BaseHTTPRequestHandler):
+    """Note every POST, and answer with the next of the server's statuses."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.bodies.append(parse_qs(body.decode("utf-8")))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Webhook)
+    server.bodies = []
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def webhook_config(server, **options) -> dict:
+    options.update(
+        url="http://127.0.0.1:%d/np" % server.server_address[1],
+        method="POST",
+        marker_param="marker",
+    )
+    return {"delayed": False, "webhooks": {"example": options}}
+
+
+class Status(BaseHTTPRequestHandler):
+    """Answer with the next of the server's Icecast statuses, then keep
+    answering with the last one."""
+
+    def do_GET(self):
+        if len(self.server.tracks) > 1:
+            artist, title = self.server.tracks.pop(0)
+        else:
+            artist, title = self.server.tracks[0]
+        source = {"artist": artist, "title": title}
+        body = json.dumps({"icestats": {"source": source}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInIrc(socketserver.StreamRequestHandler):
+    """Speak just enough IRC to welcome a client into its channel, and note
+    its messages."""
+
+    def handle(self):
+        for line in self.rfile:
+            command, _, rest = (
+                line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            )
+            command = command.upper()
+            if command == "USER":
+                self.send(":test 001 gelo :Welcome")
+            elif command == "JOIN":
+                self.send(":gelo!gelo@localhost JOIN %s" % rest)
+            elif command == "PING":
+                self.send(":test PONG test %s" % rest)
+            elif command == "PRIVMSG":
+                self.server.messages.append(rest)
+            elif command == "QUIT":
+                return
+
+    def send(self, line: str):
+        self.wfile.write(line.encode("utf-8") + b"\r\n")
+
+
+class IrcServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_for(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline
+        sleep(0.01)
+
+
+def run(loop_thread, coro, timeout=2):
+    return asyncio.run_coroutine_threadsafe(coro, loop_thread.loop).result(timeout)
+
+
+async def collect(channel, n):
+    got = []
+    async for marker in channel.listen():
+        got.append(marker.label)
+        if len(got) == n:
+            return got
+
+
+class TestAsyncMediator:
+    def test_instant_and_delayed(self, loop_thread):
+        m = aio.AsyncMediator(0.05, loop_thread.loop)
+        instant = m.subscribe([arch.MarkerType.TRACK], "Instant")
+        delayed = m.subscribe([arch.MarkerType.TRACK], "Delayed", delayed=True)
+        # Published from this thread, delivered on the loop.
+        m.publish(arch.MarkerType.TRACK, arch.Marker("one"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("two"))
+        assert run(loop_thread, collect(instant, 2)) == ["one", "two"]
+        assert run(loop_thread, collect(delayed, 2)) == ["one", "two"]
+        assert m.scheduler.run_count == 2
+
+    def test_terminate_unsubscribes(self, loop_thread):
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        q = m.subscribe([arch.MarkerType.TRACK], "Closing")
+        m.terminate()
+        with pytest.raises(mediator.UnsubscribeException):
+            run(loop_thread, collect(q, 1))
+
+    def test_async_sink(self, loop_thread):
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        with NamedTemporaryFile() as out:
+            sink = NowPlayingFile.AsyncNowPlayingFile(
+                {"path": out.name, "delayed": False}, m, "ex-1"
+            )
+            assert isinstance(sink.channel, aio.AsyncLatestValueChannel)
+            sink.activate()
+            m.publish(arch.MarkerType.TRACK, arch.Marker("Justice — Fire"))
+            m.terminate()
+            sink.join(2)
+            assert not sink.is_alive()
+            assert out.read() == b"Justice - Fire"
+
+
+class TestEventLoopThread:
+    def test_shows_share_one_http_session(self):
+        lt = aio.EventLoopThread()
+        lt.start()
+
+        async def get_session():
+            return shared.aio_http_session()
+
+        first = asyncio.run_coroutine_threadsafe(get_session(), lt.loop).result(1)
+        second = asyncio.run_coroutine_threadsafe(get_session(), lt.loop).result(1)
+        assert first is second
+        lt.stop(1)
+        assert first.closed
+
+
+class TestLoopScheduler:
+    def test_flush(self, loop_thread):
+        s = aio.LoopScheduler(loop_thread.loop)
+        ran = []
+        s.schedule(3600, ran.append, "first")
+        s.schedule(7200, ran.append, "second")
+        assert s.flush(2) == 0
+        assert ran == ["first", "second"]
+
+    def test_flush_from_the_loop(self, loop_thread):
+        s = aio.LoopScheduler(loop_thread.loop)
+        ran = []
+        s.schedule(3600, ran.append, "first")
+
+        async def flush():
+            # Waiting here would keep the loop from running the task.
+            return s.flush(5)
+
+        assert run(loop_thread, flush()) == 1
+        run(loop_thread, asyncio.sleep(0))
+        assert ran == ["first"]
+
+
+class TestAsyncHttpPusher:
+    def test_shutdown_sends_extra_delayed_requests(self, loop_thread, webhook):
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        config = webhook_config(webhook, extra_delay=3600.0)
+        sink = HttpPusher.AsyncHttpPusher(config, m, "ex-1")
+        sink.activate()
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Justice — Fire"))
+        wait_for(lambda: len(sink.requests_scheduled) == 1)
+        # As Gelo.shutdown does it.
+        assert m.scheduler.flush(5) == 0
+        m.terminate()
+        sink.join(5)
+        assert not sink.is_alive()
+        assert webhook.bodies == [{"marker": ["Justice — Fire"]}]
+
+    def test_shutdown_sends_requests_scheduled_by_the_flush(self, loop_thread, webhook):
+        m = aio.AsyncMediator(1.0, loop_thread.loop)
+        config = webhook_config(webhook, extra_delay=3600.0)
+        sink = HttpPusher.AsyncHttpPusher(config, m, "ex-1")
+        sink.activate()
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Justice — Fire"))
+        wait_for(lambda: m.scheduler.pending() == 1)
+        # The flush delivers the marker, and the channel closes before the
+        # request it schedules gets to run.
+        m.scheduler.flush(5)
+        m.terminate()
+        sink.join(5)
+        assert not sink.is_alive()
+        assert webhook.bodies == [{"marker": ["Justice — Fire"]}]
+
+    def test_retries_without_waiting_once_stopping(self, loop_thread, webhook):
+        webhook.statuses = [503]
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        sink = HttpPusher.AsyncHttpPusher(webhook_config(webhook), m, "ex-1")
+        sink.activate()
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Justice — Fire"))
+        wait_for(lambda: len(webhook.bodies) == 1)
+        start = monotonic()
+        m.terminate()
+        sink.join(5)
+        # The retry went out right away, not after the backoff.
+        assert monotonic() - start < 0.5
+        assert webhook.bodies == [{"marker": ["Justice — Fire"]}] * 2
+
+
+class TestAsyncHttpPoller:
+    def test_publishes_each_new_track(self, loop_thread):
+        server = serve(ThreadingHTTPServer(("127.0.0.1", 0), Status))
+        server.tracks = [("Screamarts", "Resonant Stride"), ("Screamarts", "Cultus")]
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        published = []
+        m.publish = lambda marker_type, marker: published.append(marker)
+        config = {
+            "poll_url": "http://127.0.0.1:%d/status-json.xsl" % server.server_port,
+            "prefix_file": "/home/paradox/nowplaying.txt",
+            "min_interval": 0.05,
+        }
+        source = HttpPoller.AsyncHttpPoller(config, m, "ex-1")
+        source.activate()
+        try:
+            wait_for(lambda: len(published) == 2)
+            wait_for(lambda: source.poll_stats.polls > 3)
+        finally:
+            source.deactivate()
+            source.join(5)
+            server.shutdown()
+            server.server_close()
+        assert not source.is_alive()
+        assert [(x.artist, x.title) for x in published] == [
+            ("Screamarts", "Resonant Stride"),
+            ("Screamarts", "Cultus"),
+        ]
+
+
+class TestAsyncIcyReader:
+    def test_publishes_changes_and_reconnects(self, loop_thread):
+        StandInIcecast.streams = [
+            icy_stream("Screamarts - Resonant Stride"),
+            icy_stream("Screamarts - Resonant Stride", "Screamarts - Cultus"),
+        ]
+        server = serve(ThreadingHTTPServer(("127.0.0.1", 0), StandInIcecast))
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        published = []
+        m.publish = lambda marker_type, marker: published.append(marker)
+        config = {
+            "stream_url": "http://127.0.0.1:%d/live.mp3" % server.server_port,
+            "min_reconnect_delay": 0.01,
+        }
+        source = IcyReader.AsyncIcyReader(config, m, "ex-1")
+        source.activate()
+        try:
+            wait_for(lambda: len(published) == 2)
+        finally:
+            source.deactivate()
+            source.join(5)
+            server.shutdown()
+            server.server_close()
+        assert not source.is_alive()
+        assert [(x.artist, x.title) for x in published] == [
+            ("Screamarts", "Resonant Stride"),
+            ("Screamarts", "Cultus"),
+        ]
+
+
+class TestAsyncIRC:
+    def test_sends_markers_to_its_channel(self, loop_thread):
+        server = serve(IrcServer(("127.0.0.1", 0), StandInIrc))
+        server.messages = []
+        m = aio.AsyncMediator(0.0, loop_thread.loop)
+        config = {
+            "nick": "gelo",
+            "server": "127.0.0.1",
+            "port": server.server_address[1],
+            "tls": False,
+            "ipv6": False,
+            "send_to": "#xbn",
+            "message": "Now playing: {marker}",
+            "delayed": False,
+        }
+        sink = IRC.AsyncIRC(config, m, "ex-1")
+        sink.activate()
+        try:
+            wait_for(lambda: sink.ready)
+            m.publish(arch.MarkerType.TRACK, arch.Marker("Justice — Fire"))
+            wait_for(lambda: len(server.messages) == 1)
+            m.terminate()
+            sink.join(5)
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert not sink.is_alive()
+        assert server.messages == ["#xbn :Now playing: Justice — Fire"]
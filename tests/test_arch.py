@@ -0,0 +1,32 @@
+import pickle
+import pytest
+from gelo import arch
+
+
+class TestMarker:
+    def test_immutable_and_replace(self):
+        m = arch.Marker(artist="Justice", title="Fire", special="Bit Perfectly")
+        assert m.label == "Justice — Fire"
+        with pytest.raises(AttributeError):
+            m.time_ns = 1
+        with pytest.raises(AttributeError):
+            m.extra = 1
+        timed = m.replace(time_ns=1_500_000_000)
+        assert m.time_ns is None
+        assert timed.time == 1.5
+        assert timed.special == "Bit Perfectly"
+        assert timed.artist is arch.Marker(artist="Just" + "ice", title="x").artist
+        assert pickle.loads(pickle.dumps(timed)) == timed
+
+    def test_pack_round_trip(self):
+        markers = [
+            arch.Marker("Topic"),
+            arch.Marker("A — B", "A", "B", time_ns=0, url="https://x.invalid/"),
+            arch.Marker("Ünïcödé", special="", time_ns=-5),
+        ]
+        packed = b"".join(m.pack() for m in markers)
+        offset = 0
+        for expected in markers:
+            m, offset = arch.Marker.unpack(packed, offset)
+            assert m == expected
+        assert offset == len(packed)
@@ -0,0 +1,79 @@
+import os
+import stat
+import argparse
+import pytest
+from time import sleep, monotonic
+from gelo import arch, bus, mediator
+from gelo.plugins import NowPlayingFile
+
+
+def wait_for(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline
+        sleep(0.01)
+
+
+@pytest.fixture
+def served(tmp_path):
+    m = mediator.Mediator(0.0)
+    server = bus.BusServer(m, str(tmp_path / "bus.sock"))
+    server.start()
+    yield m, server
+    m.terminate()
+    server.stop()
+
+
+class TestBus:
+    def test_only_this_user_may_connect(self, served):
+        _, server = served
+        mode = os.stat(server.path).st_mode
+        assert stat.S_ISSOCK(mode)
+        assert stat.S_IMODE(mode) == 0o600
+
+    def test_remote_subscribe_and_publish(self, served):
+        m, server = served
+        remote = bus.RemoteMediator(server.path)
+        channel = remote.subscribe(
+            [arch.MarkerType.TRACK],
+            "Remote",
+            marker_filter=arch.MarkerFilter(require_artist=True),
+        )
+        wait_for(lambda: "Remote" in m.subscriber_map)
+        special = arch.Marker("A - B", "A", "B", special="Bit Perfectly")
+        m.publish(arch.MarkerType.TRACK, arch.Marker("No artist"))
+        m.publish(arch.MarkerType.TRACK, special)
+        got = next(channel.listen(timeout=2))
+        assert (got.label, got.artist, got.title) == ("A - B", "A", "B")
+        assert got.special == "Bit Perfectly"
+        assert got.time_ns is not None
+        assert got.published_ns is not None
+
+        local = m.subscribe([arch.MarkerType.TOPIC], "Local")
+        remote.publish(arch.MarkerType.TOPIC, arch.Marker("From afar"))
+        assert next(local.listen(timeout=2)).label == "From afar"
+
+        m.terminate()
+        with pytest.raises(mediator.UnsubscribeException):
+            next(channel.listen(timeout=2))
+        remote.terminate()
+
+    def test_plugin_in_child_process(self, served, tmp_path):
+        m, server = served
+        out = tmp_path / "np.txt"
+        configuration = argparse.Namespace(log_file=None, log_level="CRITICAL")
+        plugin = bus.RemotePlugin(
+            NowPlayingFile.NowPlayingFile,
+            {"path": str(out), "delayed": False},
+            server.path,
+            "fnt-1",
+            configuration,
+        )
+        plugin.activate()
+        wait_for(lambda: "NowPlayingFile" in m.subscriber_map, timeout=20)
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Justice - Fire"))
+        wait_for(lambda: out.exists() and out.read_text() == "Justice - Fire")
+        m.terminate()
+        plugin.deactivate()
+        plugin.join(10)
+        assert not plugin.is_alive()
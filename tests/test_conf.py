@@ -0,0 +1,84 @@
+import argparse
+import pytest
+from gelo import conf
+
+
+def make_config(show):
+    config_file = {
+        "core": {
+            "log_file": "gelo.log",
+            "macro_file": "macros.ini",
+            "broadcast_delay": 8.0,
+            "journal_file": "{show}.journal",
+        },
+        "plugin:IRC": {"send_to": "#xbn", "message": "{marker}"},
+        "show:fnt": {"IRC": {"send_to": "#fnt"}},
+    }
+    args = argparse.Namespace(show=show, user_plugin_dir="", verbose=0)
+    return conf.Configuration(config_file, args)
+
+
+class TestConfiguration:
+    def test_several_shows(self):
+        c = make_config(["fnt-192", "gs-57"])
+        assert c.shows == ["fnt-192", "gs-57"]
+        assert c.show == "fnt-192"
+        assert c.journal_path("gs-57") == "gs-57.journal"
+
+    def test_show_overrides_plugin_config(self):
+        c = make_config("fnt-192")
+        assert c.shows == ["fnt-192"]
+        fnt = c.plugin_config("IRC", "fnt-192")
+        gs = c.plugin_config("IRC", "gs-57")
+        assert fnt == {"send_to": "#fnt", "message": "{marker}"}
+        assert gs["send_to"] == "#xbn"
+        # Each show gets its own copy to validate and modify.
+        fnt["message"] = "changed"
+        assert c.plugin_config("IRC", "fnt-192")["message"] == "{marker}"
+
+    def test_shows_must_poll_their_own_mounts(self):
+        config_file = {
+            "core": {
+                "log_file": "gelo.log",
+                "macro_file": "macros.ini",
+                "broadcast_delay": 8.0,
+            },
+            "plugin:HttpPoller": {"poll_url": "http://example.com/status-json.xsl"},
+            "show:fnt": {"HttpPoller": {"mounts": ["/fnt"]}},
+            "show:gs": {"HttpPoller": {"mounts": ["/gs"]}},
+        }
+        args = argparse.Namespace(
+            show=["fnt-192", "gs-57"], user_plugin_dir="", verbose=0
+        )
+        conf.Configuration(config_file, args)
+        config_file["show:gs"]["HttpPoller"]["mounts"] = ["/gs", "/fnt"]
+        with pytest.raises(conf.InvalidConfigurationError) as e:
+            conf.Configuration(config_file, args)
+        assert "/fnt" in e.value.args[0][0]
+        del config_file["show:gs"]
+        with pytest.raises(conf.InvalidConfigurationError):
+            conf.Configuration(config_file, args)
+
+    def test_asyncio_shows_need_their_own_irc_nicks(self):
+        config_file = {
+            "core": {
+                "log_file": "gelo.log",
+                "macro_file": "macros.ini",
+                "broadcast_delay": 8.0,
+                "engine": "asyncio",
+            },
+            "plugin:IRC": {"server": "irc.example.com", "port": 6697, "nick": "gelo"},
+            "show:fnt": {"IRC": {"send_to": "#fnt"}},
+        }
+        args = argparse.Namespace(
+            show=["fnt-192", "gs-57"], user_plugin_dir="", verbose=0
+        )
+        with pytest.raises(conf.InvalidConfigurationError) as e:
+            conf.Configuration(config_file, args)
+        assert 'IRC "nick"' in e.value.args[0][0]
+        config_file["show:fnt"]["IRC"]["nick"] = "gelo-fnt"
+        conf.Configuration(config_file, args)
+        # The threads engine shares one connection between them.
+        del config_file["show:fnt"]["IRC"]["nick"]
+        config_file["core"]["engine"] = "threads"
+        conf.Configuration(config_file, args)
@@ -0,0 +1,68 @@
+from gelo import arch, mediator
+from gelo.journal import Journal
+
+
+class TestJournal:
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / "show.journal"
+        j = Journal(str(path))
+        assert j.recover().first_wall_ns is None
+        j.append_anchor(1234)
+        m = arch.Marker(
+            "Artist - Title", "Artist", "Title", time_ns=5_000_000_000, special="intro"
+        )
+        first = j.append_publish(arch.MarkerType.TRACK, m, 9999)
+        topic = arch.Marker("Topic", time_ns=6_000_000_000)
+        second = j.append_publish(arch.MarkerType.TOPIC, topic, 10000)
+        j.append_delivered(first)
+        j.close()
+        assert j.fsync_count >= 1
+
+        state = Journal(str(path)).recover()
+        assert state.first_wall_ns == 1234
+        assert state.last_seq == second
+        assert [p.seq for p in state.pending] == [second]
+        assert state.pending[0].marker_type is arch.MarkerType.TOPIC
+        assert state.pending[0].marker.label == "Topic"
+        assert state.pending[0].marker.artist is None
+        assert state.pending[0].marker.time_ns == 6_000_000_000
+
+    def test_torn_tail_is_truncated(self, tmp_path):
+        path = tmp_path / "show.journal"
+        j = Journal(str(path))
+        j.recover()
+        j.append_anchor(1234)
+        j.close()
+        whole = path.stat().st_size
+        with open(path, "ab") as f:
+            f.write(b"\x20\x00\x00\x00\x01")
+        j = Journal(str(path))
+        state = j.recover()
+        assert state.first_wall_ns == 1234
+        assert path.stat().st_size == whole
+        after = arch.Marker("After", time_ns=0)
+        j.append_publish(arch.MarkerType.TRACK, after, 1)
+        j.close()
+        assert Journal(str(path)).recover().pending[0].marker.label == "After"
+
+    def test_mediator_recovers_pending_markers(self, tmp_path):
+        path = str(tmp_path / "show.journal")
+        j = Journal(path)
+        j.recover()
+        m = mediator.Mediator(60.0, journal=j)
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Undelivered"))
+        first_time = m.first_time
+        m.terminate()
+        j.close()
+
+        j = Journal(path)
+        state = j.recover()
+        assert len(state.pending) == 1
+        m = mediator.Mediator(0.0, journal=j)
+        q = m.subscribe([arch.MarkerType.TRACK], "Delayed", True)
+        m.recover(state)
+        assert abs(m.first_time - first_time) < 0.001
+        assert next(q.listen(timeout=1)).label == "Undelivered"
+        m.terminate()
+        j.close()
+        assert Journal(path).recover().pending == []
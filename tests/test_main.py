@@ -0,0 +1,106 @@
+import argparse
+from time import monotonic
+from gelo import arch, conf, mediator
+from unittest import mock
+from gelo.journal import Journal
+from gelo.main import Gelo, GeloPluginManager, Show
+from gelo.plugins import HttpPoller, NowPlayingFile
+from gelo.scheduler import Scheduler
+
+
+def make_config(tmp_path, show, broadcast_delay=8.0):
+    config_file = {
+        "core": {
+            "log_file": str(tmp_path / "gelo.log"),
+            "macro_file": str(tmp_path / "macros.ini"),
+            "broadcast_delay": broadcast_delay,
+            "shutdown_timeout": 2.0,
+        },
+        "plugin:NowPlayingFile": {"path": str(tmp_path / "nowplaying.txt")},
+    }
+    args = argparse.Namespace(show=show, user_plugin_dir="", verbose=0)
+    return conf.Configuration(config_file, args)
+
+
+class TestGeloPluginManager:
+    def test_deactivate_sources_leaves_remote_sinks(self, tmp_path):
+        c = make_config(tmp_path, "fnt-192")
+        gpm = GeloPluginManager(c, mock.Mock(), "fnt-192")
+        source = mock.Mock(plugin_class=HttpPoller.HttpPoller)
+        sink = mock.Mock(plugin_class=NowPlayingFile.NowPlayingFile)
+        gpm.plugins = [source, sink]
+        gpm.deactivateSources()
+        source.deactivate.assert_called_once()
+        sink.deactivate.assert_not_called()
+
+
+class TestShow:
+    def test_shows_share_scheduler_not_time_base(self, tmp_path):
+        c = make_config(tmp_path, ["fnt-192", "gs-57"])
+        scheduler = Scheduler()
+        fnt = Show("fnt-192", c, scheduler, None)
+        gs = Show("gs-57", c, scheduler, None)
+        assert fnt.m.scheduler is gs.m.scheduler
+        assert fnt.gpm.show == "fnt-192"
+        q = gs.m.subscribe([arch.MarkerType.TRACK], "Tracks")
+        fnt.m.publish(arch.MarkerType.TRACK, arch.Marker("Only fnt"))
+        assert q.empty()
+        assert gs.m.first_time is None
+        fnt.m.terminate()
+        gs.m.terminate()
+        scheduler.stop()
+
+    def test_recovery_comes_before_sources_publish(self, tmp_path):
+        c = make_config(tmp_path, "fnt-192")
+        c.journal_file = str(tmp_path / "{show}.journal")
+        j = Journal(c.journal_path("fnt-192"))
+        j.recover()
+        m = mediator.Mediator(60.0, journal=j)
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Before the crash"))
+        first_wall_ns = j.recover().first_wall_ns
+        m.terminate()
+        j.close()
+
+        scheduler = Scheduler()
+        show = Show("fnt-192", c, scheduler, None)
+        q = show.m.subscribe([arch.MarkerType.TRACK], "Delayed", delayed=True)
+        published = []
+
+        def run_all():
+            # A source that publishes as soon as it's started.
+            show.m.publish(arch.MarkerType.TRACK, arch.Marker("After the crash"))
+            published.append(show.m.first_time)
+
+        with mock.patch.object(show.gpm, "runAll", side_effect=run_all):
+            show.start()
+        assert published == [first_wall_ns / 1e9]
+        assert show.m.first_time == first_wall_ns / 1e9
+        assert scheduler.flush(2) == 0
+        labels = [next(q.listen(block=False)).label for _ in range(2)]
+        assert labels == ["Before the crash", "After the crash"]
+        show.m.terminate()
+        show.journal.close()
+        scheduler.stop()
+        assert Journal(c.journal_path("fnt-192")).recover().first_wall_ns == (
+            first_wall_ns
+        )
+
+
+class TestGelo:
+    def test_shutdown_delivers_delayed_markers(self, tmp_path):
+        gelo = Gelo()
+        gelo.start(make_config(tmp_path, "fnt-192", broadcast_delay=60.0))
+        m = gelo.m
+        q = m.subscribe([arch.MarkerType.TRACK], "Delayed", delayed=True)
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Pending"))
+        start = monotonic()
+        gelo.shutdown()
+        gelo.finish()
+        assert monotonic() - start < 2.0
+        assert next(q.listen(block=False)).label == "Pending"
+
+    def test_shutdown_before_start(self):
+        gelo = Gelo()
+        gelo.shutdown()
+        gelo.finish()
+        assert gelo.deadline is not None
@@ -0,0 +1,332 @@
+import pytest
+from threading import Barrier, Thread
+from time import monotonic
+from unittest import mock
+from gelo import arch, mediator
+from gelo.clock import MarkerClock
+from gelo.conf import InvalidConfigurationError
+from gelo.metrics import LatencyHistogram
+
+
+def listen_one(q, timeout=1):
+    return next(q.listen(timeout=timeout))
+
+
+class TestMediator:
+    def test_fan_out_by_type(self):
+        m = mediator.Mediator(0.0)
+        tracks = m.subscribe([arch.MarkerType.TRACK], "Tracks")
+        both = m.subscribe([arch.MarkerType.TRACK, arch.MarkerType.TOPIC], "Both")
+        m.publish(arch.MarkerType.TOPIC, arch.Marker("A topic"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("A track"))
+        assert listen_one(both).label == "A topic"
+        assert listen_one(both).label == "A track"
+        assert listen_one(tracks).label == "A track"
+        assert tracks.empty()
+        m.terminate()
+
+    def test_subscribe_swaps_snapshot(self):
+        m = mediator.Mediator(0.0)
+        before = m.instant_channels
+        m.subscribe([arch.MarkerType.TRACK], "First")
+        assert arch.MarkerType.TRACK not in before
+        assert len(m.instant_channels[arch.MarkerType.TRACK]) == 1
+        with pytest.raises(TypeError):
+            m.instant_channels[arch.MarkerType.TOPIC] = ()
+        m.terminate()
+
+    def test_unsubscribe_closes_queue(self):
+        m = mediator.Mediator(0.0)
+        q = m.subscribe([arch.MarkerType.TRACK], "Leaving")
+        m.unsubscribe("Leaving")
+        assert arch.MarkerType.TRACK not in m.instant_channels
+        with pytest.raises(mediator.UnsubscribeException):
+            listen_one(q)
+        m.terminate()
+
+    def test_backpressure_policies(self):
+        m = mediator.Mediator(0.0, ring_size=3)
+        m.QUEUE_MAX = 3
+        P = arch.BackpressurePolicy
+        queues = {
+            p: m.subscribe([arch.MarkerType.TRACK], p.name, policy=p, block_timeout=0)
+            for p in P
+        }
+        for i in range(5):
+            m.publish(arch.MarkerType.TRACK, arch.Marker(str(i)))
+
+        def labels(q):
+            return [marker.label for marker in q.listen(block=False)]
+
+        assert labels(queues[P.DROP_OLDEST]) == ["2", "3", "4"]
+        assert labels(queues[P.DROP_NEWEST]) == ["0", "1", "2"]
+        assert labels(queues[P.COALESCE]) == ["4"]
+        assert labels(queues[P.BLOCK]) == ["0", "1", "2"]
+        assert m.drop_counts() == {
+            "DROP_OLDEST": 2,
+            "DROP_NEWEST": 2,
+            "COALESCE": 4,
+            "BLOCK": 2,
+        }
+        m.terminate()
+
+    def test_block_never_waits_on_the_scheduler(self):
+        m = mediator.Mediator(0.0)
+        m.QUEUE_MAX = 1
+        q = m.subscribe(
+            [arch.MarkerType.TRACK],
+            "Labels",
+            delayed=True,
+            policy=arch.BackpressurePolicy.BLOCK,
+            block_timeout=10,
+        )
+        for i in range(3):
+            m.publish(arch.MarkerType.TRACK, arch.Marker(str(i)))
+        start = monotonic()
+        assert m.scheduler.flush(5) == 0
+        assert monotonic() - start < 5
+        assert [mk.label for mk in q.listen(block=False)] == ["0"]
+        assert m.metrics()["subscribers"]["Labels"]["unblocked"] == 2
+        m.terminate()
+
+    def test_terminate_when_full(self):
+        m = mediator.Mediator(0.0)
+        m.QUEUE_MAX = 1
+        q = m.subscribe(
+            [arch.MarkerType.TRACK], "Full", policy=arch.BackpressurePolicy.DROP_NEWEST
+        )
+        m.publish(arch.MarkerType.TRACK, arch.Marker("stuck"))
+        m.terminate()
+        with pytest.raises(mediator.UnsubscribeException):
+            listen_one(q)
+
+    def test_latest_value_channel(self):
+        m = mediator.Mediator(0.0)
+        ch = m.subscribe(
+            [arch.MarkerType.TRACK],
+            "NowPlaying",
+            policy=arch.BackpressurePolicy.COALESCE,
+        )
+        assert isinstance(ch, mediator.LatestValueChannel)
+        assert list(ch.listen(timeout=0.01)) == []
+        for i in range(50):
+            m.publish(arch.MarkerType.TRACK, arch.Marker(str(i)))
+        assert [marker.label for marker in ch.listen(block=False)] == ["49"]
+        m.publish(arch.MarkerType.TRACK, arch.Marker("last"))
+        m.terminate()
+        listener = ch.listen()
+        assert next(listener).label == "last"
+        with pytest.raises(mediator.UnsubscribeException):
+            next(listener)
+
+    def test_publish_many(self):
+        m = mediator.Mediator(0.0)
+        tracks = m.subscribe([arch.MarkerType.TRACK], "Tracks")
+        both = m.subscribe([arch.MarkerType.TRACK, arch.MarkerType.TOPIC], "Both")
+        m.publish_many(
+            [
+                (arch.MarkerType.TRACK, arch.Marker("one")),
+                (arch.MarkerType.TOPIC, arch.Marker("two")),
+                (arch.MarkerType.TRACK, arch.Marker("three")),
+            ]
+        )
+        batch = next(both.listen_batch(timeout=1))
+        assert [mk.label for mk in batch] == ["one", "two", "three"]
+        assert len({mk.time_ns for mk in batch}) == 1
+        assert [mk.label for mk in next(tracks.listen_batch(timeout=1))] == [
+            "one",
+            "three",
+        ]
+        assert m.metrics()["subscribers"]["Both"]["enqueued"] == 3
+        m.terminate()
+        with pytest.raises(mediator.UnsubscribeException):
+            next(both.listen_batch(timeout=1))
+
+    def test_ring_catch_up(self):
+        m = mediator.Mediator(0.0, ring_size=4)
+        for i in range(6):
+            m.publish(arch.MarkerType.TRACK, arch.Marker(str(i)))
+        m.publish(arch.MarkerType.TOPIC, arch.Marker("topic"))
+        late = m.subscribe([arch.MarkerType.TRACK], "Late", since=0)
+        assert isinstance(late, mediator.RingCursor)
+        assert [mk.label for mk in next(late.listen_batch(timeout=1))] == [
+            "3",
+            "4",
+            "5",
+        ]
+        assert m.drop_counts()["Late"] == 3
+        new = m.subscribe([arch.MarkerType.TRACK], "New")
+        assert list(new.listen(block=False)) == []
+
+        m.unsubscribe("Late")
+        m.publish(arch.MarkerType.TRACK, arch.Marker("missed"))
+        again = m.subscribe([arch.MarkerType.TRACK], "Late")
+        assert listen_one(again).label == "missed"
+        assert listen_one(new).label == "missed"
+        assert m.instant_ring.entries.count(None) == 0
+        assert len(m.instant_ring.entries) == 4
+        m.terminate()
+        with pytest.raises(mediator.UnsubscribeException):
+            listen_one(again)
+
+    def test_ring_cursor_is_only_handed_wanted_markers(self):
+        m = mediator.Mediator(0.0)
+        q = m.subscribe(
+            [arch.MarkerType.TRACK],
+            "Artists",
+            marker_filter=arch.MarkerFilter(require_artist=True),
+        )
+        for i in range(3):
+            m.publish(arch.MarkerType.TOPIC, arch.Marker("topic %d" % i))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("No artist"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("A - B", "A", "B"))
+        assert list(q.wanted) == [4]
+        assert q.qsize() == 1
+        artists = m.metrics()["subscribers"]["Artists"]
+        assert artists["depth"] == 1
+        assert artists["high_water"] == 1
+        assert artists["filtered"] == 1
+        assert listen_one(q).label == "A - B"
+        m.terminate()
+
+    def test_priority_lanes(self):
+        m = mediator.Mediator(0.0, lanes=[arch.MarkerType.TRACK])
+        both = m.subscribe([arch.MarkerType.TRACK, arch.MarkerType.TOPIC], "Both")
+        for i in range(3):
+            m.publish(arch.MarkerType.TOPIC, arch.Marker("topic %d" % i))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("track"))
+        assert listen_one(both).label == "track"
+        assert both.qsize() == 3
+        assert [mk.label for mk in next(both.listen_batch(timeout=1))] == [
+            "topic 0",
+            "topic 1",
+            "topic 2",
+        ]
+        lanes = m.metrics()["lanes"]
+        assert lanes["TRACK"]["count"] == 1
+        assert lanes["TOPIC"]["count"] == 3
+        m.terminate()
+
+    def test_put_many_policies(self):
+        oldest = mediator.ListenableQueue(3)
+        assert oldest.put_many(list(range(5))) == 2
+        assert oldest.get_all(block=False) == [2, 3, 4]
+        newest = mediator.ListenableQueue(3)
+        newest.put(0)
+        assert newest.put_many([1, 2, 3], drop_oldest=False) == 1
+        assert newest.get_all(block=False) == [0, 1, 2]
+        newest.put_many([3, None])
+        assert newest.get_all(block=False) == [3]
+        assert newest.get_all(block=False) == [None]
+
+    def test_filtered_subscription(self):
+        m = mediator.Mediator(0.0)
+        artists = m.subscribe(
+            [arch.MarkerType.TRACK],
+            "Artists",
+            marker_filter=arch.MarkerFilter(require_artist=True, label_pattern="^A"),
+        )
+        spaced = m.subscribe(
+            [arch.MarkerType.TRACK],
+            "Spaced",
+            marker_filter=arch.MarkerFilter(min_interval=60),
+        )
+        m.publish(arch.MarkerType.TRACK, arch.Marker("A - B", "A", "B"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("A topic"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("C - D", "C", "D"))
+        assert [mk.label for mk in artists.listen(block=False)] == ["A - B"]
+        assert [mk.label for mk in spaced.listen(block=False)] == ["A - B"]
+        subscribers = m.metrics()["subscribers"]
+        assert subscribers["Artists"]["filtered"] == 2
+        assert subscribers["Spaced"]["filtered"] == 2
+        m.terminate()
+
+    def test_filter_from_config(self):
+        assert arch.MarkerFilter.from_config({}) is None
+        f = arch.MarkerFilter.from_config({"filter": {"has_special": True}})
+        special = arch.Marker("A - B", special="Bit Perfectly")
+        assert f.accepts(special, 0)
+        assert not f.accepts(arch.Marker("A - B"), 0)
+        with pytest.raises(InvalidConfigurationError):
+            arch.MarkerFilter.from_config({"filter": {"label_pattern": "("}})
+        with pytest.raises(InvalidConfigurationError):
+            arch.MarkerFilter.from_config({"filter": {"min_interval": -1}})
+
+    def test_filter_without_label(self):
+        f = arch.MarkerFilter(label_pattern=".")
+        assert not f.accepts(arch.Marker(), 0)
+
+    def test_filter_spacing_across_threads(self):
+        f = arch.MarkerFilter(min_interval=60)
+        barrier = Barrier(8)
+        accepted = []
+
+        def publish():
+            barrier.wait()
+            accepted.append(f.accepts(arch.Marker("A - B"), 0))
+
+        threads = [Thread(target=publish) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(accepted) == [False] * 7 + [True]
+
+    def test_metrics(self):
+        m = mediator.Mediator(0.0)
+        q = m.subscribe([arch.MarkerType.TRACK], "Measured")
+        m.subscribe([arch.MarkerType.TRACK], "Lagging")
+        for i in range(3):
+            m.publish(arch.MarkerType.TRACK, arch.Marker(str(i)))
+        assert len(list(q.listen(block=False))) == 3
+        metrics = m.metrics()
+        measured = metrics["subscribers"]["Measured"]
+        lagging = metrics["subscribers"]["Lagging"]
+        assert measured["enqueued"] == 3
+        assert measured["dequeued"] == 3
+        assert measured["depth"] == 0
+        assert measured["delivery_latency"]["count"] == 3
+        assert lagging["dequeued"] == 0
+        assert lagging["depth"] == 3
+        assert lagging["high_water"] == 3
+        assert metrics["instant"]["count"] == 3
+        m.terminate()
+
+    def test_monotonic_marker_times(self):
+        clock = MarkerClock()
+        start = clock.mono_anchor_ns
+        readings = [start + 1000, start + 2_500_001_000, start + 3_000_001_000]
+        m = mediator.Mediator(0.0, clock=clock)
+        q = m.subscribe([arch.MarkerType.TRACK], "Timed")
+        # The wall clock going backwards mid-show doesn't matter, since only
+        # the monotonic clock is read once the MarkerClock exists.
+        with (
+            mock.patch.object(clock, "now_ns", side_effect=readings),
+            mock.patch("gelo.clock.time_ns", return_value=0),
+        ):
+            m.publish(arch.MarkerType.TRACK, arch.Marker("first"))
+            m.publish(arch.MarkerType.TRACK, arch.Marker("second"))
+            first, second = q.listen(block=False)
+            assert first.time_ns == 0
+            assert second.time_ns == 2_500_000_000
+            assert second.time == 2.5
+            # Moving the time base back by a minute adds a minute to marker
+            # times.
+            m.first_time -= 60
+            m.publish(arch.MarkerType.TRACK, arch.Marker("third"))
+        # Give or take the float seconds first_time is set in.
+        assert abs(next(q.listen(block=False)).time_ns - 63_000_000_000) < 1000
+        m.terminate()
+
+
+class TestLatencyHistogram:
+    def test_percentiles_within_precision(self):
+        h = LatencyHistogram()
+        for v in range(1, 10001):
+            h.record(v * 1000)
+        assert h.count == 10000
+        assert h.min == 1000
+        assert h.max == 10000000
+        for p in [50, 90, 99]:
+            exact = p * 100000
+            assert abs(h.percentile(p) - exact) / exact < 0.04
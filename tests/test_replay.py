@@ -0,0 +1,113 @@
+import os
+import argparse
+import responses
+from unittest import mock
+from gelo import arch, conf, journal, mediator, replay
+from gelo.plugins import AudacityLabels
+
+LABELS = os.path.join(os.path.dirname(__file__), "..", "testdata", "audacitylabels.csv")
+
+
+class TestReplay:
+    def test_read_audacity_labels(self):
+        markers = replay.read_session(LABELS)
+        assert all(t is arch.MarkerType.TRACK for t, _ in markers)
+        first = markers[0][1]
+        assert first.label == "ABBA - Money Money Money"
+        assert first.artist == "ABBA"
+        assert first.title == "Money Money Money"
+        assert first.time_ns == 100_000_000
+
+    def test_read_labels_audacitylabels_wrote(self, tmp_path):
+        m = mediator.Mediator(0.0)
+        config = {"path": str(tmp_path / "{show}-{count}.txt"), "delayed": False}
+        al = AudacityLabels.AudacityLabels(config, m, "fnt-200")
+        al.start()
+        m.publish(arch.MarkerType.TRACK, arch.Marker(artist="Justice", title="Fire"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("Intermission"))
+        m.terminate()
+        al.join(5)
+        markers = replay.read_session(al.filename)
+        assert [(mk.label, mk.artist, mk.title) for _, mk in markers] == [
+            ("Justice — Fire", "Justice", "Fire"),
+            ("Intermission", None, None),
+        ]
+
+    def test_read_journal(self, tmp_path):
+        path = str(tmp_path / "show.journal")
+        j = journal.Journal(path)
+        j.recover()
+        m = mediator.Mediator(0.0, journal=j)
+        m.publish(arch.MarkerType.TOPIC, arch.Marker("A topic"))
+        m.publish(arch.MarkerType.TRACK, arch.Marker("A - B", "A", "B"))
+        m.terminate()
+        j.close()
+        markers = replay.read_session(path)
+        assert [(t, mk.label) for t, mk in markers] == [
+            (arch.MarkerType.TOPIC, "A topic"),
+            (arch.MarkerType.TRACK, "A - B"),
+        ]
+
+    def test_max_speed_keeps_recorded_times(self):
+        markers = replay.read_audacity_labels(LABELS)
+        clock = replay.ReplayClock()
+        m = mediator.Mediator(0.0, clock=clock)
+        q = m.subscribe([arch.MarkerType.TRACK], "Delayed", True)
+        replay.Replayer(m, clock, markers, speed=None).run()
+        replayed = [next(q.listen(block=False)) for _ in markers]
+        m.terminate()
+        assert [mk.time_ns for mk in replayed] == [mk.time_ns for _, mk in markers]
+
+    def test_max_speed_publishes_runs_together(self, tmp_path):
+        path = str(tmp_path / "show.journal")
+        j = journal.Journal(path)
+        j.recover()
+        m = mediator.Mediator(0.0, journal=j)
+        m.publish(arch.MarkerType.TOPIC, arch.Marker("A topic"))
+        m.publish_many(
+            [
+                (arch.MarkerType.TRACK, arch.Marker("A - B", "A", "B")),
+                (arch.MarkerType.TOPIC, arch.Marker("Another topic")),
+            ]
+        )
+        m.terminate()
+        j.close()
+        markers = replay.read_session(path)
+
+        clock = replay.ReplayClock()
+        m = mediator.Mediator(0.0, clock=clock)
+        q = m.subscribe([arch.MarkerType.TRACK, arch.MarkerType.TOPIC], "All", True)
+        with mock.patch.object(m, "publish_many", wraps=m.publish_many) as many:
+            replay.Replayer(m, clock, markers, speed=None).run()
+        many.assert_called_once_with(markers[1:])
+        replayed = [next(q.listen(block=False)) for _ in markers]
+        m.terminate()
+        assert [mk.label for mk in replayed] == ["A topic", "A - B", "Another topic"]
+        assert [mk.time_ns for mk in replayed] == [mk.time_ns for _, mk in markers]
+        assert replayed[1].time_ns == replayed[2].time_ns
+
+    @responses.activate
+    def test_main_waits_for_extra_delays(self, tmp_path):
+        webhook = responses.post("https://example.com/api/np")
+        config_file = {
+            "core": {
+                "log_file": str(tmp_path / "gelo.log"),
+                "macro_file": str(tmp_path / "macros.ini"),
+                "broadcast_delay": 0.0,
+            },
+            "plugin:HttpPusher": {
+                "delayed": False,
+                "webhooks": {
+                    "example": {
+                        "url": "https://example.com/api/np",
+                        "method": "POST",
+                        "marker_param": "marker",
+                        "extra_delay": 3600.0,
+                    }
+                },
+            },
+        }
+        args = argparse.Namespace(show="replay", user_plugin_dir="", verbose=0)
+        configuration = conf.Configuration(config_file, args)
+        replay.main(configuration, LABELS, None, False)
+        assert webhook.call_count == len(replay.read_session(LABELS))
@@ -0,0 +1,92 @@
+import threading
+from time import monotonic, sleep
+from gelo.scheduler import TICK_SECS, Scheduler, on_tick
+
+
+class TestScheduler:
+    def test_runs_in_deadline_order(self):
+        s = Scheduler()
+        ran = []
+        done = threading.Event()
+        s.schedule(0.06, ran.append, "c")
+        s.schedule(0.02, ran.append, "a")
+        s.schedule(0.04, ran.append, "b")
+        s.schedule(0.08, done.set)
+        assert done.wait(1)
+        assert ran == ["a", "b", "c"]
+        assert s.run_count == 4
+        assert s.max_lateness >= 0
+        s.stop()
+
+    def test_cancel(self):
+        s = Scheduler()
+        ran = []
+        t = s.schedule(0.02, ran.append, "cancelled")
+        assert s.cancel(t)
+        assert not s.cancel(t)
+        sleep(0.05)
+        assert ran == []
+        assert s.pending() == 0
+        s.stop()
+
+    def test_constant_thread_count(self):
+        s = Scheduler()
+        before = threading.active_count()
+        tasks = [s.schedule(10, lambda: None) for _ in range(200)]
+        assert threading.active_count() == before + 1
+        assert tasks[-1].lateness is None
+        s.stop()
+
+    def test_flush(self):
+        s = Scheduler()
+        ran = []
+        s.schedule(60, ran.append, "late")
+        s.schedule(30, ran.append, "early")
+        assert s.flush(1) == 0
+        assert ran == ["early", "late"]
+        s.schedule(60, ran.append, "after")
+        assert s.flush(1) == 0
+        assert ran[-1] == "after"
+        s.stop()
+
+    def test_periodic(self):
+        s = Scheduler()
+        runs = []
+        slow = threading.Event()
+
+        def run():
+            runs.append(monotonic())
+            if len(runs) == 3:
+                # Overrun the next two runs.
+                slow.set()
+                sleep(0.25)
+            return len(runs) != 5
+
+        task = s.schedule_every(0.1, run, first_delay=0)
+        other = s.schedule_every(0.1, lambda: None, first_delay=0.01)
+        assert slow.wait(1)
+        sleep(0.5)
+        # Runs are due on whole periods after the first, whatever happened,
+        # and on the ticks that every periodic task shares.
+        assert all(abs(t - runs[0] - round(t - runs[0], 1)) < 0.04 for t in runs)
+        assert task.overruns >= 3
+        assert on_tick(1.001) == on_tick(1.049) == 1.05
+        assert (
+            abs(task.next.when / TICK_SECS - round(task.next.when / TICK_SECS)) < 1e-6
+        )
+        assert s.pending() == 0
+
+        s.set_period(task, 10)
+        count = len(runs)
+        sleep(0.3)
+        assert len(runs) == count
+        s.set_period(task, 0.05)
+        sleep(0.1)
+        assert len(runs) > count
+        assert s.cancel(task)
+        count = len(runs)
+        sleep(0.15)
+        assert len(runs) == count
+        assert s.flush(1) == 0
+        assert other.next.cancelled
+        s.stop()
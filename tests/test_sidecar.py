@@ -0,0 +1,47 @@
+import os
+import threading
+from gelo import sidecar
+from gelo.scheduler import shared_scheduler
+
+
+class TestSidecarFile:
+    def test_reads_only_when_changed(self, tmp_path):
+        path = tmp_path / "prefix.txt"
+        changes = []
+        prefix = sidecar.SidecarFile(str(path), sidecar.parse_prefix, changes.append)
+        assert prefix.value is None
+        assert not prefix.refresh()
+
+        path.write_text("(intro) next up\nignored (line)\n")
+        assert prefix.refresh()
+        assert prefix.value == "intro"
+        with open(path, "a") as f:
+            f.write("still the same first line\n")
+        assert not prefix.refresh()
+
+        path.write_text("(outro)\n")
+        # Make sure the change shows even on a coarse filesystem clock.
+        os.utime(path, ns=(0, 0))
+        assert prefix.refresh()
+        path.unlink()
+        assert prefix.refresh()
+        assert changes == ["intro", "outro", None]
+
+    def test_watched_on_the_shared_scheduler(self, tmp_path):
+        path = tmp_path / "prefix.txt"
+        changed = threading.Event()
+        prefix = sidecar.SidecarFile(
+            str(path), sidecar.parse_prefix, lambda _: changed.set()
+        )
+        sidecar.watch(prefix)
+        task = sidecar._task
+        try:
+            assert sidecar._scheduler is shared_scheduler()
+            path.write_text("(live)\n")
+            assert changed.wait(5)
+            assert prefix.value == "live"
+        finally:
+            sidecar.unwatch(prefix)
+        # Nothing is left to check, so the scheduler needn't wake for it.
+        assert task.cancelled
+        assert sidecar._task is None